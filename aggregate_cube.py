@@ -0,0 +1,280 @@
+"""
+Materialized aggregate cube of a dataset.
+
+Built at ingest (and rebuilt whenever the snapshot changes) and stored as
+JSON next to the Parquet snapshot (`<snapshot>.cube.json`), so the dashboard
+metrics/charts and simple lookups are answered without reading any rows:
+
+    {"snapshot": {"mtime", "size"}, "num_rows",
+     "numeric":  {col: {"sum", "mean", "count"}},
+     "distinct": {col: distinct values} for the person/project/dashboard columns,
+     "dimensions": {
+        "person" | "project" | "billable" | "week" | "month" | "category": {
+            "column": source column, "folded": True if groups were folded into "Other",
+            "groups": {value: {"rows", "sums": {numeric col: sum},
+                               "distinct": {person/project col: distinct values}}}}}}
+
+Project groups use cleaned names (billable suffix removed); weeks are keyed
+by their Monday ("2024-03-04"), months as "2024-03". "category" is the
+dashboard's chart column (see chart_column), limited to its
+CUBE_MAX_CATEGORY_GROUPS largest groups with the rest summed into "Other";
+a folded dimension only feeds charts, never exact per-group answers.
+"""
+import json
+import os
+import threading
+
+import pandas as pd
+
+from app_config import CUBE_MAX_CATEGORY_GROUPS
+
+CUBE_VERSION = 3
+OTHER = "Other"
+
+_cubes = {}  # snapshot path -> cube (the file's stamp is checked on every read)
+_cubes_lock = threading.Lock()
+
+
+def get_cube_path(snapshot_path: str) -> str:
+    return snapshot_path + ".cube.json"
+
+def _stamp(snapshot_path: str) -> dict:
+    stat = os.stat(snapshot_path)
+    return {"mtime": stat.st_mtime, "size": stat.st_size}
+
+def _clean(value):
+    """JSON-safe scalar (numpy numbers -> Python, NaN -> None)."""
+    if pd.isna(value):
+        return None
+    return value.item() if hasattr(value, "item") else value
+
+
+def chart_column(schema: dict):
+    """
+    Column the dashboard charts by: the project column, else the person column
+    (the processor's key-column roles), else the first text column.
+    """
+    from processor import detect_key_columns
+    from intent_rules import find_person_column
+
+    columns, text = schema["columns"], schema["text"]
+    col_map = detect_key_columns(columns)
+    for candidate in ('project' if 'project' in columns else col_map["project"], find_person_column(columns)):
+        if candidate in text:
+            return candidate
+    return text[0] if text else None
+
+def _cube_columns(schema: dict) -> list:
+    """Columns the cube is computed from (everything else is never read)."""
+    from processor import is_date_column
+    from intent_rules import find_person_column
+
+    columns = schema["columns"]
+    needed = set(schema["numeric"])
+    needed.update(c for c in columns if 'billable' in c or c == 'project' or is_date_column(c))
+    person = find_person_column(columns)
+    if person:
+        needed.add(person)
+    if chart_column(schema):
+        needed.add(chart_column(schema))
+    return [c for c in columns if c in needed]
+
+def _fold_groups(groups: dict, limit: int) -> dict:
+    """The `limit` largest groups (by rows) plus one "Other" group summing the rest."""
+    ranked = sorted(groups, key=lambda k: groups[k]["rows"], reverse=True)
+    kept = {k: groups[k] for k in ranked[:limit] if k != OTHER}
+    rest = [groups[k] for k in groups if k not in kept]
+    sums = {}
+    for group in rest:
+        for col, value in group["sums"].items():
+            if value is not None:
+                sums[col] = sums.get(col, 0.0) + value
+    # Distinct counts cannot be added up across groups
+    kept[OTHER] = {"rows": sum(g["rows"] for g in rest), "sums": sums, "distinct": {}}
+    return kept
+
+def build_cube(snapshot_path: str) -> dict:
+    """Compute the cube from the snapshot and write it next to it. Returns the cube."""
+    from dataset_store import read_snapshot, snapshot_schema
+    from dataset_views import DatasetView
+
+    stamp = _stamp(snapshot_path)
+    schema = snapshot_schema(snapshot_path)
+    view = DatasetView(read_snapshot(snapshot_path, columns=_cube_columns(schema)))
+    df = view.df
+    numeric = [c for c in schema["numeric"] if c in df.columns]
+
+    person_col = view.aliases.get("user")
+    project_col = 'project' if 'project' in df.columns else None
+    distinct_cols = [c for c in (person_col, project_col) if c]
+    category_col = chart_column(schema)
+
+    # Dimension name -> (source column, group keys)
+    keys = {}
+    if person_col:
+        keys["person"] = (person_col, df[person_col])
+    if project_col:
+        keys["project"] = (project_col, view.project_clean if view.billable_format == 'embedded' else df[project_col])
+    if view.billable is not None:
+        keys["billable"] = ("billable", view.billable)
+    if view.date_column:
+        dates = view.dates(view.date_column)
+        keys["week"] = (view.date_column, (dates - pd.to_timedelta(dates.dt.weekday, unit="D")).dt.strftime("%Y-%m-%d"))
+        keys["month"] = (view.date_column, dates.dt.strftime("%Y-%m"))
+    if category_col:
+        keys["category"] = keys["project"] if category_col == project_col else (category_col, df[category_col])
+
+    # Distinct counts over the same values the lookups report (cleaned project names)
+    distinct_values = {c: (keys["project"][1] if c == project_col else df[c]) for c in distinct_cols}
+    frame = pd.DataFrame({**{f"sum:{c}": pd.to_numeric(df[c], errors="coerce") for c in numeric},
+                          **{f"distinct:{c}": v for c, v in distinct_values.items()}})
+
+    dimensions = {}
+    for name, (column, key) in keys.items():
+        grouped = frame.groupby(key.astype(str).to_numpy(), sort=False)
+        rows = grouped.size()
+        sums = grouped[[f"sum:{c}" for c in numeric]].sum() if numeric else None
+        distinct = grouped[[f"distinct:{c}" for c in distinct_cols]].nunique() if distinct_cols else None
+        groups = {}
+        for value, count in rows.items():
+            if value in ("nan", "NaT", "None"):
+                continue
+            groups[str(value)] = {
+                "rows": int(count),
+                "sums": {c: _clean(sums.at[value, f"sum:{c}"]) for c in numeric} if sums is not None else {},
+                "distinct": {c: int(distinct.at[value, f"distinct:{c}"]) for c in distinct_cols} if distinct is not None else {},
+            }
+        dimensions[name] = {"column": column, "groups": groups}
+        if name == "category" and len(groups) > CUBE_MAX_CATEGORY_GROUPS:
+            dimensions[name] = {"column": column, "groups": _fold_groups(groups, CUBE_MAX_CATEGORY_GROUPS),
+                                "folded": True}
+
+    cube = {
+        "version": CUBE_VERSION,
+        "snapshot": stamp,
+        "num_rows": len(df),
+        "numeric": {c: {"sum": _clean(frame[f"sum:{c}"].sum()), "mean": _clean(frame[f"sum:{c}"].mean()),
+                        "count": int(frame[f"sum:{c}"].count())} for c in numeric},
+        "distinct": {c: int(v.nunique()) for c, v in distinct_values.items()},
+        "dimensions": dimensions,
+    }
+    if category_col and category_col not in cube["distinct"]:
+        cube["distinct"][category_col] = int(df[category_col].nunique())
+
+    cube_path = get_cube_path(snapshot_path)
+    with open(cube_path + ".tmp", "w") as f:
+        json.dump(cube, f)
+    os.replace(cube_path + ".tmp", cube_path)
+    with _cubes_lock:
+        _cubes[snapshot_path] = cube
+    print(f"🧊 Built aggregate cube for {os.path.basename(snapshot_path)} "
+          f"({len(df):,} rows, {sum(len(d['groups']) for d in dimensions.values()):,} groups)")
+    return cube
+
+def get_cube(snapshot_path: str) -> dict:
+    """
+    The cube of a snapshot: from memory, else from its JSON file, rebuilt when
+    missing or older than the snapshot (re-ingested or appended datasets).
+    """
+    if not snapshot_path or not os.path.exists(snapshot_path) or not snapshot_path.endswith(".parquet"):
+        return None
+    stamp = _stamp(snapshot_path)
+    with _cubes_lock:
+        cube = _cubes.get(snapshot_path)
+    if cube is not None and cube["snapshot"] == stamp:
+        return cube
+
+    cube_path = get_cube_path(snapshot_path)
+    if os.path.exists(cube_path):
+        try:
+            with open(cube_path) as f:
+                cube = json.load(f)
+            if cube.get("version") == CUBE_VERSION and cube.get("snapshot") == stamp:
+                with _cubes_lock:
+                    _cubes[snapshot_path] = cube
+                return cube
+        except Exception as e:
+            print(f"Warning: unreadable aggregate cube {cube_path}: {e}")
+    return build_cube(snapshot_path)
+
+def remove_cube(snapshot_path: str):
+    """Delete a snapshot's cube (call when the dataset is deleted)."""
+    with _cubes_lock:
+        _cubes.pop(snapshot_path, None)
+    cube_path = get_cube_path(snapshot_path)
+    if os.path.exists(cube_path):
+        os.remove(cube_path)
+
+
+def dimension_series(cube: dict, dimension: str, value: str = "rows") -> pd.Series:
+    """
+    One measure per group of a dimension as a Series: "rows", a numeric
+    column (its sum) or "distinct:<col>".
+    """
+    groups = (cube.get("dimensions", {}).get(dimension) or {}).get("groups", {})
+    if value == "rows":
+        data = {k: g["rows"] for k, g in groups.items()}
+    elif value.startswith("distinct:"):
+        data = {k: g["distinct"].get(value[len("distinct:"):]) for k, g in groups.items()}
+    else:
+        data = {k: g["sums"].get(value) for k, g in groups.items()}
+    return pd.Series(data, dtype="float64").dropna()
+
+def top_n_series(series: pd.Series, n: int) -> pd.Series:
+    """
+    The `n` largest values of a chart series, largest first, plus one "Other"
+    entry with the sum of the rest (so charts stay small for any cardinality).
+    """
+    series = series.dropna().sort_values(ascending=False)
+    if OTHER in series.index:
+        other = series[OTHER]
+        series = series.drop(OTHER)
+    else:
+        other = 0
+    top, rest = series.iloc[:n], series.iloc[n:]
+    other += rest.sum()
+    if other:
+        top = pd.concat([top, pd.Series({OTHER: other})])
+    return top
+
+def answer_from_cube(cube: dict, intent: dict):
+    """
+    Answer a lookup intent (count / sum, unfiltered or filtered by billable
+    status) from the cube in the same words as execute_dataframe_query.
+    Returns None when the cube cannot answer it exactly.
+    """
+    if not cube:
+        return None
+    target = intent.get("target_column")
+    operation = intent.get("operation", "list")
+    filters = intent.get("filters") or {}
+    if not target or operation not in ("count", "sum") or set(k.lower() for k in filters) - {"billable"}:
+        return None
+
+    group = None
+    if filters:
+        billable = (cube["dimensions"].get("billable") or {}).get("groups")
+        if billable is None:
+            return None
+        value = str(next(iter(filters.values())))
+        value = {"yes": "Yes", "no": "No", "unknown": "Unknown"}.get(value.lower())
+        group = billable.get(value, {"rows": 0, "sums": {}, "distinct": {}})
+        if group["rows"] == 0:
+            filter_desc = ", ".join([f"{k}={v}" for k, v in filters.items()])
+            return f"No data found matching the filters: {filter_desc}"
+
+    from dataset_views import find_column
+    if operation == "count":
+        column = find_column(list(cube["distinct"]), target)
+        counts = group["distinct"] if group is not None else cube["distinct"]
+        if column is None or column not in counts:
+            return None
+        return f"There are **{counts[column]}** unique {target.replace('_', ' ')}(s) matching your criteria."
+
+    column = find_column(list(cube["numeric"]), target)
+    if column is None:
+        return None
+    total = group["sums"].get(column) if group is not None else cube["numeric"][column]["sum"]
+    if total is None:
+        return None
+    return f"Total {target.replace('_', ' ')}: **{total:.2f}**"
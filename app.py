@@ -1,10 +1,8 @@
 import fix_sqlite # Must be first
 import os
-import json
 import shutil
 import time
 import gc
-import hashlib
 import streamlit as st
 import pandas as pd
 import plotly.express as px
@@ -13,207 +11,40 @@ from streamlit_extras.metric_cards import style_metric_cards
 
 # Importing your logic modules
 from processor import clean_and_serialize
-from rag_engine import get_rag_chain
-from app_config import PERSIST_DIRECTORY, get_dataset_registry
+from intent_rules import classify_intent, load_entity_values
+from query_planner import execute_plan, execute_plan_on_cube
+from aggregate_cube import get_cube, remove_cube, answer_from_cube, dimension_series, chart_column, top_n_series
+from dataset_views import (
+    extract_billable_status, get_dataset_view, evict_dataset_view
+)
+from intent_cache import get_cached_intent, cache_intent, get_intent_cache_stats
+from rag_engine import get_rag_chain, prefetch_context, evict_rag_chain, clear_rag_cache
+from vector_store import get_collection_name, delete_dataset_vectors
+from embeddings import prewarm_embeddings, get_embedding_stats, dataset_embedding_space
+from app_config import (
+    PERSIST_DIRECTORY, MAX_UPLOAD_SIZE_MB, JOB_POLL_SECONDS, INTENT_RULES_MIN_CONFIDENCE, SPECULATIVE_RETRIEVAL,
+    DASHBOARD_TOP_N, RAW_DATA_PAGE_SIZE, get_dataset_registry
+)
+from jobs import submit_ingest_job, list_jobs, has_active_jobs, resume_pending_jobs, clear_finished_jobs
+from dataset_store import (
+    ensure_parquet_snapshot, get_snapshot_path, read_snapshot, read_snapshot_head, snapshot_schema,
+    get_dataframe, evict_dataframe, get_dataframe_cache_stats,
+    filter_mask, get_page, export_filtered_csv, new_export_path, remove_export
+)
 
 # 1. Environment & Security
 load_dotenv()
 api_key = os.getenv("GROQ_API_KEY") 
 
+# Start loading the shared embedding model in the background (no-op after the first run)
+prewarm_embeddings()
+# Pick up ingestion jobs a previous server process did not finish (no-op after the first run)
+resume_pending_jobs()
+
 # ==========================================
 # 🧠 HYBRID QUERY ROUTER LOGIC
 # ==========================================
 
-def extract_billable_status(df):
-    """Smart billable detection - handles multiple formats including 'Project : Billable'"""
-    
-    # Method 1: Dedicated billable column (standard format)
-    # Check for 'billable' or 'is_billable'
-    billable_cols = [c for c in df.columns if 'billable' in c and 'rate' not in c and 'amount' not in c]
-    if billable_cols:
-        col = billable_cols[0]
-        return df[col], 'column'
-    
-    # Method 2: Extract from project name pattern (embedded format)
-    if 'project' in df.columns:
-        # Check first 20 rows for pattern
-        sample = df['project'].head(20).astype(str)
-        if any('billable' in p.lower() for p in sample):
-            def parse_billable(name):
-                name_lower = str(name).lower()
-                if 'non-billable' in name_lower or 'non billable' in name_lower:
-                    return 'No'
-                elif 'billable' in name_lower:
-                    return 'Yes'
-                return 'Unknown'
-            
-            return df['project'].apply(parse_billable), 'embedded'
-    
-    # Method 3: Not found - use RAG
-    return None, 'none'
-
-def clean_project_name(name):
-    """Remove billable suffix from project names if present"""
-    # Example: "Koradream : Fixed Cost : Billable" → "Koradream"
-    name_str = str(name)
-    if ':' in name_str:
-        return name_str.split(':')[0].strip()
-    return name_str
-
-def get_billable_projects(df, billable=True):
-    """Get complete list of billable/non-billable projects"""
-    
-    # Extract billable status
-    status_series, format_type = extract_billable_status(df)
-    
-    if status_series is None:
-        return None  # Fallback to RAG
-    
-    # Filter by status
-    # Note: We normalize to 'Yes'/'No' in extract_billable_status
-    target = 'Yes' if billable else 'No'
-    
-    # Handle specific case for boolean columns if they exist
-    if status_series.dtype == bool:
-        filtered_df = df[status_series == billable]
-    else:
-        # String match
-        filtered_df = df[status_series.astype(str).str.lower() == target.lower()]
-    
-    if len(filtered_df) == 0:
-        return None # Let RAG explain why
-    
-    # Get project names
-    if 'project' not in df.columns:
-        return None
-        
-    if format_type == 'embedded':
-        projects = filtered_df['project'].apply(clean_project_name).unique()
-    else:
-        projects = filtered_df['project'].unique()
-    
-    # Format Response
-    status_text = "Billable" if billable else "Non-Billable"
-    count = len(projects)
-    
-    result = f"### {status_text} Projects ({count})\n\n"
-    # Sort for better readability
-    sorted_projects = sorted([p for p in projects if pd.notna(p)])
-    
-    for p in sorted_projects:
-        result += f"- {p}\n"
-        
-    return result
-
-def get_all_employees(df):
-    """Get complete list of employees"""
-    user_col = None
-    for c in ['user', 'employee', 'name', 'person']:
-        if c in df.columns:
-            user_col = c
-            break
-            
-    if not user_col:
-        return None
-        
-    employees = df[user_col].unique()
-    count = len(employees)
-    
-    result = f"### Employees List ({count})\n\n"
-    sorted_employees = sorted([e for e in employees if pd.notna(e)])
-    
-    for e in sorted_employees:
-        result += f"- {e}\n"
-        
-    return result
-
-def get_employee_count(df, question):
-    """Count employees, optionally by project"""
-    q_lower = question.lower()
-    
-    user_col = None
-    for c in ['user', 'employee', 'name', 'person']:
-        if c in df.columns:
-            user_col = c
-            break
-            
-    if not user_col:
-        return None
-    
-    # If asking about specific project
-    if 'project' in df.columns and any(p.lower() in q_lower for p in df['project'].dropna().unique().astype(str)):
-        # Provide breakdown by project
-        project_counts = df.groupby('project')[user_col].nunique().sort_values(ascending=False)
-        result = "### Employee Count by Project\n\n"
-        for p, count in project_counts.items():
-            clean_p = clean_project_name(p)
-            result += f"- **{clean_p}**: {count} employees\n"
-        return result
-        
-    # Just total count
-    count = df[user_col].nunique()
-    return f"There are **{count}** unique employees in this dataset."
-
-def get_hours_ranking(df, top_n=10):
-    """Get ranking of employees by hours"""
-    
-    # Find duration/hours column
-    duration_col = None
-    for c in ['duration_(decimal)', 'duration_decimal', 'time_(decimal)', 'hours', 'time_decimal']:
-        if c in df.columns:
-            duration_col = c
-            break
-            
-    if not duration_col:
-        return None
-        
-    user_col = None
-    for c in ['user', 'employee', 'name', 'person']:
-        if c in df.columns:
-            user_col = c
-            break
-            
-    if not user_col:
-        return None
-        
-    # Group and sum
-    ranking = df.groupby(user_col)[duration_col].sum().sort_values(ascending=False).head(top_n)
-    
-    result = f"### Top {len(ranking)} Employees by Hours\n\n"
-    for i, (user, hours) in enumerate(ranking.items(), 1):
-        result += f"{i}. **{user}**: {hours:.1f} hours\n"
-        
-    return result
-
-def get_group_breakdown(df):
-    """Breakdown by Group/Department"""
-    if 'group' not in df.columns and 'department' not in df.columns:
-        return None
-        
-    group_col = 'group' if 'group' in df.columns else 'department'
-    
-    # Try to sum hours first
-    duration_col = None
-    for c in ['duration_(decimal)', 'duration_decimal', 'time_(decimal)', 'hours']:
-        if c in df.columns:
-            duration_col = c
-            break
-            
-    if duration_col:
-        breakdown = df.groupby(group_col)[duration_col].sum().sort_values(ascending=False)
-        result = "### Hours by Group\n\n"
-        for g, val in breakdown.items():
-            result += f"- **{g}**: {val:.1f} hours\n"
-    else:
-        # Count users
-        user_col = 'user' if 'user' in df.columns else df.columns[0]
-        breakdown = df.groupby(group_col)[user_col].nunique().sort_values(ascending=False)
-        result = "### Employee Count by Group\n\n"
-        for g, val in breakdown.items():
-            result += f"- **{g}**: {val} employees\n"
-            
-    return result
-
 def get_query_intent_llm(question: str, df: pd.DataFrame, api_key: str) -> dict:
     """
     Universal Intent Classifier: Uses LLM to understand query intent and extract parameters.
@@ -241,13 +72,21 @@ def get_query_intent_llm(question: str, df: pd.DataFrame, api_key: str) -> dict:
         json.dumps(sample_data, indent=2, default=str)[:500] + "\n\n"
         "**Your Task:**\n"
         "Analyze the user's question and determine:\n"
-        '1. **action**: "lookup" (for data retrieval/lists/counts) OR "rag" (for analysis/reasoning/why/how questions)\n'
+        '1. **action**: "lookup" (for data retrieval/lists/counts), "aggregate" (rankings, top-N, per-group totals, date ranges) OR "rag" (for analysis/reasoning/why/how questions)\n'
         '2. **target_column**: Which column to retrieve (e.g., "user", "project", "project_lead")\n'
         '3. **filters**: Dict of column:value pairs to filter by (e.g., {"billable": "Yes", "project": "Kavia AI"})\n'
         '4. **operation**: "list" (unique values), "count" (count unique), or "sum" (sum values)\n\n'
+        "**Aggregate plans** (action \"aggregate\", instead of target_column/operation):\n"
+        '- filters: as above; date_range: {"start": "YYYY-MM-DD", "end": "YYYY-MM-DD"} (inclusive, optional), '
+        'or {"month": 1-12} for a month named without a year (the dataset\'s dates decide the year)\n'
+        '- group_by: column to group by (optional); aggregate: {"func": "sum"|"mean"|"count"|"nunique"|"list", "column": column}\n'
+        '- sort: "desc" or "asc"; limit: number of groups to return (optional)\n'
+        "- Today's date is " + time.strftime("%Y-%m-%d") + " (resolve \"last month\", \"this week\" against it)\n\n"
         "**Classification Rules:**\n"
         '- Use "lookup" for: "how many [TYPE] TOTAL", "list all [TYPE]", "count all [TYPE]", "total hours", "sum of hours" - simple aggregations\n'
-        '- Use "rag" for: questions with specific names, "who", "what", "which", "why", "how to", analysis, comparisons\n\n'
+        '- Use "aggregate" for: "top N [TYPE] by hours", "hours per [project/user/group]", "how many [TYPE] per [group]", anything limited to a date range\n'
+        '- Use "rag" for: questions with specific names, "who", "what", "which", "why", "how to", analysis, comparisons\n'
+        '- Exception: in an "aggregate" plan a specific project/user name may be a filter (e.g. "hours per user on Gigtel project")\n\n'
         "**CRITICAL RULES:**\n"
         '- If question has NO specific project/user name = "lookup" (e.g., "how many projects are billable?")\n'
         '- If question has SPECIFIC project/user name = "rag" (e.g., "how many users in Gigtel project?")\n'
@@ -286,6 +125,14 @@ def get_query_intent_llm(question: str, df: pd.DataFrame, api_key: str) -> dict:
         '→ {"action": "rag"}\n\n'
         'Q: "List users on non-billable projects"\n'
         '→ {"action": "lookup", "target_column": "user", "filters": {"billable": "No"}, "operation": "list"}\n\n'
+        'Q: "Top 5 people by hours on billable work last month"\n'
+        '→ {"action": "aggregate", "filters": {"billable": "Yes"}, "date_range": {"start": "2024-05-01", "end": "2024-05-31"}, '
+        '"group_by": "user", "aggregate": {"func": "sum", "column": "time_(decimal)"}, "sort": "desc", "limit": 5}\n\n'
+        'Q: "How many employees per project?"\n'
+        '→ {"action": "aggregate", "filters": {}, "group_by": "project", "aggregate": {"func": "nunique", "column": "user"}, "sort": "desc"}\n\n'
+        'Q: "Total hours in March 2024"\n'
+        '→ {"action": "aggregate", "filters": {}, "date_range": {"start": "2024-03-01", "end": "2024-03-31"}, '
+        '"aggregate": {"func": "sum", "column": "time_(decimal)"}}\n\n'
         'Q: "Why is the project delayed?"\n'
         '→ {"action": "rag"}\n\n'
         'Q: "Suggest ways to improve productivity"\n'
@@ -321,17 +168,16 @@ def get_query_intent_llm(question: str, df: pd.DataFrame, api_key: str) -> dict:
             return intent
         else:
             print(f"⚠️ LLM returned non-JSON response: {response_text[:200]}")
-            return {"action": "rag"}  # Fallback
+            return {"action": "rag", "fallback": True}  # Fallback (not cached)
     except Exception as e:
         print(f"Intent classification error: {e}")
-        return {"action": "rag"}  # Safe fallback
+        return {"action": "rag", "fallback": True}  # Safe fallback (not cached)
 
-def execute_dataframe_query(df: pd.DataFrame, intent: dict) -> str:
+def execute_dataframe_query(view, intent: dict) -> str:
     """
-    Dynamic DataFrame Executor: Executes structured queries based on LLM intent.
+    Dynamic DataFrame Executor: Executes structured queries based on LLM intent
+    as boolean masks over a prepared DatasetView (no copies).
     """
-    from difflib import get_close_matches
-    
     try:
         target_col = intent.get("target_column")
         filters = intent.get("filters", {})
@@ -340,88 +186,37 @@ def execute_dataframe_query(df: pd.DataFrame, intent: dict) -> str:
         if not target_col:
             return None
         
-        # Normalize DataFrame (add computed columns)
-        billable_status, billable_format = extract_billable_status(df)
-        if billable_status is not None:
-            df = df.copy()
-            df['billable'] = billable_status
-        
-        # Fuzzy match column names
-        def find_column(col_name):
-            col_name_lower = str(col_name).lower()
-            # Direct match (case-insensitive)
-            for c in df.columns:
-                if str(c).lower() == col_name_lower:
-                    return c
-            # Partial match
-            for c in df.columns:
-                if col_name_lower in str(c).lower() or str(c).lower() in col_name_lower:
-                    return c
-            # Fuzzy match
-            matches = get_close_matches(col_name_lower, 
-                                       [str(c).lower() for c in df.columns], 
-                                       n=1, cutoff=0.6)
-            if matches:
-                for c in df.columns:
-                    if str(c).lower() == matches[0]:
-                        return c
-            return None
-        
+        df = view.df
         # Apply filters
-        filtered_df = df.copy()
-        for filter_col, filter_val in filters.items():
-            actual_col = find_column(filter_col)
-            if actual_col is None:
-                print(f"Warning: Could not find column '{filter_col}' in DataFrame")
-                continue
-            
-            print(f"Applying filter: {actual_col} = {filter_val}")
-            
-            # Handle different filter types
-            if isinstance(filter_val, str):
-                # Special handling for billable status (exact match)
-                if filter_col.lower() == 'billable':
-                    # Exact match for Yes/No (case-insensitive)
-                    filtered_df = filtered_df[
-                        filtered_df[actual_col].astype(str).str.lower() == filter_val.lower()
-                    ]
-                else:
-                    # Partial match for project names and other text fields
-                    filtered_df = filtered_df[
-                        filtered_df[actual_col].astype(str).str.contains(
-                            filter_val, case=False, na=False, regex=False
-                        )
-                    ]
-            else:
-                filtered_df = filtered_df[filtered_df[actual_col] == filter_val]
-            
-            print(f"After filter: {len(filtered_df)} rows remaining")
+        mask = view.mask(filters)
+        matched = int(mask.sum())
         
-        if len(filtered_df) == 0:
+        if matched == 0:
             filter_desc = ", ".join([f"{k}={v}" for k, v in filters.items()])
             return f"No data found matching the filters: {filter_desc}"
         
         # Find target column
-        actual_target = find_column(target_col)
+        actual_target = view.column(target_col)
         if actual_target is None:
             return None  # Fallback to RAG
         
+        # Project names are reported without their billable suffix
+        if actual_target == 'project' and view.billable_format == 'embedded':
+            target_values = view.project_clean
+        else:
+            target_values = df[actual_target]
+        
         # Perform operation
         if operation == "count":
-            count = filtered_df[actual_target].nunique()
+            count = target_values[mask].nunique()
             return f"There are **{count}** unique {target_col.replace('_', ' ')}(s) matching your criteria."
         
         elif operation == "sum":
-            total = filtered_df[actual_target].sum()
+            total = pd.to_numeric(df[actual_target][mask], errors="coerce").sum()
             return f"Total {target_col.replace('_', ' ')}: **{total:.2f}**"
         
         else:  # list
-            values = filtered_df[actual_target].unique()
-            # Clean project names if needed
-            if 'project' in str(actual_target).lower() and billable_format == 'embedded':
-                values = [clean_project_name(v) for v in values]
-            
-            values = [v for v in values if pd.notna(v)]
+            values = [v for v in target_values[mask].unique() if pd.notna(v)]
             
             if len(values) == 0:
                 return "No results found."
@@ -433,7 +228,7 @@ def execute_dataframe_query(df: pd.DataFrame, intent: dict) -> str:
             # DEBUG: Show what filters were applied
             if filters:
                 result += f"*Filters applied: {filters}*\n"
-                result += f"*Matched {len(filtered_df)} rows from {len(df)} total*\n\n"
+                result += f"*Matched {matched} rows from {len(df)} total*\n\n"
             
             for v in sorted(values, key=lambda x: str(x).lower()):
                 result += f"- {v}\n"
@@ -446,32 +241,76 @@ def execute_dataframe_query(df: pd.DataFrame, intent: dict) -> str:
         traceback.print_exc()
         return None  # Fallback to RAG
 
-def classify_and_route_query(question, df):
+def classify_and_route_query(question, snapshot_path, dataset_hash=None):
     """
-    Universal Router: Uses LLM to understand intent, then routes appropriately.
+    Universal Router: Classifies intent with local rules first (intent_rules.py)
+    and asks the LLM only when they are not confident, then routes appropriately.
+    Only a small sample is read for classification; lookups run on the cached
+    prepared view of the dataset (dataset_views.py).
     Returns answer string if handled, None if RAG should be used.
     """
-    if df is None or df.empty:
+    if not snapshot_path or not os.path.exists(snapshot_path):
         return None
     
     print(f"🔍 ROUTER CALLED with question: {question}")  # Debug
     
     try:
-        # Use LLM to classify intent
-        intent = get_query_intent_llm(question, df, api_key)
+        sample_df = read_snapshot_head(snapshot_path, 20)
+        if sample_df.empty:
+            return None
+        
+        # Deterministic rules first; the LLM only for questions they cannot explain
+        start = time.perf_counter()
+        try:
+            entities = load_entity_values(snapshot_path, sample_df.columns)
+        except Exception as e:
+            print(f"Entity lookup failed: {e}")
+            entities = {}
+        intent, confidence = classify_intent(question, sample_df, entities)
+        if confidence >= INTENT_RULES_MIN_CONFIDENCE:
+            print(f"⚡ Route: rules -> {intent.get('action')} (confidence {confidence:.2f}, "
+                  f"{(time.perf_counter() - start) * 1000:.1f} ms): {intent}")
+        else:
+            # Same question on the same column layout: reuse the LLM's earlier answer
+            cached = get_cached_intent(question, sample_df.columns)
+            if cached is not None:
+                intent = cached
+                print(f"💾 Route: cache -> {intent.get('action')} "
+                      f"({(time.perf_counter() - start) * 1000:.1f} ms): {intent}")
+            else:
+                intent = get_query_intent_llm(question, sample_df, api_key)
+                print(f"🧠 Route: llm -> {intent.get('action')} (rules confidence {confidence:.2f}, "
+                      f"{(time.perf_counter() - start) * 1000:.0f} ms)")
+                # Plans with resolved dates ("last month") go stale, so they are not cached
+                if not intent.get("fallback") and not intent.get("date_range"):
+                    cache_intent(question, sample_df.columns, intent)
         
         if intent.get("action") == "lookup":
-            # Try to execute as structured query
-            result = execute_dataframe_query(df, intent)
+            # Precomputed totals/distinct counts first, then a structured query on the rows
+            result = answer_from_cube(get_cube(snapshot_path), intent)
+            if result:
+                print("🧊 Answered lookup from cube")
+                return result
+            view = get_dataset_view(snapshot_path, dataset_hash)
+            result = execute_dataframe_query(view, intent)
             if result:
                 return result  # Return clean result without debug marker
+        elif intent.get("action") == "aggregate":
+            # Group-by / top-N / date-range plan, computed exactly on the full dataset
+            result = execute_plan_on_cube(get_cube(snapshot_path), intent)
+            if result:
+                return result
+            view = get_dataset_view(snapshot_path, dataset_hash)
+            result = execute_plan(view, intent)
+            if result:
+                return result
     except Exception as e:
         print(f"Router error: {e}")
         import traceback
         traceback.print_exc()
     
     # Fallback to RAG for analysis or if lookup failed
-    print(f"⚠️ Falling back to RAG")  # Debug
+    print(f"⚠️ Route: rag")  # Debug
     return None
 
 # 2. Page Configuration
@@ -890,10 +729,57 @@ if "active_dataset" not in st.session_state:
 if "chat_histories" not in st.session_state:
     st.session_state.chat_histories = {} # keyed by dataset hash
 
+if "pending_jobs" not in st.session_state:
+    st.session_state.pending_jobs = {} # job id -> upload hash, auto-selected when the job finishes
+
 # Helper to refresh registry
 def refresh_registry():
     st.session_state.registry = get_dataset_registry(st.session_state.username)
 
+def select_dataset_by_hash(dataset_hash):
+    """Activate the registered dataset built from an upload with this hash (appends keep the original hash)."""
+    for d in st.session_state.registry["datasets"]:
+        if d["hash"] == dataset_hash or dataset_hash in d.get("source_hashes", []):
+            st.session_state.active_dataset = d
+            return d
+    return None
+
+def render_ingestion_jobs():
+    """Progress of this user's background ingestion jobs; finished uploads are auto-selected."""
+    jobs = list_jobs(st.session_state.username, limit=5)
+    if not jobs:
+        return
+    st.markdown("### 📋 Ingestion Jobs")
+    for job in jobs:
+        if job["status"] == "running":
+            if job["progress"] is not None:
+                eta = f", ~{job['eta_seconds']:.0f}s left" if job["eta_seconds"] is not None else ""
+                st.progress(job["progress"], text=f"🔄 {job['filename']}: {job['rows_done']:,} rows{eta}")
+            else:
+                st.caption(f"🔄 {job['filename']}: processing... ({job['rows_done']:,} rows)")
+        elif job["status"] == "queued":
+            st.caption(f"⏳ {job['filename']}: queued")
+        elif job["status"] == "done":
+            outcome = {"UPDATED": "existing dataset updated", "EXISTING": "already ingested"}.get(job["result"], "ready")
+            st.caption(f"✅ {job['filename']}: {outcome}")
+        else:
+            st.caption(f"❌ {job['filename']}: {job['error']}")
+
+    finished = [j for j in jobs if j["id"] in st.session_state.pending_jobs and j["status"] in ("done", "failed")]
+    if finished:
+        for job in finished:
+            dataset_hash = st.session_state.pending_jobs.pop(job["id"])
+            if job["status"] == "done":
+                refresh_registry()
+                select_dataset_by_hash(dataset_hash)
+        # Redraw the whole app so the library and main view show the new dataset
+        st.rerun()
+
+# Poll job progress without rerunning the whole page (fragments need Streamlit >= 1.33)
+_fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None)
+if _fragment is not None:
+    render_ingestion_jobs = _fragment(run_every=JOB_POLL_SECONDS)(render_ingestion_jobs)
+
 # 3. Sidebar Controls
 with st.sidebar:
     st.title("💼 Employee AI")
@@ -905,46 +791,37 @@ with st.sidebar:
         help="Upload a new employee spreadsheet to build a dedicated intelligence layer."
     )
     
-    # File size validation
-    MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+    # File size validation (large files are ingested in streaming mode)
+    MAX_FILE_SIZE = MAX_UPLOAD_SIZE_MB * 1024 * 1024
     if uploaded_file and uploaded_file.size > MAX_FILE_SIZE:
-        st.error(f"❌ File too large ({uploaded_file.size / (1024*1024):.1f}MB). Please upload files under 50MB.")
+        st.error(f"❌ File too large ({uploaded_file.size / (1024*1024):.1f}MB). Please upload files under {MAX_UPLOAD_SIZE_MB}MB.")
         uploaded_file = None
     
     if uploaded_file:
         # Check if already processed in this session to avoid loop
         if "last_uploaded" not in st.session_state or st.session_state.last_uploaded != uploaded_file.name:
             try:
-                with st.status("🛠️ Building Intelligence Layer...", expanded=True) as status:
-                    # Add detailed progress information
-                    status.update(label="📥 Loading file...", state="running")
-                    bytes_data = uploaded_file.read()
-                    uploaded_file.seek(0) # Reset pointer for Pandas
-                    status.update(label="🔄 Processing data...", state="running")
-                    from ingest import ingest_dataset
-                    status_code = ingest_dataset(uploaded_file, bytes_data, st.session_state.username)
-                    
-                    if status_code in ["NEW", "EXISTING"]:
-                        status.update(label="📊 Updating registry...", state="running")
-                        refresh_registry()
-                        # Auto-select the newly uploaded file
-                        current_hash = hashlib.md5(bytes_data).hexdigest()
-                        
-                        for d in st.session_state.registry["datasets"]:
-                            if d["hash"] == current_hash:
-                                st.session_state.active_dataset = d
-                                break
-                        
-                        st.session_state.last_uploaded = uploaded_file.name
-                        status.update(label="✅ Intelligence Layer Ready!", state="complete", expanded=False)
-                        st.success("✅ Dataset processed successfully!")
-                        st.rerun()
-                    else:
-                        status.update(label="❌ Processing failed", state="error")
-                        st.error(f"Dataset processing failed: {status_code}")
+                from ingest import get_stream_hash, is_already_ingested
+                current_hash = get_stream_hash(uploaded_file) # Also resets pointer for Pandas
+                st.session_state.last_uploaded = uploaded_file.name
+                
+                if is_already_ingested(current_hash, st.session_state.username):
+                    refresh_registry()
+                    select_dataset_by_hash(current_hash)
+                    st.success("✅ Dataset already processed!")
+                    st.rerun()
+                else:
+                    # Parsing and embedding run in the background; progress shows under Ingestion Jobs
+                    job_id = submit_ingest_job(uploaded_file, st.session_state.username, current_hash)
+                    st.session_state.pending_jobs[job_id] = current_hash
+                    st.info(f"⏳ {uploaded_file.name} queued for processing.")
             except Exception as e:
                 st.error(f"Upload failed: {e}")
 
+    render_ingestion_jobs()
+    if _fragment is None and has_active_jobs(st.session_state.username):
+        st.button("🔄 Refresh progress")
+
     st.divider()
     
     # Dataset Library
@@ -984,18 +861,20 @@ with st.sidebar:
             col1.caption(f"📄 {d['filename']}")
             if col2.button("🗑️", key=f"del_{i}", help=f"Delete {d['filename']}"):
                 try:
-                    # 1. Physical Delete
-                    if os.path.exists(d["db_path"]):
-                        shutil.rmtree(d["db_path"], ignore_errors=True)
-                    if os.path.exists(d["csv_path"]):
-                        os.remove(d["csv_path"])
+                    # 1. Physical Delete (drop the cached chain first; shared stores only lose this collection)
+                    evict_rag_chain(d["db_path"], get_collection_name(d))
+                    evict_dataset_view(get_snapshot_path(d), d.get("hash"))
+                    evict_dataframe(get_snapshot_path(d), d.get("hash"))
+                    delete_dataset_vectors(d)
+                    if d.get("snapshot_path"):
+                        remove_cube(d["snapshot_path"])
+                    for key in ("snapshot_path", "csv_path"):
+                        if d.get(key) and os.path.exists(d[key]):
+                            os.remove(d[key])
                     
                     # 2. Registry Delete
-                    from app_config import get_dataset_registry, get_user_storage_paths
-                    user_paths = get_user_storage_paths(st.session_state.username)
-                    new_datasets = [dataset for dataset in datasets if dataset["hash"] != d["hash"]]
-                    with open(user_paths["hash_file"], "w") as f:
-                        json.dump({"datasets": new_datasets}, f)
+                    from app_config import remove_registry_entry
+                    remove_registry_entry(d["hash"], st.session_state.username)
                     
                     # 3. State cleanup
                     if st.session_state.active_dataset and st.session_state.active_dataset["hash"] == d["hash"]:
@@ -1031,8 +910,24 @@ with st.sidebar:
                 try:
                     import gc
                     
-                    # Step 1: Clear Streamlit Resource Cache (Critical for releasing handles)
+                    from app_config import get_user_storage_paths
+                    user_paths = get_user_storage_paths(st.session_state.username)
+
+                    # Step 1: Drop this user's collections (a node-wide store is not deleted below),
+                    # then clear Streamlit Resource Cache and this user's RAG chains / Chroma clients (Critical for releasing handles).
+                    # Other users' stores, the node-wide store and their running ingests keep their handles.
+                    # The embedding and intent caches are shared by every user and stay
+                    # (clear them with `python vector_store.py clear-caches`).
+                    for entry in get_dataset_registry(st.session_state.username)["datasets"]:
+                        evict_rag_chain(entry["db_path"], get_collection_name(entry))
+                        evict_dataset_view(get_snapshot_path(entry), entry.get("hash"))
+                        evict_dataframe(get_snapshot_path(entry), entry.get("hash"))
+                        if entry.get("collection"):
+                            delete_dataset_vectors(entry)
                     st.cache_resource.clear()
+                    clear_rag_cache(user_paths["vector_db"])
+                    clear_finished_jobs(st.session_state.username)
+                    st.session_state.pending_jobs = {}
                     
                     # Step 2: Force reset of RAG objects
                     if 'rag_chain' in st.session_state:
@@ -1069,9 +964,6 @@ with st.sidebar:
                     
                     # Step 5: Try to delete with retry logic
                     max_retries = 3
-                    from app_config import get_user_storage_paths
-                    user_paths = get_user_storage_paths(st.session_state.username)
-                    
                     db_parent = user_paths["vector_db"]
                     
                     for attempt in range(max_retries):
@@ -1095,7 +987,10 @@ with st.sidebar:
                                     except:
                                         raise e
                     
-                    # Step 6: Delete all metadata files for this user (including registry)
+                    # Step 6: Delete this user's registry and all metadata files
+                    from app_config import save_dataset_registry, clear_schema_profiles
+                    save_dataset_registry({"datasets": []}, st.session_state.username)
+                    clear_schema_profiles(st.session_state.username)
                     metadata_parent = user_paths["metadata"]
                     if os.path.exists(metadata_parent):
                         # Delete all files including dataset_hash.json
@@ -1127,6 +1022,34 @@ with st.sidebar:
                 st.session_state.show_factory_confirm = False
                 st.rerun()
 
+    # Performance counters for this server process
+    with st.expander("⚙️ Performance", expanded=False):
+        emb_stats = get_embedding_stats()
+        st.caption(f"Embedding model: {'loaded' if emb_stats['loaded'] else 'loading...'} "
+                   f"({emb_stats['backend']}, load {emb_stats['load_seconds']:.1f}s)")
+        st.caption(f"Encoded {emb_stats['texts_encoded']:,} texts in {emb_stats['encode_calls']:,} calls "
+                   f"({emb_stats['encode_seconds']:.1f}s)")
+        if emb_stats["cache"]:
+            cache_stats = emb_stats["cache"]
+            st.caption(f"Embedding cache: {cache_stats['hit_rate']:.0%} hit rate, "
+                       f"{cache_stats['entries']:,} vectors, {cache_stats['evictions']:,} evicted")
+        intent_stats = get_intent_cache_stats()
+        if intent_stats:
+            st.caption(f"Intent cache: {intent_stats['hit_rate']:.0%} hit rate "
+                       f"({intent_stats['hits']:,} of {intent_stats['hits'] + intent_stats['misses']:,}), "
+                       f"{intent_stats['entries']:,} intents, {intent_stats['evictions'] + intent_stats['expired']:,} evicted/expired")
+        frame_stats = get_dataframe_cache_stats()
+        st.caption(f"DataFrame cache: {frame_stats['hit_rate']:.0%} hit rate, {frame_stats['entries']:,} datasets, "
+                   f"{frame_stats['bytes'] / 1e6:.1f} of {frame_stats['budget_bytes'] / 1e6:.0f} MB, "
+                   f"{frame_stats['evictions']:,} evicted"
+                   + (f", {frame_stats['oversized_entries']} over budget "
+                      f"({frame_stats['oversized_bytes'] / 1e6:.0f} MB)" if frame_stats['oversized_entries'] else ""))
+        last_timings = st.session_state.get("last_query_timings")
+        if last_timings:
+            st.caption("Last question: " + ", ".join(
+                f"{stage.replace('_', ' ')} {seconds:.2f}s" for stage, seconds in last_timings.items()
+            ))
+
 # 4. Main Interface Logic
 if not api_key:
     st.error("🔑 Groq API Key missing. Add it to your .env file.")
@@ -1135,10 +1058,12 @@ if not api_key:
 if st.session_state.active_dataset:
     d = st.session_state.active_dataset
     
-    # Load Data for Dashboard
+    # Load Data for Dashboard (legacy CSV snapshots are converted to Parquet once)
     try:
-        df = pd.read_csv(d["csv_path"])
-        st.session_state.df = df
+        d = ensure_parquet_snapshot(d, st.session_state.username)
+        st.session_state.active_dataset = d
+        snapshot_path = get_snapshot_path(d)
+        schema = snapshot_schema(snapshot_path)
     except Exception as e:
         st.error(f"Error loading data: {e}")
         st.stop()
@@ -1171,24 +1096,51 @@ if st.session_state.active_dataset:
             with st.chat_message("assistant"):
                 with st.spinner("Let me check that for you..."):
                     # === Hybrid Query Router Integration ===
+                    timings = {}
+                    chain = get_rag_chain(
+                        api_key,
+                        db_path=d["db_path"],
+                        username=st.session_state.username,
+                        collection_name=get_collection_name(d),
+                        vector_quantization=d.get("vector_quantization"),
+                        embedding_space=dataset_embedding_space(d)
+                    )
+                    # Speculatively retrieve RAG context while the router classifies the question
+                    prefetch = prefetch_context(chain, prompt) if SPECULATIVE_RETRIEVAL else None
+
                     # 1. Try to answer with direct DataFrame query first (100% accurate for lists/counts)
-                    structured_answer = classify_and_route_query(prompt, st.session_state.df)
+                    start = time.perf_counter()
+                    structured_answer = classify_and_route_query(prompt, snapshot_path, d.get("hash"))
+                    timings["route"] = time.perf_counter() - start
                     
                     if structured_answer:
                         answer = structured_answer
+                        if prefetch is not None and not prefetch.cancel():
+                            print("🗑️ Discarded speculative retrieval (lookup answered)")
                     else:
                         # 2. Fallback to RAG for analytical/reasoning questions
-                        chain = get_rag_chain(
-                            api_key,
-                            db_path=d["db_path"],
-                            username=st.session_state.username
-                        )
+                        context = None
+                        if prefetch is not None:
+                            start = time.perf_counter()
+                            try:
+                                context, timings["retrieval"] = prefetch.result()
+                            except Exception as e:
+                                print(f"Speculative retrieval failed: {e}")
+                            timings["retrieval_wait"] = time.perf_counter() - start
                         # Pass chat history for conversational context
                         result = chain.invoke({
                             "input": prompt,
-                            "chat_history": st.session_state.chat_histories[history_key]
+                            "chat_history": st.session_state.chat_histories[history_key],
+                            "context": context
                         })
                         answer = result["answer"]
+                        timings.update(result.get("timings", {}))
+
+                    if "retrieval_wait" in timings:
+                        # Retrieval overlapped with routing; only the wait after routing was on the critical path
+                        timings["saved"] = max(timings.get("retrieval", 0.0) - timings["retrieval_wait"], 0.0)
+                    st.session_state.last_query_timings = timings
+                    print("⏱️ Stages: " + ", ".join(f"{k} {v * 1000:.0f} ms" for k, v in timings.items()))
                     
                     st.markdown(answer)
 
@@ -1201,28 +1153,40 @@ if st.session_state.active_dataset:
     with tab2:
         st.subheader("📊 Workforce Metrics")
         
-        # Metrics Row
+        # Metrics Row (record/column counts come from file metadata)
         c1, c2, c3 = st.columns(3)
-        c1.metric("Total Records", len(df))
-        c2.metric("Columns", len(df.columns))
+        c1.metric("Total Records", schema["num_rows"])
+        c2.metric("Columns", len(schema["columns"]))
         
-        num_cols = df.select_dtypes(include=['number']).columns
+        num_cols = pd.Index(schema["numeric"])
+        # Chart by project / person when the dataset has them, not a free-text column
+        col_to_plot = chart_column(schema)
+        # Metrics and charts come from the precomputed aggregate cube (legacy CSV snapshots: from the rows)
+        cube = get_cube(snapshot_path)
+        if cube is None:
+            df = read_snapshot(snapshot_path, columns=list(num_cols[:1]) + ([col_to_plot] if col_to_plot else []))
         if not num_cols.empty:
-            c3.metric(f"Avg {num_cols[0].title()}", round(df[num_cols[0]].mean(), 1))
+            avg = cube["numeric"][num_cols[0]]["mean"] if cube else df[num_cols[0]].mean()
+            c3.metric(f"Avg {num_cols[0].title()}", round(avg or 0, 1))
         
         st.divider()
         
-        # Visualizations
-        obj_cols = df.select_dtypes(include=['object']).columns
-        if not obj_cols.empty:
-            col_to_plot = obj_cols[0]
+        # Visualizations (top categories plus "Other": a few KB for Plotly at any row count)
+        if col_to_plot:
+            if cube:
+                counts = dimension_series(cube, "category", "rows")
+            else:
+                counts = df[col_to_plot].value_counts()
+            counts = top_n_series(counts, DASHBOARD_TOP_N)
+            counts_df = counts.rename_axis(col_to_plot).reset_index(name="rows")
             
             # Modern color scheme for charts
             color_scheme = px.colors.sequential.Blues_r
             
             fig = px.pie(
-                df, 
+                counts_df, 
                 names=col_to_plot, 
+                values="rows",
                 title=f"Distribution by {col_to_plot.title()}",
                 color_discrete_sequence=color_scheme,
                 hole=0.3  # Donut chart for modern look
@@ -1236,8 +1200,13 @@ if st.session_state.active_dataset:
             st.plotly_chart(fig, use_container_width=True)
             
             if not num_cols.empty:
+                if cube:
+                    totals = dimension_series(cube, "category", num_cols[0])
+                else:
+                    totals = df.groupby(col_to_plot)[num_cols[0]].sum()
+                totals = top_n_series(totals, DASHBOARD_TOP_N)
                 fig2 = px.bar(
-                    df.groupby(col_to_plot)[num_cols[0]].sum().reset_index(), 
+                    totals.rename_axis(col_to_plot).reset_index(name=num_cols[0]), 
                     x=col_to_plot, 
                     y=num_cols[0], 
                     title=f"Total {num_cols[0].title()} by {col_to_plot.title()}",
@@ -1253,7 +1222,56 @@ if st.session_state.active_dataset:
 
     with tab3:
         st.subheader("📋 Complete Dataset")
-        st.dataframe(df, use_container_width=True, height=600)
+        # Filtering, sorting and paging run on the shared cached frame; only one page goes to the browser
+        all_columns = schema["columns"]
+
+        f1, f2, f3 = st.columns([2, 1, 1])
+        search = f1.text_input("🔎 Search", key="raw_search", placeholder="Text in any column")
+        filter_col = f2.selectbox("Filter column", ["(none)"] + all_columns, key="raw_filter_col")
+        filter_text = f3.text_input("contains", key="raw_filter_text", disabled=filter_col == "(none)")
+        filters = {filter_col: filter_text} if filter_col != "(none)" and filter_text else {}
+
+        page_sizes = sorted({50, RAW_DATA_PAGE_SIZE, 250, 500})
+        s1, s2, s3 = st.columns([2, 1, 1])
+        sort_by = s1.selectbox("Sort by", ["(file order)"] + all_columns, key="raw_sort_by")
+        ascending = s2.radio("Order", ["Ascending", "Descending"], key="raw_sort_order", horizontal=True) == "Ascending"
+        page_size = s3.selectbox("Rows per page", page_sizes, index=page_sizes.index(RAW_DATA_PAGE_SIZE), key="raw_page_size")
+        shown_columns = st.multiselect("Columns", all_columns, default=all_columns, key="raw_columns") or all_columns
+
+        # Load only the shown, filtered and sorted columns, plus the text columns while searching
+        needed = shown_columns + [c for c in (filter_col, sort_by) if c in all_columns]
+        if search:
+            needed += [c for c in all_columns if c not in schema["numeric"]]
+        raw_df = get_dataframe(snapshot_path, d.get("hash"), columns=needed)
+
+        mask = filter_mask(raw_df, search, filters) if (search or filters) else None
+        matching = int(mask.sum()) if mask is not None else len(raw_df)
+        page_count = max((matching + page_size - 1) // page_size, 1)
+        page = int(st.number_input(f"Page (of {page_count:,})", min_value=1, max_value=page_count, value=1, step=1))
+        rows, matching = get_page(raw_df, mask, None if sort_by == "(file order)" else sort_by, ascending,
+                                  page, page_size, shown_columns)
+        first = (page - 1) * page_size
+        st.caption(f"Rows {first + 1 if matching else 0:,}–{first + len(rows):,} of {matching:,} matching "
+                   f"({len(raw_df):,} total)")
+        st.dataframe(rows, use_container_width=True, height=min(600, 38 + 35 * len(rows)))
+
+        # Download: the CSV is only built when the button is clicked, from the rows matching the
+        # on-screen filter (same frame and mask), written batch by batch to a file that is then removed
+        from app_config import get_user_storage_paths
+        export_dir = get_user_storage_paths(st.session_state.username)["exports"]
+
+        def build_raw_export(df=raw_df, mask=mask, columns=shown_columns):
+            export_path = new_export_path(export_dir)
+            try:
+                export_filtered_csv(df, export_path, mask, columns)
+                with open(export_path, "rb") as f:
+                    return f.read()
+            finally:
+                remove_export(export_path)
+
+        st.download_button(f"📥 Download {matching:,} filtered rows (CSV, file order)", build_raw_export,
+                           file_name=f"{os.path.splitext(d['filename'])[0]}_filtered.csv",
+                           mime="text/csv", key="raw_download", on_click="ignore")
 
 else:
     # Welcome Screen - Dark Theme Hero Section
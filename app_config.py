@@ -1,6 +1,5 @@
 # app_config.py
 import os
-import json
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -19,6 +18,14 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 LLM_MODEL = "llama-3.3-70b-versatile"  # Updated: llama3-70b-8192 deprecated
 # Local Embeddings (Free, Persistent, No API limits)
 EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# Embedding inference backend: "torch" (sentence-transformers), "onnx" (ONNX Runtime)
+# or "onnx-int8" (ONNX Runtime, dynamically int8-quantized weights). See onnx_embeddings.py.
+# The ONNX speedup is unmeasured here: benchmark (benchmarks.py embeddings) before switching.
+# Datasets keep the backend they were embedded with; after a switch to or from
+# onnx-int8, older datasets must be deleted and uploaded again before they can be searched.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# ONNX exports must match the PyTorch embeddings at least this closely (min cosine), else torch is used
+ONNX_PARITY_MIN_COSINE = 0.99
 
 # =========================
 # RAG STRATEGY
@@ -27,18 +34,119 @@ EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 TEMPERATURE = 0.0        
 # k=10 allows the AI to see enough rows to compare workloads effectively
 TOP_K = 10
+# Compiled RAG chains / open Chroma clients kept per process (LRU by dataset)
+RAG_CHAIN_CACHE_SIZE = 8
+# Query router: rule-based intents (intent_rules.py) at or above this confidence
+# skip the LLM intent classifier
+INTENT_RULES_MIN_CONFIDENCE = 0.8
+# Start RAG retrieval while the router classifies the question; the context is used
+# if the router picks RAG and discarded if a lookup answers
+SPECULATIVE_RETRIEVAL = True
+SPECULATIVE_RETRIEVAL_WORKERS = 4
+# Prepared DataFrame views for structured lookups kept per process (see dataset_views.py)
+DATASET_VIEW_CACHE_SIZE = 4
+# Memory budget of the process-wide DataFrame cache shared by all sessions
+# (see get_dataframe in dataset_store.py); least recently used frames are dropped
+DATAFRAME_CACHE_MAX_MB = int(os.getenv("DATAFRAME_CACHE_MAX_MB", 1024))
+# Frames larger than that budget kept besides it (least recently used dropped first),
+# so a big dataset is not re-read on every rerun of its Raw Data tab; 0 disables
+DATAFRAME_CACHE_MAX_OVERSIZED = int(os.getenv("DATAFRAME_CACHE_MAX_OVERSIZED", 1))
+
+# =========================
+# DASHBOARD
+# =========================
+# Chart slices/bars shown per category; the remaining categories are summed into "Other"
+DASHBOARD_TOP_N = 10
+# Groups of the chart column kept in the aggregate cube (the rest are stored as "Other")
+CUBE_MAX_CATEGORY_GROUPS = 200
+# Rows per page of the Raw Data browser (only the visible page is sent to the browser)
+RAW_DATA_PAGE_SIZE = 100
+# Filtered CSV exports are deleted once served; ones left by an interrupted download are removed after this
+RAW_EXPORT_MAX_AGE_SECONDS = 3600
+
+# =========================
+# INGESTION
+# =========================
+# Upload cap enforced in app.py (keep .streamlit/config.toml maxUploadSize in sync)
+MAX_UPLOAD_SIZE_MB = 500
+# Files above this size are ingested in streaming mode (bounded memory)
+STREAMING_THRESHOLD_MB = 25
+# Rows per streamed batch; each batch is embedded and written before the next is read.
+# Must stay below Chroma's max insert batch size (~5400).
+STREAM_CHUNK_ROWS = 5000
+# Values sampled per date column to pick its format (cached per schema afterwards)
+DATE_SAMPLE_SIZE = 200
+# Process-parallel chunk serialization (see processor.serialize_rows_parallel)
+SERIALIZE_WORKERS = int(os.getenv("SERIALIZE_WORKERS", os.cpu_count() or 1))
+# Below this many rows pool startup costs more than it saves; serialize in-process
+PARALLEL_SERIALIZE_MIN_ROWS = 50000
+# Rows that serialize to the same sentence are stored once (id = sentence hash) with
+# "row_count" and "row_indices" metadata pointing back at every source row
+DEDUP_SENTENCES = True
+# Re-uploads of a grown export (same columns, a superset of the rows) update the
+# existing dataset in place: only new/changed rows are embedded, removed rows deleted
+APPEND_MODE_ENABLED = True
+# Share of the existing dataset's rows that must reappear in the upload to count as a newer
+# version of it. Uploads that only partly overlap (e.g. rolling monthly exports) become a new dataset.
+APPEND_MIN_COVERAGE = 0.98
+# Background ingestion (see jobs.py): uploads processed concurrently per process
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 2))
+# Sidebar job progress refresh interval
+JOB_POLL_SECONDS = 2
 
 # STORAGE PATHS
 # =========================
+# Cleaned dataset snapshots are stored as Parquet (see dataset_store.py)
+SNAPSHOT_COMPRESSION = "zstd"
+
 # Base directories
 BASE_VECTOR_DB_DIR = os.path.abspath("./db")
 BASE_METADATA_DIR = os.path.abspath("./metadata")
 
+# Vector store layout (see vector_store.py):
+#   "user"     - one persistent Chroma store per user (db/<user>/store), one collection per dataset
+#   "node"     - one store for the whole node (db/_shared), collections namespaced per user
+#   "isolated" - legacy layout: a separate store directory per upload
+# Existing isolated datasets keep working; `python vector_store.py migrate --all` moves them.
+STORAGE_MODE = os.getenv("STORAGE_MODE", "user")
+SHARED_STORE_DIR = os.path.join(BASE_VECTOR_DB_DIR, "_shared")
+
+# Optional quantized vector storage for new datasets (see quantized_store.py):
+#   unset (full-precision Chroma collection), "float16", or "int8" (one scale per vector).
+# Recorded per dataset in the registry ("vector_quantization"); existing datasets are unaffected.
+VECTOR_QUANTIZATION = os.getenv("VECTOR_QUANTIZATION") or None
+# Keep a float32 copy on disk for exact rescoring of the top candidates (memory-mapped, not loaded)
+VECTOR_RESCORE = True
+# Candidates rescored per requested result
+VECTOR_RESCORE_FACTOR = 4
+
+# Content-addressed embedding cache shared by all users of this node
+# (keyed by hash of model name + sentence; ~1.6KB per entry for 384-dim vectors)
+EMBEDDING_CACHE_ENABLED = True
+EMBEDDING_CACHE_PATH = os.path.join(BASE_METADATA_DIR, "embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = 1_000_000
+# Classified chat intents (see intent_cache.py), keyed by normalized question + column schema,
+# so repeated questions skip the LLM intent classifier
+INTENT_CACHE_ENABLED = True
+INTENT_CACHE_PATH = os.path.join(BASE_METADATA_DIR, "intent_cache.sqlite")
+INTENT_CACHE_MAX_ENTRIES = 10_000
+INTENT_CACHE_TTL_SECONDS = 7 * 24 * 3600
+# Exported ONNX embedding models (created on first use of an ONNX backend)
+ONNX_MODEL_DIR = os.path.join(BASE_METADATA_DIR, "onnx")
+
+# Persistent ingestion job table and spooled uploads waiting to be processed
+JOBS_DB_PATH = os.path.join(BASE_METADATA_DIR, "jobs.sqlite")
+UPLOAD_SPOOL_DIR = os.path.join(BASE_METADATA_DIR, "uploads")
+
+# Dataset registry of every user (see registry_store.py; replaces dataset_hash.json)
+REGISTRY_DB_PATH = os.path.join(BASE_METADATA_DIR, "registry.sqlite")
+
 # User-specific paths will be determined dynamically
 PERSIST_DIRECTORY = None  # Will be set per user
 METADATA_DIR = None       # Will be set per user
 HASH_FILE = None          # Will be set per user
 
+_created_user_dirs = set()
 
 def get_user_storage_paths(username):
     """Generate user-specific storage paths"""
@@ -46,46 +154,93 @@ def get_user_storage_paths(username):
     user_db_dir = os.path.join(BASE_VECTOR_DB_DIR, user_safe)
     user_metadata_dir = os.path.join(BASE_METADATA_DIR, user_safe)
     user_hash_file = os.path.join(user_metadata_dir, "dataset_hash.json")
+    user_schema_file = os.path.join(user_metadata_dir, "schema_profiles.json")
+    user_exports_dir = os.path.join(user_metadata_dir, "exports")
     
-    # Create directories if they don't exist
-    os.makedirs(user_db_dir, exist_ok=True)
-    os.makedirs(user_metadata_dir, exist_ok=True)
+    # Create directories if they don't exist (checked once per process; factory reset removes them)
+    if user_safe not in _created_user_dirs or not os.path.isdir(user_metadata_dir):
+        os.makedirs(user_db_dir, exist_ok=True)
+        os.makedirs(user_metadata_dir, exist_ok=True)
+        _created_user_dirs.add(user_safe)
     
     return {
         "vector_db": user_db_dir,
         "metadata": user_metadata_dir,
-        "hash_file": user_hash_file
+        "hash_file": user_hash_file,
+        "schema_file": user_schema_file,
+        "exports": user_exports_dir
     }
 
 def get_dataset_registry(username=None):
     """
     Retrieves the full registry of uploaded datasets for a specific user.
-    Structure: {"datasets": [{"filename": str, "db_path": str, "csv_path": str, "hash": str}]}
+    Structure: {"datasets": [{"filename": str, "db_path": str, "snapshot_path": str, "hash": str, ...}]}
+    Entries created before Parquet snapshots carry "csv_path" instead (see dataset_store).
     """
     # Use default user if none specified (for backward compatibility)
     if username is None:
         username = "default_user"
     
-    user_paths = get_user_storage_paths(username)
-    hash_file = user_paths["hash_file"]
-    
-    if os.path.exists(hash_file):
-        try:
-            with open(hash_file, "r") as f:
-                data = json.load(f)
-                if "datasets" in data:
-                    return data
-                # Backward compatibility for old single-file format
-                if "active_db_path" in data:
-                    return {"datasets": [{
-                        "filename": data.get("filenames", ["Legacy Dataset"])[0],
-                        "db_path": data.get("active_db_path"),
-                        "csv_path": os.path.join(user_paths["metadata"], "active_data.csv"),
-                        "hash": data.get("hashes", ["unknown"])[0]
-                    }]}
-        except:
-            pass
-    return {"datasets": []}
+    from registry_store import get_datasets
+    return {"datasets": get_datasets(username)}
+
+def save_dataset_registry(registry, username=None):
+    """Persist the full registry for a user (one transaction)."""
+    if username is None:
+        username = "default_user"
+
+    from registry_store import replace_datasets
+    replace_datasets(username, registry["datasets"])
+
+def find_registry_entry(dataset_hash, username=None):
+    """Indexed lookup of the dataset built from an upload with this hash (also matches appended uploads)."""
+    if username is None:
+        username = "default_user"
+
+    from registry_store import find_dataset
+    return find_dataset(username, dataset_hash)
+
+def update_registry_entry(entry, username=None):
+    """Replace the registry entry with the same hash (appends if it is new)."""
+    if username is None:
+        username = "default_user"
+
+    from registry_store import upsert_dataset
+    return upsert_dataset(username, entry)
+
+def remove_registry_entry(dataset_hash, username=None):
+    """Drop a dataset from the registry (files are removed by the caller)."""
+    if username is None:
+        username = "default_user"
+
+    from registry_store import delete_dataset
+    delete_dataset(username, dataset_hash)
+
+def get_schema_profiles(username=None):
+    """
+    Cached per-layout schema profiles for a user, keyed by schema fingerprint.
+    Structure: {fingerprint: {"fingerprint": str, "date_formats": {column: format | None}}}
+    """
+    if username is None:
+        username = "default_user"
+
+    from registry_store import get_schema_profiles as read_profiles
+    return read_profiles(username)
+
+def save_schema_profiles(profiles, username=None):
+    """Merge profiles into the user's stored ones (one transaction; concurrent ingests keep each other's layouts)."""
+    if username is None:
+        username = "default_user"
+
+    from registry_store import save_schema_profiles as write_profiles
+    write_profiles(username, profiles)
+
+def clear_schema_profiles(username=None):
+    if username is None:
+        username = "default_user"
+
+    from registry_store import delete_schema_profiles
+    delete_schema_profiles(username)
 
 def get_active_db_path(username=None):
     """
@@ -0,0 +1,240 @@
+"""
+Performance benchmarks for the ingestion and retrieval pipeline.
+
+Usage:
+    python benchmarks.py serialize --rows 400000
+    python benchmarks.py serialize --file exports/clockify_2024.csv
+    python benchmarks.py quantization --rows 200000 --source random
+    python benchmarks.py quantization --rows 50000 --source model
+    python benchmarks.py embeddings --rows 5000 --backends torch,onnx,onnx-int8
+"""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from app_config import EMBEDDING_MODEL, ONNX_PARITY_MIN_COSINE, SERIALIZE_WORKERS
+from processor import (
+    clean_and_serialize, detect_key_columns, serialize_rows, serialize_rows_legacy, serialize_rows_parallel
+)
+
+
+class _NamedBuffer(io.StringIO):
+    """In-memory CSV that looks like a Streamlit upload to the processor."""
+    name = "benchmark.csv"
+
+
+def make_clockify_frame(rows, seed=42):
+    """Synthetic Clockify-style export used when no --file is given."""
+    rng = np.random.default_rng(seed)
+    users = [f"Employee {i}" for i in range(250)]
+    projects = [f"Project {i} : {'Billable' if i % 3 else 'Non-Billable'}" for i in range(60)]
+    descriptions = ["Sprint planning", "Code review", "Client call", "Bug fixing", "", "Documentation"]
+    start = pd.Timestamp("2024-01-01")
+    return pd.DataFrame({
+        "Project": rng.choice(projects, rows),
+        "Client": rng.choice(["Acme", "Globex", "Initech", ""], rows),
+        "Description": rng.choice(descriptions, rows),
+        "User": rng.choice(users, rows),
+        "Group": rng.choice(["Engineering", "Design", "Sales"], rows),
+        "Billable": rng.choice(["Yes", "No"], rows),
+        "Start Date": (start + pd.to_timedelta(rng.integers(0, 365, rows), unit="D")).strftime("%m/%d/%Y"),
+        "Duration (decimal)": rng.choice([0.0, 0.5, 1.0, 1.25, 2.0, 4.0, 8.0], rows),
+    })
+
+
+def _load_normalized(path, rows):
+    """Run the real loader/normalizer once so both serializers see the same frame."""
+    if path:
+        with open(path, "rb") as f:
+            buffer = io.BytesIO(f.read())
+        buffer.name = path
+    else:
+        buffer = _NamedBuffer(make_clockify_frame(rows).to_csv(index=False))
+    with contextlib.redirect_stdout(io.StringIO()):
+        _, _, df = clean_and_serialize(buffer)
+    return df
+
+
+def _best_of(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - t0)
+    return min(timings), result
+
+
+def bench_serialize(args):
+    df = _load_normalized(args.file, args.rows)
+    col_map = detect_key_columns(df.columns)
+    print(f"Serializing {len(df):,} rows x {len(df.columns)} columns")
+
+    legacy_time, legacy = _best_of(lambda: serialize_rows_legacy(df, col_map), args.repeat)
+    columnar_time, columnar = _best_of(lambda: serialize_rows(df, col_map), args.repeat)
+    # Warm the pool first so the timing reflects steady-state ingest, not process spawn
+    serialize_rows_parallel(df.head(2), col_map, workers=args.workers, min_rows=0)
+    parallel_time, parallel = _best_of(
+        lambda: serialize_rows_parallel(df, col_map, workers=args.workers, min_rows=0), args.repeat
+    )
+
+    identical = legacy == columnar == parallel
+    print(f"  iterrows (legacy): {legacy_time:8.3f}s  ({len(df) / legacy_time:,.0f} rows/s)")
+    print(f"  columnar:          {columnar_time:8.3f}s  ({len(df) / columnar_time:,.0f} rows/s)")
+    print(f"  columnar x{args.workers:<3}      {parallel_time:8.3f}s  ({len(df) / parallel_time:,.0f} rows/s)")
+    print(f"  speedup:           {legacy_time / columnar_time:8.1f}x columnar, {legacy_time / parallel_time:.1f}x parallel")
+    print(f"  identical output:  {identical}")
+    return 0 if identical else 1
+
+
+def _benchmark_vectors(args):
+    """(corpus vectors, query vectors): clustered random vectors, or real embeddings of synthetic rows."""
+    rng = np.random.default_rng(7)
+    if args.source == "random":
+        centers = rng.standard_normal((500, args.dim)).astype(np.float32)
+        corpus = centers[rng.integers(0, len(centers), args.rows)] + 0.35 * rng.standard_normal((args.rows, args.dim))
+        queries = centers[rng.integers(0, len(centers), args.queries)] + 0.35 * rng.standard_normal((args.queries, args.dim))
+        return corpus.astype(np.float32), queries.astype(np.float32)
+
+    from embeddings import get_embedding_model
+    df = _load_normalized(args.file, args.rows)
+    sentences, _ = serialize_rows(df, detect_key_columns(df.columns))
+    questions = [
+        f"How many hours did Employee {rng.integers(250)} spend on Project {rng.integers(60)}?"
+        for _ in range(args.queries)
+    ]
+    model = get_embedding_model()
+    print(f"Embedding {len(sentences):,} rows with {model.model_name} ...")
+    corpus = np.asarray(model.embed_documents(sentences), dtype=np.float32)
+    queries = np.asarray([model.embed_query(q) for q in questions], dtype=np.float32)
+    return corpus, queries
+
+
+def bench_quantization(args):
+    from quantized_store import QUANTIZATIONS, QuantizedIndex, normalize
+
+    corpus, queries = _benchmark_vectors(args)
+    corpus, queries = normalize(corpus), normalize(queries)
+    k = args.k
+    print(f"{len(corpus):,} vectors x {corpus.shape[1]} dims, {len(queries)} queries, recall@{k}")
+
+    # Ground truth: exact float32 search (what the full-precision store ranks by)
+    t0 = time.perf_counter()
+    truth = [set(np.argpartition(-(corpus @ q), k - 1)[:k]) for q in queries]
+    float32_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+    print(f"  {'float32 (exact)':<22} recall 1.000  {corpus.nbytes / 2**20:9.1f} MiB  {float32_ms:7.2f} ms/query")
+
+    ok = True
+    for quantization in QUANTIZATIONS:
+        for rescore in (False, True):
+            with tempfile.TemporaryDirectory() as tmp:
+                index = QuantizedIndex(os.path.join(tmp, "index"), quantization, rescore=rescore)
+                for start in range(0, len(corpus), 5000):
+                    batch = corpus[start:start + 5000]
+                    ids = [str(i) for i in range(start, start + len(batch))]
+                    index.add(ids, batch, ids, [{} for _ in ids])
+                index.close()
+                index = QuantizedIndex(index.path)
+
+                t0 = time.perf_counter()
+                results = [index.search(q, k)[0] for q in queries]
+                query_ms = (time.perf_counter() - t0) * 1000 / len(queries)
+                recall = np.mean([len(truth[i].intersection(rows.tolist())) / k for i, rows in enumerate(results)])
+                label = f"{quantization}{' + rescore' if rescore else ''}"
+                print(f"  {label:<22} recall {recall:.3f}  {index.nbytes() / 2**20:9.1f} MiB  {query_ms:7.2f} ms/query")
+                if rescore and recall < args.min_recall:
+                    ok = False
+    return 0 if ok else 1
+
+
+def _load_backend(backend):
+    if backend == "torch":
+        from langchain_huggingface import HuggingFaceEmbeddings
+        return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    from onnx_embeddings import OnnxEmbeddingModel
+    return OnnxEmbeddingModel(EMBEDDING_MODEL, quantize=backend == "onnx-int8")
+
+
+def bench_embeddings(args):
+    from onnx_embeddings import BACKENDS, cosine_parity
+
+    backends = args.backends.split(",")
+    unknown = [b for b in backends if b not in BACKENDS]
+    if unknown:
+        raise SystemExit(f"Unknown backend(s) {unknown}; choose from {BACKENDS}")
+    df = _load_normalized(args.file, args.rows)
+    sentences, _ = serialize_rows(df, detect_key_columns(df.columns))
+    queries = sentences[:args.queries]
+    print(f"Embedding {len(sentences):,} rows and {len(queries)} single queries with {EMBEDDING_MODEL}")
+
+    reference = None
+    ok = True
+    for backend in backends:
+        t0 = time.perf_counter()
+        model = _load_backend(backend)
+        model.embed_documents(sentences[:8])  # warm-up (first call allocates)
+        load_time = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        vectors = model.embed_documents(sentences)
+        docs_time = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for q in queries:
+            model.embed_query(q)
+        query_ms = (time.perf_counter() - t0) * 1000 / max(len(queries), 1)
+
+        if reference is None and backend == "torch":
+            reference = vectors
+        parity = ""
+        if reference is not None and backend != "torch":
+            p = cosine_parity(reference, vectors)
+            parity = f"  cosine vs torch min {p['min']:.4f} mean {p['mean']:.4f}"
+            ok = ok and p["min"] >= ONNX_PARITY_MIN_COSINE
+        print(f"  {backend:<10} load {load_time:6.1f}s  {len(sentences) / docs_time:8,.0f} docs/s  "
+              f"{query_ms:6.1f} ms/query{parity}")
+    if reference is None:
+        print("  (add 'torch' to --backends for the parity check)")
+    return 0 if ok else 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Employee Intelligence Assistant benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serialize", help="iterrows vs columnar chunk serialization")
+    p.add_argument("--rows", type=int, default=100_000, help="synthetic rows when no --file is given")
+    p.add_argument("--file", help="CSV/Excel export to benchmark instead of synthetic data")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--workers", type=int, default=SERIALIZE_WORKERS, help="process pool size for the parallel run")
+    p.set_defaults(func=bench_serialize)
+
+    p = sub.add_parser("quantization", help="recall / memory of quantized vector storage vs exact float32")
+    p.add_argument("--rows", type=int, default=100_000)
+    p.add_argument("--source", choices=["random", "model"], default="random",
+                   help="clustered random vectors, or real embeddings of synthetic (or --file) rows")
+    p.add_argument("--file", help="CSV/Excel export to embed with --source model")
+    p.add_argument("--dim", type=int, default=384, help="vector size for --source random")
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("-k", type=int, default=20, help="results per query (the RAG retriever uses 20)")
+    p.add_argument("--min-recall", type=float, default=0.95, help="exit non-zero if a rescored mode falls below this")
+    p.set_defaults(func=bench_quantization)
+
+    p = sub.add_parser("embeddings", help="PyTorch vs ONNX Runtime embedding throughput and cosine parity")
+    p.add_argument("--rows", type=int, default=2000, help="synthetic rows to embed when no --file is given")
+    p.add_argument("--file", help="CSV/Excel export whose rows are embedded instead")
+    p.add_argument("--queries", type=int, default=50, help="single-text embed_query calls to time")
+    p.add_argument("--backends", default="torch,onnx,onnx-int8", help="comma-separated; torch first for parity")
+    p.set_defaults(func=bench_embeddings)
+
+    args = parser.parse_args()
+    raise SystemExit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Headless bulk ingestion of time-tracking exports.
+
+Usage:
+    python bulk_ingest.py exports/2024/ --user alice
+    python bulk_ingest.py "exports/2024-*.csv" "exports/archive/*.xlsx" --user alice --workers 4
+
+Files are hashed first; duplicates within the batch and files the user has
+already ingested are skipped. The rest go through ingest_dataset()
+concurrently, sharing one warm embedding model (and its cache), and a
+per-file and total throughput report is printed at the end.
+"""
+import fix_sqlite  # Must be first
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from app_config import INGEST_WORKERS, find_registry_entry
+from embeddings import get_embedding_model
+from ingest import LocalUpload, get_stream_hash, ingest_dataset, is_already_ingested
+
+EXPORT_EXTENSIONS = (".csv", ".xlsx", ".xls")
+
+
+def collect_files(patterns, recursive=False):
+    """Export files from directories and/or glob patterns, in a stable order without repeats."""
+    files = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            walk = "**/*" if recursive else "*"
+            matches = glob.glob(os.path.join(pattern, walk), recursive=recursive)
+        else:
+            matches = glob.glob(pattern, recursive=recursive)
+        files.extend(m for m in sorted(matches) if m.lower().endswith(EXPORT_EXTENSIONS) and os.path.isfile(m))
+    return list(dict.fromkeys(os.path.abspath(f) for f in files))
+
+def hash_files(files):
+    """[(path, hash)] with duplicates (same content under another name) reported and dropped."""
+    unique, seen = [], {}
+    for path in files:
+        with open(path, "rb") as f:
+            file_hash = get_stream_hash(f)
+        if file_hash in seen:
+            print(f"⏭️  {os.path.basename(path)}: same content as {os.path.basename(seen[file_hash])}, skipped")
+            continue
+        seen[file_hash] = path
+        unique.append((path, file_hash))
+    return unique
+
+def ingest_file(path, file_hash, username, streaming=None):
+    """Ingest one file; returns a result row for the report."""
+    size = os.path.getsize(path)
+    start = time.perf_counter()
+    upload = LocalUpload(path)
+    try:
+        status = ingest_dataset(upload, None, username, streaming=streaming)
+    except Exception as e:
+        status = f"ERROR: {e}"
+    finally:
+        upload.close()
+    elapsed = time.perf_counter() - start
+
+    entry = find_registry_entry(file_hash, username) if not str(status).startswith("ERROR") else None
+    rows = entry.get("row_count", 0) if entry else 0
+    return {"file": os.path.basename(path), "status": status, "rows": rows, "bytes": size, "seconds": elapsed}
+
+def print_report(results, wall_seconds):
+    print()
+    print(f"{'File':<40} {'Status':<10} {'Rows':>10} {'MB':>8} {'Time':>8} {'Rows/s':>10} {'MB/s':>7}")
+    for r in results:
+        status = "ERROR" if str(r["status"]).startswith("ERROR") else r["status"]
+        mb = r["bytes"] / 2**20
+        secs = max(r["seconds"], 1e-9)
+        print(f"{r['file'][:40]:<40} {status:<10} {r['rows']:>10,} {mb:>8.1f} {r['seconds']:>7.1f}s "
+              f"{r['rows'] / secs:>10,.0f} {mb / secs:>7.2f}")
+
+    done = [r for r in results if r["status"] in ("NEW", "UPDATED")]
+    rows = sum(r["rows"] for r in done)
+    mb = sum(r["bytes"] for r in done) / 2**20
+    wall = max(wall_seconds, 1e-9)
+    print(f"\nIngested {len(done)} of {len(results)} file(s): {rows:,} rows, {mb:.1f} MB in {wall_seconds:.1f}s "
+          f"({rows / wall:,.0f} rows/s, {mb / wall:.2f} MB/s overall)")
+    for r in results:
+        if str(r["status"]).startswith("ERROR"):
+            print(f"❌ {r['file']}: {r['status']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest a directory or glob of exports for one user")
+    parser.add_argument("paths", nargs="+", help="directories and/or glob patterns of CSV/Excel exports")
+    parser.add_argument("--user", required=True, help="username whose dataset library receives the files")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="files ingested concurrently")
+    parser.add_argument("--recursive", action="store_true", help="descend into subdirectories / allow ** in globs")
+    parser.add_argument("--streaming", choices=["auto", "always", "never"], default="auto",
+                        help="streaming ingestion (default: by file size)")
+    args = parser.parse_args()
+
+    files = collect_files(args.paths, args.recursive)
+    if not files:
+        raise SystemExit("No CSV/Excel files matched.")
+    print(f"Found {len(files)} file(s); hashing...")
+
+    pending = []
+    for path, file_hash in hash_files(files):
+        if is_already_ingested(file_hash, args.user):
+            print(f"⏭️  {os.path.basename(path)}: already ingested for {args.user}, skipped")
+        else:
+            pending.append((path, file_hash))
+    if not pending:
+        print("Nothing to ingest.")
+        return
+
+    # Load the shared model once up front instead of inside the first worker
+    start = time.perf_counter()
+    get_embedding_model().load()
+    print(f"Embedding model ready in {time.perf_counter() - start:.1f}s; ingesting {len(pending)} file(s) "
+          f"with {args.workers} worker(s)")
+
+    streaming = {"auto": None, "always": True, "never": False}[args.streaming]
+    results = []
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(ingest_file, path, file_hash, args.user, streaming) for path, file_hash in pending]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            print(f"  {result['file']}: {result['status']} ({result['seconds']:.1f}s)")
+    print_report(results, time.perf_counter() - start)
+    if any(str(r["status"]).startswith("ERROR") for r in results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,425 @@
+"""
+Cleaned dataset snapshots.
+
+Each ingested dataset keeps a typed, compressed Parquet copy of its cleaned
+DataFrame. Readers project only the columns they need instead of re-parsing
+a CSV on every Streamlit rerun. Legacy registry entries that still point at a
+`csv_path` are converted on first use (see ensure_parquet_snapshot).
+
+Frames are shared: get_dataframe() keeps one downcast copy per dataset
+version (or column projection of it) for the whole process (LRU within
+DATAFRAME_CACHE_MAX_MB), so every session and rerun reads the same instance
+instead of loading its own. Frames larger than that budget get their own LRU
+of DATAFRAME_CACHE_MAX_OVERSIZED entries rather than being re-read from
+Parquet on every rerun.
+The raw-data browser loads only the columns it shows, filters and sorts on,
+filters and pages that frame (filter_mask, get_page) and exports the same
+filtered rows to a CSV file when a download is requested (export_filtered_csv).
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app_config import (
+    SNAPSHOT_COMPRESSION, DATAFRAME_CACHE_MAX_MB, DATAFRAME_CACHE_MAX_OVERSIZED, RAW_EXPORT_MAX_AGE_SECONDS
+)
+
+# Text columns with at most this share of distinct values are stored as categoricals
+_CATEGORY_MAX_RATIO = 0.5
+# Rows read from a snapshot per step (filtered exports, widening a streamed snapshot)
+_BATCH_ROWS = 50_000
+
+_frames = OrderedDict()  # (dataset key, snapshot mtime, columns or None) -> (DataFrame, bytes) (LRU)
+_oversized = OrderedDict()  # same, for frames over the byte budget (LRU by count)
+_frames_lock = threading.Lock()
+_frame_stats = {"hits": 0, "misses": 0, "evictions": 0, "bytes": 0, "oversized_bytes": 0}
+
+
+def _format_text(value) -> str:
+    # Whole floats ("5.0" after a numeric parse) are written as they appear in exports
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def _as_text(values: pd.Series) -> pd.Series:
+    """Values of a text column as strings; missing values stay missing (not "nan")."""
+    return values.astype(object).map(_format_text, na_action="ignore")
+
+def _is_numeric(values: pd.Series) -> bool:
+    """Whether every present value converts to a number."""
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return True
+    numbers = pd.to_numeric(values, errors="coerce")
+    return not (numbers.isna() & values.notna()).any()
+
+def _to_arrow_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Make a cleaned frame Parquet-safe: object columns holding mixed Python
+    types (e.g. numbers next to "Not Specified") are stored as text.
+    """
+    out = df
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in ("string", "empty"):
+            if out is df:
+                out = df.copy()
+            out[col] = _as_text(df[col])
+    return out
+
+def write_snapshot(df: pd.DataFrame, path: str) -> str:
+    """Write the cleaned frame as compressed Parquet (index dropped)."""
+    _to_arrow_frame(df).to_parquet(path, index=False, compression=SNAPSHOT_COMPRESSION)
+    return path
+
+class SnapshotWriter:
+    """
+    Incremental Parquet writer for streaming ingestion. The schema starts from
+    the first chunk (numbers as float64, everything else as text). When a later
+    chunk has text in a numeric column, that column is widened to text: the
+    rows already written are rewritten once with the wider schema, so no value
+    is lost to per-chunk dtype inference. Missing values stay null.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows = 0
+        self._writer = None
+        self._schema = None
+
+    def write(self, chunk: pd.DataFrame):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self._schema is None:
+            fields = []
+            for col in chunk.columns:
+                if pd.api.types.is_numeric_dtype(chunk[col]) and not pd.api.types.is_bool_dtype(chunk[col]):
+                    fields.append(pa.field(col, pa.float64()))
+                else:
+                    fields.append(pa.field(col, pa.string()))
+            self._schema = pa.schema(fields)
+            self._writer = pq.ParquetWriter(self.path, self._schema, compression=SNAPSHOT_COMPRESSION)
+
+        widen = [f.name for f in self._schema if pa.types.is_floating(f.type) and not _is_numeric(chunk[f.name])]
+        if widen:
+            self._widen(widen)
+
+        chunk = chunk.copy()
+        for field in self._schema:
+            if pa.types.is_floating(field.type):
+                chunk[field.name] = pd.to_numeric(chunk[field.name]).astype("float64")
+            else:
+                chunk[field.name] = _as_text(chunk[field.name])
+
+        table = pa.Table.from_pandas(chunk, schema=self._schema, preserve_index=False)
+        self._writer.write_table(table)
+        self.rows += len(chunk)
+
+    def _widen(self, columns):
+        """Switch `columns` to text, rewriting the rows written so far batch by batch."""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        print(f"Snapshot columns {columns} contain text in a later chunk; storing them as text")
+        self._writer.close()
+        written_path = self.path + ".widen"
+        os.replace(self.path, written_path)
+        self._schema = pa.schema([pa.field(f.name, pa.string()) if f.name in columns else f for f in self._schema])
+        self._writer = pq.ParquetWriter(self.path, self._schema, compression=SNAPSHOT_COMPRESSION)
+        try:
+            for batch in pq.ParquetFile(written_path).iter_batches(batch_size=_BATCH_ROWS):
+                part = batch.to_pandas()
+                for col in columns:
+                    part[col] = _as_text(part[col])
+                self._writer.write_table(pa.Table.from_pandas(part, schema=self._schema, preserve_index=False))
+        finally:
+            os.remove(written_path)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def abort(self):
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def get_snapshot_path(entry: dict) -> str:
+    """Snapshot file for a registry entry (Parquet, or a not-yet-migrated CSV)."""
+    return entry.get("snapshot_path") or entry.get("csv_path")
+
+def read_snapshot(path: str, columns=None) -> pd.DataFrame:
+    """
+    Load a snapshot, reading only `columns` when given.
+    """
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path, columns=list(columns) if columns is not None else None)
+    return pd.read_csv(path, usecols=list(columns) if columns is not None else None)
+
+def _downcast(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shrink a loaded frame: person/project and other repetitive text columns
+    become categoricals, whole-number columns the smallest integer type.
+    Fractional numbers stay float64 so totals are unchanged.
+    """
+    from intent_rules import find_person_column
+    from processor import detect_key_columns
+
+    columns = list(df.columns)
+    roles = detect_key_columns(columns)
+    entity_columns = {roles["person"], roles["project"], find_person_column(columns)} - {None}
+    for col in df.columns:
+        values = df[col]
+        if values.dtype == object or pd.api.types.is_string_dtype(values.dtype):
+            if col in entity_columns or values.nunique() <= max(1, len(values) * _CATEGORY_MAX_RATIO):
+                df[col] = values.astype('category')
+        elif pd.api.types.is_float_dtype(values.dtype):
+            if len(values) and values.notna().all() and (values % 1 == 0).all():
+                df[col] = pd.to_numeric(values, downcast='integer')
+        elif pd.api.types.is_integer_dtype(values.dtype):
+            df[col] = pd.to_numeric(values, downcast='integer')
+    return df
+
+def _covers(cached_columns, columns) -> bool:
+    """Whether a cached projection (None: every column) holds all of `columns`."""
+    return cached_columns is None or (columns is not None and set(columns) <= set(cached_columns))
+
+def _find_locked(version, columns):
+    """Cached frame of this dataset version holding `columns`, most recently used first (caller holds _frames_lock)."""
+    for frames in (_frames, _oversized):
+        for key in reversed(frames):
+            if key[:2] == version and _covers(key[2], columns):
+                frames.move_to_end(key)
+                return frames[key][0]
+    return None
+
+def get_dataframe(path: str, dataset_hash: str = None, columns=None) -> pd.DataFrame:
+    """
+    The snapshot as a downcast DataFrame shared by every session, cached by
+    dataset hash (or path) and snapshot version. With `columns` only those
+    are read; the frame returned may hold more (the whole frame or a wider
+    projection already cached), so select columns by name. The frame is
+    read-only: callers filter or copy it, never assign into it.
+    """
+    version = (dataset_hash or path, os.path.getmtime(path))
+    columns = tuple(dict.fromkeys(columns)) if columns is not None else None
+    key = version + (columns,)
+    with _frames_lock:
+        cached = _find_locked(version, columns)
+        if cached is not None:
+            _frame_stats["hits"] += 1
+            return cached
+        _frame_stats["misses"] += 1
+
+    df = _downcast(read_snapshot(path, columns=columns))
+    size = int(df.memory_usage(index=True, deep=True).sum())
+    budget = DATAFRAME_CACHE_MAX_MB * 1024 * 1024
+    with _frames_lock:
+        # Another session may have loaded it meanwhile; keep the first copy
+        cached = _find_locked(version, columns)
+        if cached is not None:
+            return cached
+        # Older versions of the dataset and projections this one supersedes
+        for frames, counter in ((_frames, "bytes"), (_oversized, "oversized_bytes")):
+            for stale in [k for k in frames if k[0] == version[0] and (k[1] != version[1] or _covers(columns, k[2]))]:
+                _frame_stats[counter] -= frames.pop(stale)[1]
+        if size > budget:
+            if DATAFRAME_CACHE_MAX_OVERSIZED <= 0:
+                print(f"Warning: {os.path.basename(path)} ({size / 1e6:.0f} MB) exceeds the DataFrame cache budget; not cached")
+                return df
+            while len(_oversized) >= DATAFRAME_CACHE_MAX_OVERSIZED:
+                _frame_stats["oversized_bytes"] -= _oversized.popitem(last=False)[1][1]
+                _frame_stats["evictions"] += 1
+            _oversized[key] = (df, size)
+            _frame_stats["oversized_bytes"] += size
+        else:
+            while _frames and _frame_stats["bytes"] + size > budget:
+                _frame_stats["bytes"] -= _frames.popitem(last=False)[1][1]
+                _frame_stats["evictions"] += 1
+            _frames[key] = (df, size)
+            _frame_stats["bytes"] += size
+    print(f"🗃️ Cached DataFrame for {dataset_hash or os.path.basename(path)} "
+          f"({len(df):,} rows, {len(df.columns)} columns, {size / 1e6:.1f} MB)")
+    return df
+
+def _drop_locked(*dataset_keys):
+    """Remove every cached version of the given datasets (caller holds _frames_lock)."""
+    for frames, counter in ((_frames, "bytes"), (_oversized, "oversized_bytes")):
+        for key in [k for k in frames if k[0] in dataset_keys]:
+            _frame_stats[counter] -= frames.pop(key)[1]
+
+def evict_dataframe(path: str = None, dataset_hash: str = None):
+    """Drop the cached frame of a dataset (call when it is deleted)."""
+    with _frames_lock:
+        _drop_locked(dataset_hash, path)
+
+def clear_dataframe_cache():
+    with _frames_lock:
+        _frames.clear()
+        _oversized.clear()
+        _frame_stats["bytes"] = 0
+        _frame_stats["oversized_bytes"] = 0
+
+def get_dataframe_cache_stats() -> dict:
+    """Hit/miss/eviction counters of this process plus the frames and bytes held (within and over budget)."""
+    with _frames_lock:
+        stats = dict(_frame_stats)
+        stats["entries"] = len(_frames)
+        stats["oversized_entries"] = len(_oversized)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+    stats["budget_bytes"] = DATAFRAME_CACHE_MAX_MB * 1024 * 1024
+    return stats
+
+def _contains(values: pd.Series, text: str) -> np.ndarray:
+    """Case-insensitive substring match; categoricals are matched once per distinct value."""
+    text = text.lower()
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        matched = np.append(values.cat.categories.astype(str).str.lower().str.contains(text, regex=False), False)
+        return matched[values.cat.codes.to_numpy()]  # code -1 (missing) -> the appended False
+    return values.astype(str).str.lower().str.contains(text, regex=False).to_numpy()
+
+def filter_mask(df: pd.DataFrame, search: str = None, filters: dict = None) -> np.ndarray:
+    """
+    Rows whose text columns contain `search` (any of them) and whose
+    `filters` columns contain the given text ({column: text}).
+    """
+    mask = np.ones(len(df), dtype=bool)
+    if search:
+        text_cols = [c for c in df.columns if not pd.api.types.is_numeric_dtype(df[c].dtype)]
+        found = np.zeros(len(df), dtype=bool)
+        for col in text_cols:
+            found |= _contains(df[col], search)
+        mask &= found
+    for col, text in (filters or {}).items():
+        if col in df.columns and text:
+            mask &= _contains(df[col], str(text))
+    return mask
+
+def get_page(df: pd.DataFrame, mask=None, sort_by: str = None, ascending: bool = True,
+             page: int = 1, page_size: int = 100, columns=None):
+    """
+    (rows of one page, number of matching rows) of a filtered, sorted frame.
+    Only the page is copied out of the (shared) frame.
+    """
+    index = np.flatnonzero(mask) if mask is not None else np.arange(len(df))
+    if sort_by and sort_by in df.columns and len(index):
+        order = df[sort_by].iloc[index].reset_index(drop=True).sort_values(
+            ascending=ascending, kind="stable", na_position="last").index.to_numpy()
+        index = index[order]
+    start = max(page - 1, 0) * page_size
+    rows = df.iloc[index[start:start + page_size]]
+    if columns:
+        rows = rows[[c for c in columns if c in df.columns]]
+    return rows, len(index)
+
+def export_filtered_csv(df: pd.DataFrame, out_path: str, mask=None, columns=None) -> int:
+    """
+    Write the rows of the (shared) frame selected by `mask` to a CSV file in
+    file order, batch by batch, so the filtered slice is never copied whole.
+    Pass the same frame and mask as the on-screen page so both show the same
+    rows. Returns the number of rows written.
+    """
+    index = np.flatnonzero(mask) if mask is not None else np.arange(len(df))
+    positions = [df.columns.get_loc(c) for c in columns if c in df.columns] if columns else list(range(df.shape[1]))
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        if not len(index):
+            df.iloc[:0, positions].to_csv(f, index=False)
+        for start in range(0, len(index), _BATCH_ROWS):
+            df.iloc[index[start:start + _BATCH_ROWS], positions].to_csv(f, index=False, header=(start == 0))
+    return len(index)
+
+def new_export_path(export_dir: str) -> str:
+    """
+    A fresh CSV path in a user's export directory. Exports older than
+    RAW_EXPORT_MAX_AGE_SECONDS (left behind by an interrupted download) are removed first.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    cutoff = time.time() - RAW_EXPORT_MAX_AGE_SECONDS
+    for name in os.listdir(export_dir):
+        path = os.path.join(export_dir, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass  # removed by another session meanwhile
+    return os.path.join(export_dir, f"export_{uuid.uuid4().hex}.csv")
+
+def remove_export(path: str):
+    """Delete a prepared export (after it was served or when it is replaced)."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def read_snapshot_head(path: str, n: int = 20) -> pd.DataFrame:
+    """First `n` rows without loading the file (samples for intent classification)."""
+    if not path.endswith(".parquet"):
+        return pd.read_csv(path, nrows=n)
+    import pyarrow.parquet as pq
+    parquet_file = pq.ParquetFile(path)
+    batch = next(parquet_file.iter_batches(batch_size=n), None)
+    if batch is None:
+        return parquet_file.schema_arrow.empty_table().to_pandas()
+    return batch.to_pandas()
+
+def snapshot_schema(path: str) -> dict:
+    """
+    Column layout from file metadata only: {"columns", "numeric", "text", "num_rows"}.
+    """
+    if not path.endswith(".parquet"):
+        df = pd.read_csv(path)
+        return {
+            "columns": df.columns.tolist(),
+            "numeric": df.select_dtypes(include=['number']).columns.tolist(),
+            "text": df.select_dtypes(include=['object']).columns.tolist(),
+            "num_rows": len(df),
+        }
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    parquet_file = pq.ParquetFile(path)
+    schema = parquet_file.schema_arrow
+    return {
+        "columns": schema.names,
+        "numeric": [f.name for f in schema if pa.types.is_integer(f.type) or pa.types.is_floating(f.type)],
+        "text": [f.name for f in schema if pa.types.is_string(f.type) or pa.types.is_large_string(f.type)],
+        "num_rows": parquet_file.metadata.num_rows,
+    }
+
+def ensure_parquet_snapshot(entry: dict, username) -> dict:
+    """
+    Migration path for registry entries created before Parquet snapshots:
+    convert the CSV copy once, update the registry and remove the CSV.
+    Returns the (possibly updated) entry.
+    """
+    csv_path = entry.get("csv_path")
+    if entry.get("snapshot_path") or not csv_path or not os.path.exists(csv_path):
+        return entry
+
+    from app_config import update_registry_entry
+
+    parquet_path = os.path.splitext(csv_path)[0] + ".parquet"
+    df = pd.read_csv(csv_path)
+    write_snapshot(df, parquet_path)
+
+    migrated = {k: v for k, v in entry.items() if k != "csv_path"}
+    migrated["snapshot_path"] = parquet_path
+    migrated.setdefault("row_count", len(df))
+    update_registry_entry(migrated, username)
+    os.remove(csv_path)
+    print(f"Migrated snapshot {csv_path} -> {parquet_path}")
+    return migrated
+
+def migrate_registry_snapshots(username) -> int:
+    """Convert every legacy CSV snapshot of a user. Returns the number migrated."""
+    from app_config import get_dataset_registry
+    migrated = 0
+    for entry in get_dataset_registry(username)["datasets"]:
+        if ensure_parquet_snapshot(entry, username) is not entry:
+            migrated += 1
+    return migrated
@@ -0,0 +1,261 @@
+"""
+Prepared per-dataset views for the structured query executor.
+
+The router used to re-derive the same things on every question: billable
+status parsed from every project string, cleaned project names, two
+DataFrame copies and difflib column matching. A DatasetView computes them
+once per dataset (on first load; cached by dataset hash and snapshot
+version) so lookups become boolean-mask operations on the cached frame:
+
+    billable      categorical Yes/No/Unknown Series (or None)
+    billable_column  the dedicated billable column it was parsed from (or None)
+    project_clean categorical project names without billable suffixes
+    lower(col)    lower-cased distinct values of a column + row codes (built on first use)
+    column(name)  requested name -> actual column via a precomputed alias map
+    dates(col)    parsed datetimes of a date column (built on first use)
+"""
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from app_config import DATASET_VIEW_CACHE_SIZE
+
+BILLABLE = "billable"  # virtual column name used by intents
+PERSON_ALIASES = ['user', 'users', 'employee', 'employees', 'person', 'people', 'name', 'staff']
+DURATION_ALIASES = ['hours', 'hour', 'time', 'duration', 'time_(decimal)', 'duration_(decimal)']
+_TRUE_VALUES = {'yes', 'true', '1', 'y', 'billable'}
+_FALSE_VALUES = {'no', 'false', '0', 'n', 'non-billable', 'non billable', 'nonbillable'}
+
+_views = OrderedDict()  # (dataset key, snapshot mtime) -> DatasetView (LRU)
+_views_lock = threading.Lock()
+
+
+def parse_billable(name):
+    """Yes/No/Unknown from a project name with an embedded billable suffix."""
+    name_lower = str(name).lower()
+    if 'non-billable' in name_lower or 'non billable' in name_lower:
+        return 'No'
+    elif 'billable' in name_lower:
+        return 'Yes'
+    return 'Unknown'
+
+def extract_billable_status(df):
+    """Smart billable detection - handles multiple formats including 'Project : Billable'"""
+
+    # Method 1: Dedicated billable column (standard format)
+    # Check for 'billable' or 'is_billable'
+    billable_cols = [c for c in df.columns if 'billable' in c and 'rate' not in c and 'amount' not in c]
+    if billable_cols:
+        col = billable_cols[0]
+        return df[col], 'column'
+
+    # Method 2: Extract from project name pattern (embedded format)
+    if 'project' in df.columns:
+        # Check first 20 rows for pattern
+        sample = df['project'].head(20).astype(str)
+        if any('billable' in p.lower() for p in sample):
+            return df['project'].apply(parse_billable), 'embedded'
+
+    # Method 3: Not found - use RAG
+    return None, 'none'
+
+def clean_project_name(name):
+    """Remove billable suffix from project names if present"""
+    # Example: "Koradream : Fixed Cost : Billable" → "Koradream"
+    name_str = str(name)
+    if ':' in name_str:
+        return name_str.split(':')[0].strip()
+    return name_str
+
+def find_column(columns, col_name):
+    """Fuzzy match a column name requested by the intent to an actual column"""
+    from difflib import get_close_matches
+
+    col_name_lower = str(col_name).lower()
+    # Direct match (case-insensitive)
+    for c in columns:
+        if str(c).lower() == col_name_lower:
+            return c
+    # Partial match
+    for c in columns:
+        if col_name_lower in str(c).lower() or str(c).lower() in col_name_lower:
+            return c
+    # Fuzzy match
+    matches = get_close_matches(col_name_lower,
+                               [str(c).lower() for c in columns],
+                               n=1, cutoff=0.6)
+    if matches:
+        for c in columns:
+            if str(c).lower() == matches[0]:
+                return c
+    return None
+
+
+def _normalize_name(name) -> str:
+    return re.sub(r"[\s_]+", "_", str(name).strip().lower())
+
+def _yes_no(value) -> str:
+    text = str(value).strip().lower()
+    return 'Yes' if text in _TRUE_VALUES else 'No' if text in _FALSE_VALUES else 'Unknown'
+
+def _map_distinct(values: pd.Series, func, dtype=None) -> pd.Series:
+    """Apply `func` once per distinct value (not per row); categorical result."""
+    categories = values.astype('category')
+    mapped = categories.map({c: func(c) for c in categories.cat.categories})
+    return mapped.astype(dtype or 'category')
+
+def _parse_dates(values: pd.Series) -> pd.Series:
+    parsed = pd.to_datetime(values, format='%B %d, %Y', errors='coerce')
+    if parsed.isna().all() and values.notna().any():
+        parsed = pd.to_datetime(values, errors='coerce')
+    return parsed
+
+
+class DatasetView:
+    """Cached frame of one dataset plus the derived columns the executor filters on."""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        yes_no = pd.CategoricalDtype(['Yes', 'No', 'Unknown'])
+        # Same detection as extract_billable_status, but each distinct value is parsed once
+        self.billable, self.billable_format, self.billable_column = None, 'none', None
+        billable_cols = [c for c in df.columns if 'billable' in c and 'rate' not in c and 'amount' not in c]
+        if billable_cols:
+            self.billable_column = billable_cols[0]
+            self.billable = _map_distinct(df[billable_cols[0]].astype(str), _yes_no, yes_no)
+            self.billable_format = 'column'
+        elif 'project' in df.columns and any('billable' in str(p).lower() for p in df['project'].head(20)):
+            self.billable = _map_distinct(df['project'].astype(str), parse_billable, yes_no)
+            self.billable_format = 'embedded'
+
+        self.project_clean = None
+        if 'project' in df.columns:
+            self.project_clean = _map_distinct(df['project'].astype(str), clean_project_name)
+
+        from processor import is_date_column
+        date_columns = [c for c in df.columns if is_date_column(c)]
+        self.date_column = next((c for c in date_columns if 'start' in c), date_columns[0] if date_columns else None)
+
+        self._lower = {}
+        self._dates = {}
+        self._lock = threading.Lock()
+        self.aliases = self._build_aliases()
+
+    def _build_aliases(self) -> dict:
+        columns = list(self.df.columns)
+        aliases = {}
+        for c in columns:
+            name = _normalize_name(c)
+            aliases.setdefault(name, c)
+            aliases.setdefault(re.sub(r"[()]", "", name), c)
+        person = next((c for c in ['user', 'employee', 'name', 'person'] if c in columns), None)
+        duration = next((c for c in ['duration_(decimal)', 'duration_decimal', 'time_(decimal)', 'hours', 'time_decimal']
+                         if c in columns), None)
+        for alias in PERSON_ALIASES:
+            if person:
+                aliases.setdefault(alias, person)
+        for alias in DURATION_ALIASES:
+            if duration:
+                aliases.setdefault(_normalize_name(alias), duration)
+        if 'project' in columns:
+            aliases.setdefault('projects', 'project')
+        return aliases
+
+    def column(self, name):
+        """Actual column for a requested name (alias map first, fuzzy match memoized)."""
+        key = _normalize_name(name)
+        if key not in self.aliases:
+            self.aliases[key] = find_column(self.df.columns, name)
+        return self.aliases[key]
+
+    def lower(self, col):
+        """
+        (row codes, lower-cased distinct values) of a column as text, computed on
+        first use; text filters then match each distinct value once.
+        """
+        with self._lock:
+            if col not in self._lower:
+                categories = self.df[col].astype(str).astype('category')
+                self._lower[col] = (categories.cat.codes.to_numpy(),
+                                    categories.cat.categories.str.lower())
+            return self._lower[col]
+
+    def dates(self, col) -> pd.Series:
+        """Datetimes of a date column (snapshots store them as "March 04, 2024"); NaT if unparseable."""
+        with self._lock:
+            if col not in self._dates:
+                values = self.df[col]
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    # Parse each distinct date once (shared frames store dates as categoricals)
+                    categories = pd.Series(values.cat.categories)
+                    parsed = pd.DatetimeIndex(_parse_dates(categories))
+                    parsed = pd.Series(parsed.take(values.cat.codes.to_numpy(), allow_fill=True), index=values.index)
+                else:
+                    parsed = _parse_dates(values)
+                self._dates[col] = parsed
+            return self._dates[col]
+
+    def mask(self, filters: dict):
+        """Boolean row mask for intent filters (exact billable match, substring text match)."""
+        mask = np.ones(len(self.df), dtype=bool)
+        for filter_col, filter_val in filters.items():
+            if str(filter_col).lower() == BILLABLE and self.billable is not None:
+                target = _yes_no(filter_val)
+                mask &= (self.billable == target).to_numpy()
+                print(f"Applying filter: billable = {target}")
+            else:
+                actual_col = self.column(filter_col)
+                if actual_col is None:
+                    print(f"Warning: Could not find column '{filter_col}' in DataFrame")
+                    continue
+                print(f"Applying filter: {actual_col} = {filter_val}")
+                if isinstance(filter_val, str):
+                    # Partial match for project names and other text fields
+                    codes, values = self.lower(actual_col)
+                    mask &= np.asarray(values.str.contains(filter_val.lower(), regex=False))[codes]
+                else:
+                    mask &= (self.df[actual_col] == filter_val).to_numpy()
+            print(f"After filter: {int(mask.sum())} rows remaining")
+        return mask
+
+
+def get_dataset_view(snapshot_path: str, dataset_hash: str = None) -> DatasetView:
+    """
+    The prepared view of a dataset, built on first use and cached by dataset
+    hash (or snapshot path) and snapshot version, so re-ingested or appended
+    datasets are rebuilt. Views wrap the shared frame of get_dataframe and are
+    rebuilt if that frame was evicted and reloaded.
+    """
+    from dataset_store import get_dataframe
+
+    key = (dataset_hash or snapshot_path, os.path.getmtime(snapshot_path))
+    df = get_dataframe(snapshot_path, dataset_hash)
+    with _views_lock:
+        view = _views.get(key)
+        if view is not None and view.df is df:
+            _views.move_to_end(key)
+            return view
+
+    view = DatasetView(df)
+    with _views_lock:
+        for stale in [k for k in _views if k[0] == key[0]]:
+            del _views[stale]
+        _views[key] = view
+        while len(_views) > DATASET_VIEW_CACHE_SIZE:
+            _views.popitem(last=False)
+    print(f"🧮 Prepared dataset view for {dataset_hash or os.path.basename(snapshot_path)} ({len(view.df):,} rows)")
+    return view
+
+def evict_dataset_view(snapshot_path: str = None, dataset_hash: str = None):
+    """Drop cached views of a dataset (call when it is deleted)."""
+    with _views_lock:
+        for key in [k for k in _views if k[0] in (dataset_hash, snapshot_path)]:
+            del _views[key]
+
+def clear_dataset_views():
+    with _views_lock:
+        _views.clear()
@@ -0,0 +1,145 @@
+"""
+Small persistent key/value cache on SQLite with LRU eviction and optional TTL.
+
+Used for content-addressed caches that should survive restarts (embedding
+vectors keyed by sentence hash, classified chat intents). One file can be shared by several processes;
+WAL mode keeps readers from blocking the writer.
+"""
+import os
+import sqlite3
+import threading
+import time
+
+
+class SqliteLRUCache:
+    """
+    Bytes-valued cache capped at `max_entries`; least recently used keys are
+    evicted first, in batches of `evict_fraction` of the cap so a full cache
+    does not delete on every put. With `ttl_seconds`, entries older than that
+    are treated as missing and removed by a sweep at most every
+    `_SWEEP_SECONDS`. Hit/miss/eviction counters are kept per process.
+    """
+
+    # SQLite's default limit on bound parameters is 999 on older builds
+    _BATCH = 500
+    # Expired rows are deleted (and the entry count re-read, since other
+    # processes may share the file) at most this often
+    _SWEEP_SECONDS = 60.0
+
+    def __init__(self, path: str, max_entries: int, ttl_seconds: float = None, evict_fraction: float = 0.1):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.evict_fraction = evict_fraction
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY, value BLOB NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_last_used ON cache(last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_created_at ON cache(created_at)")
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        self._last_sweep = time.time()
+
+    def get_many(self, keys) -> dict:
+        """Bulk lookup; returns {key: value} for the keys that are present."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock:
+            self._sweep_locked(now)
+            # Rows past their TTL but not swept yet are skipped here
+            oldest = now - self.ttl_seconds if self.ttl_seconds is not None else float("-inf")
+            for i in range(0, len(keys), self._BATCH):
+                batch = keys[i:i + self._BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, value FROM cache WHERE key IN ({placeholders}) AND created_at >= ?",
+                    batch + [oldest]
+                ).fetchall()
+                found.update(rows)
+            if found:
+                self._conn.executemany(
+                    "UPDATE cache SET last_used = ? WHERE key = ?", [(now, k) for k in found]
+                )
+                self._conn.commit()
+            self._stats["hits"] += len(found)
+            self._stats["misses"] += len(keys) - len(found)
+        return found
+
+    def put_many(self, items: dict):
+        """Insert or refresh entries; past max_entries, evict a batch of the least recently used."""
+        if not items:
+            return
+        now = time.time()
+        keys = list(items)
+        with self._lock:
+            self._sweep_locked(now)
+            # Refreshed keys replace their row, so only new keys add to the count
+            present = 0
+            for i in range(0, len(keys), self._BATCH):
+                batch = keys[i:i + self._BATCH]
+                placeholders = ",".join("?" * len(batch))
+                present += self._conn.execute(
+                    f"SELECT COUNT(*) FROM cache WHERE key IN ({placeholders})", batch
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                [(k, sqlite3.Binary(v), now, now) for k, v in items.items()]
+            )
+            self._entries += len(keys) - present
+            if self._entries > self.max_entries:
+                self._evict_locked()
+            self._conn.commit()
+
+    def _sweep_locked(self, now):
+        """Every _SWEEP_SECONDS: delete expired rows and re-read the entry count."""
+        if now - self._last_sweep < self._SWEEP_SECONDS:
+            return
+        self._last_sweep = now
+        if self.ttl_seconds is not None:
+            expired = self._conn.execute(
+                "DELETE FROM cache WHERE created_at < ?", (now - self.ttl_seconds,)
+            ).rowcount
+            if expired > 0:
+                self._conn.commit()
+                self._stats["expired"] += expired
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+    def _evict_locked(self):
+        # The count is exact here (other processes may have written since the last sweep)
+        count = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        target = self.max_entries - int(self.max_entries * self.evict_fraction)
+        overflow = count - target if count > self.max_entries else 0
+        if overflow > 0:
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY last_used LIMIT ?)",
+                (overflow,)
+            )
+            self._stats["evictions"] += overflow
+            count -= overflow
+        self._entries = count
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+            self._conn.commit()
+            self._entries = 0
+
+    def __len__(self):
+        # As of this process's last write (other processes may have added more)
+        return self._entries
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["entries"] = self._entries
+        return stats
@@ -0,0 +1,196 @@
+"""
+Process-wide embedding service.
+
+Ingest, retrieval and any other caller share one warm copy of EMBEDDING_MODEL
+per process instead of reloading it for every upload and every chat question.
+The model loads lazily on first use (or in the background via
+prewarm_embeddings()) and the service keeps load/encode counters.
+
+Document embeddings go through a persistent content-addressed cache keyed by
+hash(model name, sentence text), so re-uploading overlapping exports only
+encodes the sentences that were never seen before.
+
+EMBEDDING_BACKEND selects PyTorch (sentence-transformers) or ONNX Runtime
+inference (onnx_embeddings.py); an ONNX backend that cannot be loaded or
+fails its parity check falls back to PyTorch. Every dataset records the
+embedding space it was built in (SharedEmbeddings.space); retrieval and
+appends refuse datasets from another space instead of mixing vectors.
+"""
+import hashlib
+import threading
+import time
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from app_config import (
+    EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_CACHE_ENABLED, EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES
+)
+
+
+class SharedEmbeddings(Embeddings):
+    """
+    Thread-safe LangChain Embeddings wrapper around a single lazily loaded model.
+    Encode calls are serialized: the HF fast tokenizer is not safe to share
+    across threads, and the model already uses every core per call.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL, cache=None, backend: str = EMBEDDING_BACKEND):
+        self.model_name = model_name
+        self.cache = cache
+        self.backend = backend
+        self._model = None
+        self._load_lock = threading.Lock()
+        self._encode_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "load_seconds": 0.0,
+            "encode_calls": 0,
+            "texts_encoded": 0,
+            "encode_seconds": 0.0,
+        }
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
+
+    def load(self):
+        """Load the model if needed and return it (safe to call concurrently)."""
+        if self._model is None:
+            with self._load_lock:
+                if self._model is None:
+                    start = time.perf_counter()
+                    model = None
+                    if self.backend != "torch":
+                        try:
+                            from onnx_embeddings import load_onnx_backend
+                            model = load_onnx_backend(self.model_name, self.backend)
+                        except Exception as e:
+                            print(f"⚠️ {self.backend} embedding backend unavailable, using PyTorch: {e}")
+                            self.backend = "torch"
+                    if model is None:
+                        from langchain_huggingface import HuggingFaceEmbeddings
+                        model = HuggingFaceEmbeddings(model_name=self.model_name)
+                    elapsed = time.perf_counter() - start
+                    with self._stats_lock:
+                        self._stats["load_seconds"] = elapsed
+                    print(f"🧩 Embedding model loaded in {elapsed:.2f}s ({self.model_name}, {self.backend})")
+                    self._model = model
+        return self._model
+
+    def _encode(self, fn, texts_count: int):
+        model = self.load()
+        start = time.perf_counter()
+        with self._encode_lock:
+            result = fn(model)
+        elapsed = time.perf_counter() - start
+        with self._stats_lock:
+            self._stats["encode_calls"] += 1
+            self._stats["texts_encoded"] += texts_count
+            self._stats["encode_seconds"] += elapsed
+        return result
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        if not texts:
+            return []
+        if self.cache is None:
+            return self._encode(lambda model: model.embed_documents(texts), len(texts))
+
+        if self.backend != "torch":
+            # Resolve a possible fallback to PyTorch first: it changes the cache namespace
+            self.load()
+        # Bulk cache lookup, then encode only the misses (each distinct text once)
+        keys = [self.cache_key(t) for t in texts]
+        cached = self.cache.get_many(keys)
+        vectors = {k: np.frombuffer(v, dtype=np.float32).tolist() for k, v in cached.items()}
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors:
+                missing.setdefault(key, text)
+        if missing:
+            miss_keys = list(missing)
+            encoded = self._encode(lambda model: model.embed_documents(list(missing.values())), len(missing))
+            self.cache.put_many({
+                k: np.asarray(vec, dtype=np.float32).tobytes() for k, vec in zip(miss_keys, encoded)
+            })
+            vectors.update(zip(miss_keys, encoded))
+
+        return [vectors[k] for k in keys]
+
+    @property
+    def space(self) -> str:
+        """
+        Vector space this service encodes into. fp32 ONNX output matches PyTorch
+        (parity-checked) and shares it; int8 vectors are a space of their own.
+        Call load() first: a failing ONNX backend falls back to PyTorch.
+        """
+        return f"{self.model_name}@{self.backend}" if self.backend == "onnx-int8" else self.model_name
+
+    def cache_key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.space}\x00{text}".encode("utf-8")).hexdigest()
+
+    def embed_query(self, text):
+        return self._encode(lambda model: model.embed_query(text), 1)
+
+    def get_stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["model"] = self.model_name
+        stats["backend"] = self.backend
+        stats["loaded"] = self.loaded
+        stats["cache"] = self.cache.get_stats() if self.cache is not None else None
+        return stats
+
+
+_service = None
+_service_lock = threading.Lock()
+_prewarm_thread = None
+
+
+def get_embedding_model() -> SharedEmbeddings:
+    """The shared embedding service for this process."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                cache = None
+                if EMBEDDING_CACHE_ENABLED:
+                    from disk_cache import SqliteLRUCache
+                    cache = SqliteLRUCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_ENTRIES)
+                _service = SharedEmbeddings(EMBEDDING_MODEL, cache=cache)
+    return _service
+
+def prewarm_embeddings():
+    """
+    Start loading the model in a background thread (no-op once started or loaded),
+    so the first upload or question does not pay the load time.
+    """
+    global _prewarm_thread
+    service = get_embedding_model()
+    with _service_lock:
+        if service.loaded or _prewarm_thread is not None:
+            return
+        _prewarm_thread = threading.Thread(target=_prewarm, args=(service,), name="embedding-prewarm", daemon=True)
+        _prewarm_thread.start()
+
+def _prewarm(service):
+    try:
+        service.load()
+    except Exception as e:
+        # First real use will retry and surface the error
+        print(f"Embedding pre-warm failed: {e}")
+
+def get_embedding_stats() -> dict:
+    return get_embedding_model().get_stats()
+
+def dataset_embedding_space(entry: dict) -> str:
+    """Space a registered dataset was embedded in (entries from before it was recorded used PyTorch)."""
+    return entry.get("embedding_space") or EMBEDDING_MODEL
+
+def clear_embedding_cache():
+    """Forget every cached vector (node-wide; see `python vector_store.py clear-caches`)."""
+    service = get_embedding_model()
+    if service.cache is not None:
+        service.cache.clear()
@@ -1,78 +1,450 @@
 import fix_sqlite
 import os
 import hashlib
-import json
 from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from processor import clean_and_serialize
-from app_config import PERSIST_DIRECTORY, EMBEDDING_MODEL, get_user_storage_paths
+from processor import (
+    clean_and_serialize, iter_serialized_batches, attach_row_keys, dedupe_sentences, merged_metadata,
+    record_coverage, diff_records, split_records, scan_column_dtypes, peek_schema_fingerprint
+)
+from dataset_store import write_snapshot, SnapshotWriter
+from aggregate_cube import build_cube
+from embeddings import get_embedding_model, dataset_embedding_space
+from vector_store import (
+    get_client, close_client, get_store_path, collection_name_for, get_collection_name,
+    drop_collection, delete_dataset_vectors, LEGACY_COLLECTION
+)
+from app_config import (
+    PERSIST_DIRECTORY, STREAMING_THRESHOLD_MB, STREAM_CHUNK_ROWS, STORAGE_MODE,
+    APPEND_MODE_ENABLED, APPEND_MIN_COVERAGE, VECTOR_QUANTIZATION, DEDUP_SENTENCES, get_user_storage_paths,
+    get_schema_profiles, save_schema_profiles, update_registry_entry
+)
 
 def get_file_hash(file_bytes):
     return hashlib.md5(file_bytes).hexdigest()
+
+def get_stream_hash(file_obj, block_size=1024 * 1024):
+    """MD5 of a file-like object read in blocks, so the upload is never copied whole."""
+    file_obj.seek(0)
+    digest = hashlib.md5()
+    for block in iter(lambda: file_obj.read(block_size), b""):
+        digest.update(block)
+    file_obj.seek(0)
+    return digest.hexdigest()
+
+class LocalUpload:
+    """
+    A file on disk opened like a Streamlit UploadedFile (binary, with `.name`
+    and `.size`), so background jobs and the CLI can call ingest_dataset.
+    """
+
+    def __init__(self, path, name=None):
+        self._file = open(path, "rb")
+        self.name = name or os.path.basename(path)
+        self.size = os.path.getsize(path)
+
+    def __getattr__(self, attr):
+        return getattr(self._file, attr)
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def close(self):
+        self._file.close()
+
+def get_upload_size(file_obj):
+    size = getattr(file_obj, "size", None)
+    if size is None:
+        file_obj.seek(0, os.SEEK_END)
+        size = file_obj.tell()
+        file_obj.seek(0)
+    return size
 def is_already_ingested(current_hash, username):
-    from app_config import get_dataset_registry
-    registry = get_dataset_registry(username)
-    for dataset in registry["datasets"]:
-        if dataset["hash"] == current_hash:
-            return True
-    return False
-
-def save_dataset_to_registry(current_hash, db_path, filename, df, username):
-    from app_config import get_dataset_registry, get_user_storage_paths
+    from app_config import find_registry_entry
+    return find_registry_entry(current_hash, username) is not None
+
+def new_snapshot_path(filename, username):
+    """Generate a unique path for the cleaned Parquet snapshot to prevent overwrite"""
+    import time
+    user_paths = get_user_storage_paths(username)
+    stem = os.path.splitext(filename.replace(' ', '_'))[0]
+    return os.path.join(user_paths["metadata"], f"data_{int(time.time())}_{stem}.parquet")
+
+def save_dataset_to_registry(current_hash, db_path, filename, df, username, snapshot_path=None,
+                             schema_fingerprint=None, row_count=None, collection=None, vector_quantization=None,
+                             embedding_space=None):
+    """
+    Register a dataset. Pass `snapshot_path` instead of `df` when the snapshot was
+    already written (streaming ingestion writes it chunk by chunk).
+    `collection` is set for datasets stored in a shared vector store,
+    `vector_quantization` for datasets stored in a QuantizedVectorStore,
+    `embedding_space` is the space its vectors were encoded in (SharedEmbeddings.space).
+    """
+    from app_config import get_user_storage_paths, update_registry_entry
     
     user_paths = get_user_storage_paths(username)
     os.makedirs(user_paths["metadata"], exist_ok=True)
     
-    registry = get_dataset_registry(username)
-    
-    # Generate a unique path for the CSV to prevent overwrite
-    import time
-    csv_filename = f"data_{int(time.time())}_{filename.replace(' ', '_')}"
-    if not csv_filename.endswith(".csv"):
-        csv_filename += ".csv"
-    csv_path = os.path.join(user_paths["metadata"], csv_filename)
-    
-    # Save CSV
-    df.to_csv(csv_path, index=False)
+    if snapshot_path is None:
+        snapshot_path = write_snapshot(df, new_snapshot_path(filename, username))
     
     # Add to registry
     new_entry = {
         "filename": filename,
         "db_path": db_path,
-        "csv_path": csv_path,
-        "hash": current_hash
+        "snapshot_path": snapshot_path,
+        "hash": current_hash,
+        "schema_fingerprint": schema_fingerprint or (df.attrs.get("schema_fingerprint") if df is not None else None),
+        "row_count": row_count if row_count is not None else len(df)
     }
+    if collection:
+        new_entry["collection"] = collection
+    if vector_quantization:
+        new_entry["vector_quantization"] = vector_quantization
+    if embedding_space:
+        new_entry["embedding_space"] = embedding_space
     
-    # Remove existing entry if it's the same hash (update scenario)
-    registry["datasets"] = [d for dataset in [registry["datasets"]] for d in dataset if d["hash"] != current_hash]
-    registry["datasets"].append(new_entry)
-    
-    with open(user_paths["hash_file"], "w") as f:
-        json.dump(registry, f)
+    # Replaces an existing entry with the same hash (update scenario), atomically
+    update_registry_entry(new_entry, username)
+    build_dataset_cube(snapshot_path)
     
     return new_entry
 
-def ingest_dataset(uploaded_file, file_bytes, username):
-    current_hash = get_file_hash(file_bytes)
+def build_dataset_cube(snapshot_path):
+    """Precompute the dashboard/lookup aggregates (rebuilt lazily by get_cube if this fails)."""
+    try:
+        build_cube(snapshot_path)
+    except Exception as e:
+        print(f"Warning: aggregate cube not built for {snapshot_path}: {e}")
+
+def estimate_total_rows(uploaded_file, rows_done, file_size):
+    """
+    Extrapolate a streamed CSV's row count from how far into the file the
+    reader is. None when unknown (Excel is read through a zip container).
+    """
+    if not uploaded_file.name.endswith(".csv") or not file_size:
+        return None
+    try:
+        position = uploaded_file.tell()
+    except Exception:
+        return None
+    if position <= 0:
+        return None
+    return max(rows_done, int(rows_done * file_size / position))
+
+def _batch_records(sentences, metadatas, chunk, seen_keys, groups):
+    """
+    Records of one streamed batch: (sentences, metadatas, ids, ids of records
+    from earlier batches whose metadata grew). Pass the same `seen_keys` and
+    `groups` dicts for every batch of a file.
+    """
+    if DEDUP_SENTENCES:
+        return dedupe_sentences(sentences, metadatas, groups)
+    return sentences, metadatas, attach_row_keys(sentences, metadatas, chunk, seen_keys), []
+
+def scan_record_ids(uploaded_file, schema_profiles=None, dtypes=None):
+    """
+    Record ids of a streamed upload without embedding anything (a first pass
+    used to find the dataset it is a newer export of). Returns a set.
+    """
+    seen_keys, groups, record_ids = {}, {}, set()
+    for sentences, metadatas, chunk in iter_serialized_batches(uploaded_file, schema_profiles=schema_profiles,
+                                                               dtypes=dtypes):
+        record_ids.update(_batch_records(sentences, metadatas, chunk, seen_keys, groups)[2])
+    return record_ids
+
+def stream_into_collection(uploaded_file, vectorstore, snapshot_path, schema_profiles=None, progress_callback=None,
+                           dtypes=None):
+    """
+    Embed and store the upload batch by batch, appending each cleaned chunk to
+    the Parquet snapshot as it goes. Peak memory is one batch regardless of file size.
+    `progress_callback(rows_done, rows_total)` is called after every batch.
+    With DEDUP_SENTENCES a sentence already stored by an earlier batch is not
+    embedded again; its record's row_count/row_indices are re-synced at the end.
+    Returns (rows ingested, schema fingerprint).
+    """
+    writer = SnapshotWriter(snapshot_path)
+    schema_fingerprint = None
+    seen_keys = {}
+    groups = {}
+    stale_ids = set()
+    file_size = get_upload_size(uploaded_file) if progress_callback else None
+    try:
+        for sentences, metadatas, chunk in iter_serialized_batches(uploaded_file, schema_profiles=schema_profiles,
+                                                                   dtypes=dtypes):
+            sentences, metadatas, ids, updated = _batch_records(sentences, metadatas, chunk, seen_keys, groups)
+            stale_ids.update(updated)
+            if sentences:
+                vectorstore.add_texts(texts=sentences, metadatas=metadatas, ids=ids)
+            writer.write(chunk)
+            schema_fingerprint = chunk.attrs.get("schema_fingerprint")
+            if progress_callback:
+                progress_callback(writer.rows, estimate_total_rows(uploaded_file, writer.rows, file_size))
+        stale_ids = list(stale_ids)
+        for start in range(0, len(stale_ids), STREAM_CHUNK_ROWS):
+            batch = stale_ids[start:start + STREAM_CHUNK_ROWS]
+            update_record_metadatas(vectorstore, batch, [merged_metadata(groups[i]) for i in batch])
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    return writer.rows, schema_fingerprint
+
+def update_record_metadatas(vectorstore, ids, metadatas):
+    """Replace the metadata of stored records without re-embedding them."""
+    if hasattr(vectorstore, "update_metadatas"):
+        vectorstore.update_metadatas(ids, metadatas)  # QuantizedVectorStore
+    else:
+        vectorstore._collection.update(ids=ids, metadatas=metadatas)
+
+def get_collection_content_hashes(collection, page_size=STREAM_CHUNK_ROWS):
+    """{record_id: content_hash} for every record in a collection, read page by page."""
+    hashes = {}
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=page_size, offset=offset)
+        ids = page.get("ids") or []
+        for record_id, metadata in zip(ids, page.get("metadatas") or []):
+            hashes[record_id] = (metadata or {}).get("content_hash")
+        if len(ids) < page_size:
+            return hashes
+        offset += page_size
+
+def append_candidates(schema_fingerprint, username, embedding_space):
+    """Registered datasets (newest first) an upload with this layout could be appended to."""
+    from app_config import get_dataset_registry
+    if not schema_fingerprint:
+        return []
+    candidates = []
+    for entry in reversed(get_dataset_registry(username)["datasets"]):
+        if entry.get("schema_fingerprint") != schema_fingerprint or not entry.get("snapshot_path"):
+            continue
+        if entry.get("vector_quantization"):
+            # Quantized stores are append-only files; a new export is ingested as a new dataset
+            continue
+        if dataset_embedding_space(entry) != embedding_space:
+            print(f"Not appending to {entry['filename']}: embedded as {dataset_embedding_space(entry)}, "
+                  f"the backend now produces {embedding_space}")
+            continue
+        if not os.path.exists(entry["db_path"]):
+            continue
+        candidates.append(entry)
+    return candidates
+
+def find_append_target(schema_fingerprint, row_keys, username, embedding_space):
+    """
+    The registered dataset this upload is a newer version of: same column
+    layout and (nearly) all of its records present in the upload, i.e. at
+    least APPEND_MIN_COVERAGE. An upload that only partly overlaps a dataset
+    (a rolling export) is not a newer version of it: appending would delete
+    the rows it no longer contains, so it is ingested as a new dataset.
+    Datasets embedded in another space than `embedding_space` are never appended to.
+    Record ids are row keys, or sentence hashes with DEDUP_SENTENCES.
+    Returns (entry, {record_id: content_hash}) or (None, None). Newest datasets are tried first.
+    """
+    for entry in append_candidates(schema_fingerprint, username, embedding_space):
+        try:
+            collection = get_client(entry["db_path"]).get_collection(get_collection_name(entry))
+            existing = get_collection_content_hashes(collection)
+        except Exception as e:
+            print(f"Skipping append candidate {entry['filename']}: {e}")
+            continue
+        if not existing:
+            continue
+        coverage = record_coverage(existing, row_keys)
+        print(f"Append candidate {entry['filename']}: {coverage:.0%} of its rows in the upload")
+        if coverage >= APPEND_MIN_COVERAGE:
+            return entry, existing
+        if coverage > 0:
+            print(f"Upload only partly overlaps {entry['filename']}; ingesting it as a new dataset")
+    return None, None
+
+def append_into_collection(entry, existing, sentences, metadatas, row_keys, df, current_hash, filename, username,
+                           progress_callback=None):
+    """
+    Bring an existing dataset up to date with a newer export: embed and upsert
+    only new or changed rows, refresh metadata of moved rows, delete rows that
+    disappeared, and replace the snapshot. Returns the updated registry entry.
+    """
+    collection = get_client(entry["db_path"]).get_collection(get_collection_name(entry))
+
+    changed, moved, removed = diff_records(existing, row_keys, metadatas)
+    print(f"Append: {len(changed)} new/changed, {len(moved)} unchanged, {len(removed)} removed rows")
+
+    embeddings = get_embedding_model()
+    for start in range(0, len(changed), STREAM_CHUNK_ROWS):
+        batch = changed[start:start + STREAM_CHUNK_ROWS]
+        texts = [sentences[i] for i in batch]
+        collection.upsert(
+            ids=[row_keys[i] for i in batch],
+            documents=texts,
+            metadatas=[metadatas[i] for i in batch],
+            embeddings=embeddings.embed_documents(texts),
+        )
+        if progress_callback:
+            progress_callback(len(moved) + start + len(batch), len(row_keys))
+    # Unchanged text keeps its vector; only row_index etc. may have shifted
+    for start in range(0, len(moved), STREAM_CHUNK_ROWS):
+        batch = moved[start:start + STREAM_CHUNK_ROWS]
+        collection.update(ids=[row_keys[i] for i in batch], metadatas=[metadatas[i] for i in batch])
+    for start in range(0, len(removed), STREAM_CHUNK_ROWS):
+        collection.delete(ids=removed[start:start + STREAM_CHUNK_ROWS])
+
+    # Replace the snapshot atomically so readers never see a half-written file
+    snapshot_path = entry["snapshot_path"]
+    tmp_path = snapshot_path + ".tmp"
+    write_snapshot(df, tmp_path)
+    return _finish_append(entry, tmp_path, len(df), current_hash, filename, username)
+
+def stream_append_into_collection(entry, existing, uploaded_file, current_hash, filename, username,
+                                  schema_profiles=None, dtypes=None, progress_callback=None):
+    """
+    append_into_collection for a streamed upload: each batch is compared with
+    the stored records as it is read (new or changed rows embedded and upserted,
+    unchanged rows get their metadata refreshed), the snapshot is rewritten
+    chunk by chunk, and stored records the upload no longer contains are
+    deleted at the end. Returns the updated registry entry.
+    """
+    collection = get_client(entry["db_path"]).get_collection(get_collection_name(entry))
+    embeddings = get_embedding_model()
+    tmp_path = entry["snapshot_path"] + ".tmp"
+    writer = SnapshotWriter(tmp_path)
+    seen_keys, groups, stale_ids, seen_ids = {}, {}, set(), set()
+    embedded = 0
+    file_size = get_upload_size(uploaded_file) if progress_callback else None
+    try:
+        for sentences, metadatas, chunk in iter_serialized_batches(uploaded_file, schema_profiles=schema_profiles,
+                                                                   dtypes=dtypes):
+            sentences, metadatas, ids, updated = _batch_records(sentences, metadatas, chunk, seen_keys, groups)
+            stale_ids.update(updated)
+            seen_ids.update(ids)
+            changed, moved = split_records(existing, ids, metadatas)
+            if changed:
+                texts = [sentences[i] for i in changed]
+                collection.upsert(
+                    ids=[ids[i] for i in changed],
+                    documents=texts,
+                    metadatas=[metadatas[i] for i in changed],
+                    embeddings=embeddings.embed_documents(texts),
+                )
+                embedded += len(changed)
+            if moved:
+                # Unchanged text keeps its vector; only row_index etc. may have shifted
+                collection.update(ids=[ids[i] for i in moved], metadatas=[metadatas[i] for i in moved])
+            writer.write(chunk)
+            if progress_callback:
+                progress_callback(writer.rows, estimate_total_rows(uploaded_file, writer.rows, file_size))
+        stale_ids = list(stale_ids)
+        for start in range(0, len(stale_ids), STREAM_CHUNK_ROWS):
+            batch = stale_ids[start:start + STREAM_CHUNK_ROWS]
+            collection.update(ids=batch, metadatas=[merged_metadata(groups[i]) for i in batch])
+        removed = [record_id for record_id in existing if record_id not in seen_ids]
+        for start in range(0, len(removed), STREAM_CHUNK_ROWS):
+            collection.delete(ids=removed[start:start + STREAM_CHUNK_ROWS])
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    print(f"Streamed append: {embedded} new/changed, {len(seen_ids) - embedded} unchanged, "
+          f"{len(removed)} removed records")
+    return _finish_append(entry, tmp_path, writer.rows, current_hash, filename, username)
+
+def _finish_append(entry, tmp_path, row_count, current_hash, filename, username):
+    """Swap in the rewritten snapshot (`tmp_path`), rebuild its cube and record the upload."""
+    snapshot_path = entry["snapshot_path"]
+    os.replace(tmp_path, snapshot_path)
+    build_dataset_cube(snapshot_path)
+
+    updated = dict(entry)
+    updated["filename"] = filename
+    updated["row_count"] = row_count
+    updated["source_hashes"] = list(entry.get("source_hashes", [])) + [current_hash]
+    return update_registry_entry(updated, username)
+
+def ingest_dataset(uploaded_file, file_bytes, username, streaming=None, filename=None, progress_callback=None):
+    """
+    Ingest an upload into a fresh, isolated vector DB, or update the dataset it
+    is a newer export of (returns "UPDATED"; see find_append_target).
+    `file_bytes` may be None, in which case the hash is computed from the stream.
+    `streaming` defaults to True for files above STREAMING_THRESHOLD_MB.
+    `filename` overrides the name shown in the registry (spooled uploads in jobs.py).
+    `progress_callback(rows_done, rows_total)` reports embedding progress; rows_total may be None.
+    """
+    filename = filename or uploaded_file.name
+
+    if file_bytes is not None:
+        current_hash = get_file_hash(file_bytes)
+    else:
+        current_hash = get_stream_hash(uploaded_file)
 
     if is_already_ingested(current_hash, username):
         return "EXISTING"
 
-    # 1. Clean and Serialize with error handling
-    try:
-        sentences, metadatas, df = clean_and_serialize(uploaded_file)
-    except Exception as e:
-        return f"ERROR: Data processing failed - {str(e)}"
+    if streaming is None:
+        streaming = get_upload_size(uploaded_file) > STREAMING_THRESHOLD_MB * 1024 * 1024
 
-    if not sentences:
-        return "ERROR: No readable data found."
+    # Known column layouts reuse their cached date formats
+    schema_profiles = get_schema_profiles(username)
 
-    # 2. HuggingFace Embeddings (Local & Free) with error handling
+    # 1. Clean and Serialize with error handling (streaming mode does this per batch)
+    if not streaming:
+        try:
+            sentences, metadatas, df = clean_and_serialize(uploaded_file, schema_profiles)
+        except Exception as e:
+            return f"ERROR: Data processing failed - {str(e)}"
+
+        if not sentences:
+            return "ERROR: No readable data found."
+
+        if DEDUP_SENTENCES:
+            # Identical sentences become one record (id = sentence hash) that lists every source row
+            sentences, metadatas, row_keys, _ = dedupe_sentences(sentences, metadatas)
+            print(f"Dedup: {len(df):,} rows -> {len(sentences):,} distinct sentences")
+        else:
+            # Stable per-row ids make later versions of this export appendable
+            row_keys = attach_row_keys(sentences, metadatas, df)
+
+    # 2. HuggingFace Embeddings (Local & Free), shared warm instance, with error handling
     try:
-        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+        embeddings = get_embedding_model()
+        embeddings.load()
     except Exception as e:
         return f"ERROR: Embedding model failed to load - {str(e)}"
 
+    # 2b. A grown re-export of a registered dataset is updated in place
+    dtypes = None
+    if not streaming and APPEND_MODE_ENABLED:
+        entry, existing = find_append_target(df.attrs.get("schema_fingerprint"), row_keys, username, embeddings.space)
+        if entry is not None:
+            try:
+                append_into_collection(entry, existing, sentences, metadatas, row_keys, df,
+                                       current_hash, filename, username, progress_callback)
+            except Exception as e:
+                return f"ERROR: Append to {entry['filename']} failed - {str(e)}"
+            save_schema_profiles(schema_profiles, username)
+            return "UPDATED"
+    elif streaming and APPEND_MODE_ENABLED:
+        # Large uploads get a parse-only first pass for their record ids, but only
+        # when a dataset with the same header exists to compare them with
+        try:
+            schema_fingerprint = peek_schema_fingerprint(uploaded_file)
+            if append_candidates(schema_fingerprint, username, embeddings.space):
+                dtypes = scan_column_dtypes(uploaded_file)
+                record_ids = scan_record_ids(uploaded_file, schema_profiles, dtypes)
+                entry, existing = find_append_target(schema_fingerprint, record_ids, username, embeddings.space)
+                del record_ids
+            else:
+                entry = None
+        except Exception as e:
+            return f"ERROR: Data processing failed - {str(e)}"
+        if entry is not None:
+            try:
+                stream_append_into_collection(entry, existing, uploaded_file, current_hash, filename, username,
+                                              schema_profiles, dtypes, progress_callback)
+            except Exception as e:
+                return f"ERROR: Append to {entry['filename']} failed - {str(e)}"
+            save_schema_profiles(schema_profiles, username)
+            return "UPDATED"
+
     # 3. GET USER-SPECIFIC STORAGE PATHS
     user_paths = get_user_storage_paths(username)
     
@@ -82,45 +454,98 @@ def ingest_dataset(uploaded_file, file_bytes, username):
     import uuid
     import shutil
     
-    # Start with a fresh unique path for every ingestion to ensure isolation
-    unique_id = str(uuid.uuid4())[:8]
-    path_to_use = f"{user_paths['vector_db']}/{int(time.time())}_{unique_id}"
+    quantization = VECTOR_QUANTIZATION
+    shared_store = STORAGE_MODE != "isolated" and not quantization
+    if quantization:
+        # Quantized datasets are written to their own directory (see quantized_store.py)
+        path_to_use = os.path.join(user_paths["vector_db"], "quantized", current_hash)
+        collection_name = None
+    elif shared_store:
+        # One store per user (or node); this dataset becomes its own collection in it
+        path_to_use = get_store_path(username)
+        collection_name = collection_name_for(current_hash, username)
+    else:
+        # Start with a fresh unique path for every ingestion to ensure isolation
+        unique_id = str(uuid.uuid4())[:8]
+        path_to_use = f"{user_paths['vector_db']}/{int(time.time())}_{unique_id}"
+        collection_name = LEGACY_COLLECTION
     
     for attempt in range(max_attempts):
         try:
-            if os.path.exists(path_to_use):
-                shutil.rmtree(path_to_use, ignore_errors=True)
-            os.makedirs(path_to_use, exist_ok=True)
+            if shared_store:
+                os.makedirs(path_to_use, exist_ok=True)
+                # A collection left behind by a failed attempt is rebuilt from scratch
+                drop_collection(path_to_use, collection_name)
+            else:
+                if os.path.exists(path_to_use):
+                    shutil.rmtree(path_to_use, ignore_errors=True)
+                os.makedirs(path_to_use, exist_ok=True)
             
-            import chromadb
-            client = chromadb.PersistentClient(
-                path=path_to_use,
-                settings=chromadb.config.Settings(
-                    anonymized_telemetry=False,
-                    is_persistent=True
+            if quantization:
+                from quantized_store import QuantizedVectorStore
+                vectorstore = QuantizedVectorStore(path_to_use, embeddings, quantization)
+            else:
+                # Shared handle: stays open for the first chat questions on this dataset
+                client = get_client(path_to_use)
+                
+                vectorstore = Chroma(
+                    client=client,
+                    collection_name=collection_name,
+                    embedding_function=embeddings,
                 )
-            )
-            
-            vectorstore = Chroma.from_texts(
-                texts=sentences,
-                metadatas=metadatas,
-                embedding=embeddings,
-                persist_directory=path_to_use,
-                collection_name="employee_kb",
-                client=client
-            )
+            partial = {"db_path": path_to_use, "collection": collection_name if shared_store else None,
+                       "vector_quantization": quantization}
+
+            if streaming:
+                snapshot_path = new_snapshot_path(filename, username)
+                try:
+                    row_count, schema_fingerprint = stream_into_collection(uploaded_file, vectorstore, snapshot_path,
+                                                                           schema_profiles, progress_callback, dtypes)
+                except UnicodeDecodeError as e:
+                    delete_dataset_vectors(partial)
+                    return f"ERROR: Data processing failed - {str(e)}"
+                if row_count == 0:
+                    delete_dataset_vectors(partial)
+                    return "ERROR: No readable data found."
+                if quantization:
+                    vectorstore.close()
+                save_schema_profiles(schema_profiles, username)
+                save_dataset_to_registry(current_hash, path_to_use, filename, None, username,
+                                         snapshot_path=snapshot_path, schema_fingerprint=schema_fingerprint,
+                                         row_count=row_count, collection=partial["collection"],
+                                         vector_quantization=quantization, embedding_space=embeddings.space)
+                return "NEW"
+
+            # Batched so progress can be reported (and each insert stays under Chroma's max batch)
+            for start in range(0, len(sentences), STREAM_CHUNK_ROWS):
+                end = start + STREAM_CHUNK_ROWS
+                vectorstore.add_texts(texts=sentences[start:end], metadatas=metadatas[start:end], ids=row_keys[start:end])
+                if progress_callback:
+                    progress_callback(min(end, len(sentences)), len(sentences))
+            if quantization:
+                vectorstore.close()
             
-            save_dataset_to_registry(current_hash, path_to_use, uploaded_file.name, df, username)
+            save_schema_profiles(schema_profiles, username)
+            save_dataset_to_registry(current_hash, path_to_use, filename, df, username,
+                                     collection=partial["collection"], vector_quantization=quantization,
+                                     embedding_space=embeddings.space)
             return "NEW"
             
         except Exception as e:
+            if shared_store:
+                # Other datasets live in this store: drop only the partial collection
+                drop_collection(path_to_use, collection_name)
+            else:
+                # Release the failed path's handles before retrying elsewhere
+                close_client(path_to_use)
             err_msg = str(e).lower()
-            # If "tenants" or "no such table" or "readonly" occurs, try a completely new path
+            # If "tenants" or "no such table" or "readonly" occurs, try again (isolated mode: on a completely new path)
             if any(x in err_msg for x in ["tenants", "readonly", "1032", "permission", "code: 1"]):
                 if attempt < max_attempts - 1:
                     time.sleep(1) # Small cool-down
-                    unique_id = str(uuid.uuid4())[:8]
-                    path_to_use = f"{user_paths['vector_db']}/{int(time.time())}_{unique_id}"
+                    if not shared_store and not quantization:
+                        unique_id = str(uuid.uuid4())[:8]
+                        path_to_use = f"{user_paths['vector_db']}/{int(time.time())}_{unique_id}"
                     continue 
                 else:
                     raise e
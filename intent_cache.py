@@ -0,0 +1,74 @@
+"""
+Persistent cache of classified chat intents.
+
+Users keep asking the same questions ("how many billable projects?"), and
+each one would otherwise pay the LLM intent round trip again. Intents are
+stored in a SqliteLRUCache keyed by the normalized question text plus the
+fingerprint of the dataset's column schema (the intent names columns, so it
+is reusable by any dataset with the same layout), with TTL and LRU eviction.
+"""
+import hashlib
+import json
+import re
+import threading
+
+from app_config import (
+    INTENT_CACHE_ENABLED, INTENT_CACHE_PATH, INTENT_CACHE_MAX_ENTRIES, INTENT_CACHE_TTL_SECONDS
+)
+from processor import get_schema_fingerprint
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    if _cache is None and INTENT_CACHE_ENABLED:
+        with _cache_lock:
+            if _cache is None:
+                from disk_cache import SqliteLRUCache
+                _cache = SqliteLRUCache(INTENT_CACHE_PATH, INTENT_CACHE_MAX_ENTRIES, INTENT_CACHE_TTL_SECONDS)
+    return _cache
+
+def normalize_question(question: str) -> str:
+    """Lower-case, collapse whitespace and drop surrounding punctuation."""
+    q = re.sub(r"\s+", " ", str(question).lower()).strip()
+    return q.strip(" ?!.,;:'\"")
+
+def intent_cache_key(question: str, columns) -> str:
+    text = normalize_question(question) + "\x1f" + get_schema_fingerprint(list(columns))
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def get_cached_intent(question: str, columns):
+    """The cached intent dict for this question on this column layout, or None."""
+    cache = _get_cache()
+    if cache is None:
+        return None
+    try:
+        key = intent_cache_key(question, columns)
+        value = cache.get_many([key]).get(key)
+        return json.loads(value) if value is not None else None
+    except Exception as e:
+        print(f"Intent cache read failed: {e}")
+        return None
+
+def cache_intent(question: str, columns, intent: dict):
+    cache = _get_cache()
+    if cache is None:
+        return
+    try:
+        cache.put_many({intent_cache_key(question, columns): json.dumps(intent).encode("utf-8")})
+    except Exception as e:
+        print(f"Intent cache write failed: {e}")
+
+def get_intent_cache_stats():
+    """Hit/miss/eviction/expiry counters of this process, or None when disabled."""
+    cache = _get_cache()
+    return cache.get_stats() if cache is not None else None
+
+def clear_intent_cache():
+    """Forget every cached intent (node-wide; see `python vector_store.py clear-caches`)."""
+    cache = _get_cache()
+    if cache is not None:
+        cache.clear()
@@ -0,0 +1,260 @@
+"""
+Rule-based fast path for the query router.
+
+Common lookup questions ("list all billable projects", "how many employees",
+"total hours for non-billable projects") are classified locally with
+deterministic patterns over the dataset's column names, so they skip the
+LLM intent round trip. Questions that name a known project or person are
+sent straight to RAG, mirroring the LLM classifier's rules. Anything the
+patterns do not fully explain gets a low confidence and goes to the LLM.
+
+Group-by, top-N and date-range questions become aggregate plans for
+query_planner.py. classify_intent() returns the same intent dict as
+get_query_intent_llm() (a lookup intent, an aggregate plan or
+{"action": "rag"}) plus a confidence in [0, 1].
+"""
+import os
+import re
+import threading
+
+import pandas as pd
+
+from query_planner import parse_date_range
+
+PERSON_COLUMNS = ['user', 'employee', 'name', 'person']
+DURATION_COLUMNS = ['duration_(decimal)', 'duration_decimal', 'time_(decimal)', 'hours', 'time_decimal']
+
+RAG_PATTERN = re.compile(
+    r"^\s*(why|how (to|can|do|does|should|could|would|is|are)|suggest|explain|recommend|compare|analy[sz]e|summari[sz]e|describe)\b"
+    r"|\bwho (is|are|was|leads?)\b|\blead of\b|\btrend|\bcompared?\b|\bbetween\b"
+)
+COUNT_PATTERN = re.compile(r"\bhow many\b|\bcount\b|\bnumber of\b")
+SUM_PATTERN = re.compile(r"\btotal\b|\bsum\b|\boverall\b|\bhow much\b")
+LIST_PATTERN = re.compile(r"\blist\b|\bwho\b|\bshow\b|\bwhich\b|\bwhat are\b|\bgive me\b|\bname\b|\ball\b")
+TOP_PATTERN = re.compile(r"\b(top|bottom|most|least|highest|lowest|fewest)\b(?: (\d+))?")
+GROUP_PATTERN = re.compile(
+    r"\b(?:by|per|for each|each|across|among) (users?|employees?|persons?|people|members?|staff|consultants?"
+    r"|projects?|clients?|tasks?|groups?|departments?|teams?)\b|\bbreakdown\b|\branking\b|\branked\b|\brank\b"
+)
+NON_BILLABLE_PATTERN = re.compile(r"\bnon[- ]?billable\b|\bnot billable\b|\bunbillable\b")
+BILLABLE_PATTERN = re.compile(r"\bbillable\b")
+
+PERSON_WORDS = {"employee", "employees", "user", "users", "people", "person", "persons",
+                "staff", "member", "members", "consultant", "consultants", "worker", "workers"}
+PROJECT_WORDS = {"project", "projects"}
+HOURS_WORDS = {"hour", "hours", "time", "duration"}
+# Words that carry no filter or target of their own; anything else makes the rules unsure
+FILLER_WORDS = {
+    "how", "many", "much", "count", "number", "of", "total", "sum", "overall", "list", "show", "me",
+    "which", "what", "are", "is", "were", "was", "there", "give", "name", "all", "the", "a", "an",
+    "in", "on", "for", "across", "by", "to", "do", "does", "did", "we", "have", "has", "this", "dataset",
+    "data", "file", "logged", "log", "worked", "working", "work", "spent", "booked", "recorded",
+    "unique", "distinct", "different", "every", "each", "please", "can", "you", "tell", "and", "our",
+    "billable", "non", "not", "unbillable", "nonbillable", "non-billable", "who", "that", "with",
+}
+AGGREGATE_WORDS = {
+    "top", "bottom", "most", "least", "highest", "lowest", "fewest", "per", "among", "breakdown", "ranking",
+    "ranked", "rank", "group", "groups", "department", "departments", "team", "teams", "client", "clients",
+    "task", "tasks", "entries", "rows",
+} | {str(n) for n in range(1, 101)}
+
+MIN_ENTITY_LENGTH = 3
+_ENTITY_CACHE_SIZE = 16
+_entity_cache = {}  # (snapshot path, mtime) -> {lower-cased project/person name: column}
+_entity_lock = threading.Lock()
+
+
+def find_person_column(columns):
+    from processor import detect_key_columns
+    return next((c for c in PERSON_COLUMNS if c in columns), None) or detect_key_columns(columns)["person"]
+
+def find_duration_column(columns):
+    return next((c for c in DURATION_COLUMNS if c in columns), None) or next(
+        (c for c in columns if 'decimal' in c or 'hours' in c), None
+    )
+
+def has_billable_status(sample_df: pd.DataFrame) -> bool:
+    """Whether the router can derive Yes/No billable status (see extract_billable_status in dataset_views.py)."""
+    if any('billable' in c and 'rate' not in c and 'amount' not in c for c in sample_df.columns):
+        return True
+    if 'project' in sample_df.columns:
+        return any('billable' in str(p).lower() for p in sample_df['project'].head(20))
+    return False
+
+def load_entity_values(snapshot_path: str, columns) -> dict:
+    """
+    Lower-cased project and person names of a dataset mapped to their column
+    (cached per snapshot version). Embedded billable suffixes ("Koradream : Fixed Cost : Billable")
+    are stripped to the project name.
+    """
+    from dataset_store import read_snapshot
+
+    entity_columns = [c for c in dict.fromkeys(['project', find_person_column(columns)]) if c in columns]
+    if not entity_columns:
+        return {}
+    key = (snapshot_path, os.path.getmtime(snapshot_path))
+    with _entity_lock:
+        if key in _entity_cache:
+            return _entity_cache[key]
+
+    df = read_snapshot(snapshot_path, columns=entity_columns)
+    values = {}
+    for col in entity_columns:
+        for v in df[col].dropna().unique():
+            name = str(v).split(':')[0].strip().lower()
+            if len(name) >= MIN_ENTITY_LENGTH and name not in ('unknown', 'not specified'):
+                values.setdefault(name, col)
+
+    with _entity_lock:
+        if len(_entity_cache) >= _ENTITY_CACHE_SIZE:
+            _entity_cache.pop(next(iter(_entity_cache)))
+        _entity_cache[key] = values
+    return values
+
+def find_entity(question_lower: str, entities):
+    """(name, column) of the first known project/person named in the question, or None."""
+    for name, column in entities.items():
+        if re.search(r"(?<!\w)" + re.escape(name) + r"(?!\w)", question_lower):
+            return name, column
+    return None
+
+
+def _group_column(word, columns):
+    """Column for a group-by word ("people" -> user column, "teams" -> group...)."""
+    word = word.rstrip('s') if word not in ('people', 'staff') else word
+    if word + 's' in PERSON_WORDS or word in PERSON_WORDS:
+        return find_person_column(columns)
+    if word in ('project', 'client', 'task'):
+        return next((c for c in columns if word in c), None)
+    if word in ('group', 'department', 'team'):
+        return next((c for c in ['group', 'department', 'team'] if c in columns), None)
+    return None
+
+def _first_target(words, columns):
+    """Person or project column for whichever of them the question names first."""
+    for word in words:
+        if word in PERSON_WORDS:
+            return find_person_column(columns)
+        if word in PROJECT_WORDS:
+            return 'project' if 'project' in columns else None
+    return None
+
+def _aggregate_plan(q, words, columns, filters, date_range, top, group):
+    """Plan for group-by / top-N / date-range questions (see query_planner.py), or None."""
+    plan = {"action": "aggregate", "filters": filters}
+    word_set = set(words)
+    if date_range:
+        plan["date_range"] = date_range
+
+    if group and group.group(1):
+        group_by = _group_column(group.group(1), columns)
+    elif group and group.group(0) == 'breakdown':
+        group_by = _group_column('group', columns) or find_person_column(columns)
+    elif group or top:
+        # "top 5 projects" ranks projects, otherwise people
+        group_by = 'project' if word_set & PROJECT_WORDS and not word_set & PERSON_WORDS and 'project' in columns \
+            else find_person_column(columns)
+    else:
+        group_by = None
+    if (group or top) and group_by is None:
+        return None
+    if group_by:
+        plan["group_by"] = group_by
+
+    duration = find_duration_column(columns)
+    if word_set & HOURS_WORDS or top or SUM_PATTERN.search(q):
+        if duration is None:
+            return None
+        plan["aggregate"] = {"func": "sum", "column": duration}
+    elif COUNT_PATTERN.search(q):
+        counted = find_person_column(columns) if word_set & PERSON_WORDS else 'project' if word_set & PROJECT_WORDS else None
+        plan["aggregate"] = {"func": "nunique", "column": counted} if counted and counted != group_by \
+            else {"func": "count"}
+    elif LIST_PATTERN.search(q) and not group_by:
+        listed = _first_target(words, columns)
+        if listed is None:
+            return None
+        plan["aggregate"] = {"func": "list", "column": listed}
+    else:
+        if duration is None:
+            return None
+        plan["aggregate"] = {"func": "sum", "column": duration}
+
+    if top:
+        plan["sort"] = "asc" if top.group(1) in ('bottom', 'least', 'lowest', 'fewest') else "desc"
+        plan["limit"] = int(top.group(2)) if top.group(2) else (1 if top.group(1) != 'top' else 10)
+    elif group_by:
+        plan["sort"] = "desc"
+    return plan
+
+
+def classify_intent(question: str, sample_df: pd.DataFrame, entities=None):
+    """
+    (intent, confidence) for a question. Confidence 1.0 means the patterns
+    explain every word of the question; below the router's threshold the
+    LLM classifier should decide instead. `entities` maps known project and
+    person names to their column (see load_entity_values).
+    """
+    q = question.lower().strip()
+    columns = list(sample_df.columns)
+
+    if RAG_PATTERN.search(q):
+        return {"action": "rag"}, 0.9
+
+    date_range, date_text = parse_date_range(q)
+    if date_text:
+        q = q.replace(date_text, " ")
+    top = TOP_PATTERN.search(q)
+    group = GROUP_PATTERN.search(q)
+    aggregate = bool(top or group or date_range)
+
+    # Named projects/people are RAG questions, unless they only filter an aggregate
+    entity = find_entity(q, entities) if entities else None
+    if entity and not aggregate:
+        return {"action": "rag"}, 0.9
+    if entity:
+        q = re.sub(r"(?<!\w)" + re.escape(entity[0]) + r"(?!\w)", " ", q)
+
+    words = re.findall(r"[a-z0-9]+(?:-[a-z0-9]+)?", q)
+    word_set = set(words)
+
+    filters = {}
+    if NON_BILLABLE_PATTERN.search(q):
+        filters["billable"] = "No"
+    elif BILLABLE_PATTERN.search(q):
+        filters["billable"] = "Yes"
+    if entity:
+        filters[entity[1]] = entity[0]
+
+    if aggregate:
+        intent = _aggregate_plan(q, words, columns, filters, date_range, top, group)
+        if intent is None:
+            return {"action": "rag"}, 0.0
+    else:
+        if COUNT_PATTERN.search(q):
+            operation = "count"
+        elif SUM_PATTERN.search(q) and word_set & HOURS_WORDS:
+            operation = "sum"
+        elif LIST_PATTERN.search(q):
+            operation = "list"
+        else:
+            return {"action": "rag"}, 0.0
+
+        # What to retrieve: whatever is named first ("users on billable projects" -> user)
+        if operation == "sum":
+            target = find_duration_column(columns)
+        else:
+            target = _first_target(words, columns)
+        if target is None:
+            return {"action": "rag"}, 0.0
+
+        intent = {"action": "lookup", "target_column": target, "filters": filters, "operation": operation}
+
+    confidence = 1.0
+    unexplained = word_set - FILLER_WORDS - PERSON_WORDS - PROJECT_WORDS - HOURS_WORDS - AGGREGATE_WORDS
+    if unexplained:
+        # e.g. dates, groups or names the rules cannot filter on
+        confidence = 0.5
+    if "billable" in filters and not has_billable_status(sample_df):
+        confidence = min(confidence, 0.3)
+    return intent, confidence
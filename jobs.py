@@ -0,0 +1,180 @@
+"""
+Background ingestion jobs.
+
+Uploads are spooled to disk and processed by a small per-process thread pool,
+so a Streamlit session stays responsive (chat on already-ingested datasets
+keeps working) while parsing and embedding run. Job state lives in a SQLite
+table (queued -> running -> done | failed, rows processed, ETA) that any
+session can poll, and jobs left queued or running by a restart are resumed.
+"""
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from app_config import INGEST_WORKERS, JOBS_DB_PATH, UPLOAD_SPOOL_DIR
+
+ACTIVE_STATES = ("queued", "running")
+
+_executor = None
+_executor_lock = threading.Lock()
+_db_lock = threading.Lock()
+_conn = None
+_resumed = False
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(JOBS_DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(JOBS_DB_PATH, check_same_thread=False, timeout=30)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, username TEXT NOT NULL, filename TEXT NOT NULL,"
+            " spool_path TEXT NOT NULL, file_hash TEXT, status TEXT NOT NULL,"
+            " rows_done INTEGER NOT NULL DEFAULT 0, rows_total INTEGER,"
+            " result TEXT, error TEXT,"
+            " created_at REAL NOT NULL, started_at REAL, finished_at REAL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs(username, created_at)")
+        conn.commit()
+        _conn = conn
+    return _conn
+
+def _execute(sql, params=()):
+    with _db_lock:
+        conn = _db()
+        conn.execute(sql, params)
+        conn.commit()
+
+def _query(sql, params=()):
+    with _db_lock:
+        return [dict(row) for row in _db().execute(sql, params).fetchall()]
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=INGEST_WORKERS, thread_name_prefix="ingest")
+        return _executor
+
+
+def submit_ingest_job(uploaded_file, username, file_hash=None) -> str:
+    """
+    Spool the upload to disk and queue it for ingestion. Returns the job id.
+    The caller can poll get_job()/list_jobs() for progress.
+    """
+    resume_pending_jobs()
+    if file_hash:
+        # The same file uploaded twice (e.g. from two tabs) is processed once
+        active = _query("SELECT id FROM jobs WHERE username = ? AND file_hash = ? AND status IN (?, ?)",
+                        (username, file_hash) + ACTIVE_STATES)
+        if active:
+            return active[0]["id"]
+    job_id = uuid.uuid4().hex[:12]
+    os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+    spool_path = os.path.join(UPLOAD_SPOOL_DIR, f"{job_id}_{os.path.basename(uploaded_file.name)}")
+
+    uploaded_file.seek(0)
+    with open(spool_path, "wb") as out:
+        for block in iter(lambda: uploaded_file.read(1024 * 1024), b""):
+            out.write(block)
+    uploaded_file.seek(0)
+
+    _execute(
+        "INSERT INTO jobs (id, username, filename, spool_path, file_hash, status, created_at)"
+        " VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+        (job_id, username, uploaded_file.name, spool_path, file_hash, time.time())
+    )
+    _get_executor().submit(_run_job, job_id)
+    print(f"📥 Queued ingestion job {job_id} for {uploaded_file.name}")
+    return job_id
+
+def _run_job(job_id: str):
+    job = get_job(job_id)
+    if job is None or job["status"] not in ACTIVE_STATES:
+        return
+
+    from ingest import ingest_dataset, LocalUpload
+
+    _execute("UPDATE jobs SET status = 'running', started_at = ?, rows_done = 0 WHERE id = ?",
+             (time.time(), job_id))
+
+    def report(rows_done, rows_total):
+        _execute("UPDATE jobs SET rows_done = ?, rows_total = ? WHERE id = ?", (rows_done, rows_total, job_id))
+
+    upload = None
+    try:
+        upload = LocalUpload(job["spool_path"], job["filename"])
+        result = ingest_dataset(upload, None, job["username"], filename=job["filename"], progress_callback=report)
+        status = "failed" if str(result).startswith("ERROR") else "done"
+        _execute("UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                 (status, result, result if status == "failed" else None, time.time(), job_id))
+        print(f"✅ Ingestion job {job_id} finished: {result}")
+    except Exception as e:
+        _execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                 (str(e), time.time(), job_id))
+        print(f"❌ Ingestion job {job_id} failed: {e}")
+    finally:
+        if upload is not None:
+            upload.close()
+        if os.path.exists(job["spool_path"]):
+            os.remove(job["spool_path"])
+
+def resume_pending_jobs() -> int:
+    """
+    Requeue jobs a previous process left queued or running (once per process).
+    Jobs whose spooled upload is gone are marked failed. Returns the number requeued.
+    """
+    global _resumed
+    with _executor_lock:
+        if _resumed:
+            return 0
+        _resumed = True
+
+    requeued = 0
+    for job in _query("SELECT * FROM jobs WHERE status IN (?, ?) ORDER BY created_at", ACTIVE_STATES):
+        if not os.path.exists(job["spool_path"]):
+            _execute("UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                     ("Upload was lost before processing finished", time.time(), job["id"]))
+            continue
+        _execute("UPDATE jobs SET status = 'queued', rows_done = 0, rows_total = NULL WHERE id = ?", (job["id"],))
+        _get_executor().submit(_run_job, job["id"])
+        requeued += 1
+    if requeued:
+        print(f"🔁 Resumed {requeued} interrupted ingestion job(s)")
+    return requeued
+
+def get_job(job_id: str):
+    rows = _query("SELECT * FROM jobs WHERE id = ?", (job_id,))
+    return _with_eta(rows[0]) if rows else None
+
+def list_jobs(username, limit=10):
+    """Most recent jobs of a user, newest first, with "progress" and "eta_seconds" filled in."""
+    rows = _query("SELECT * FROM jobs WHERE username = ? ORDER BY created_at DESC LIMIT ?", (username, limit))
+    return [_with_eta(row) for row in rows]
+
+def has_active_jobs(username) -> bool:
+    return bool(_query("SELECT 1 FROM jobs WHERE username = ? AND status IN (?, ?) LIMIT 1",
+                       (username,) + ACTIVE_STATES))
+
+def _with_eta(job: dict) -> dict:
+    job["progress"] = None
+    job["eta_seconds"] = None
+    if job["status"] == "done":
+        job["progress"] = 1.0
+    elif job["status"] == "running" and job["rows_total"]:
+        progress = min(job["rows_done"] / job["rows_total"], 1.0)
+        job["progress"] = progress
+        elapsed = time.time() - (job["started_at"] or time.time())
+        if progress > 0:
+            job["eta_seconds"] = elapsed * (1 - progress) / progress
+    return job
+
+def clear_finished_jobs(username):
+    """Drop done/failed jobs of a user from the table."""
+    _execute("DELETE FROM jobs WHERE username = ? AND status NOT IN (?, ?)", (username,) + ACTIVE_STATES)
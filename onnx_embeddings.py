@@ -0,0 +1,201 @@
+"""
+ONNX Runtime backend for the sentence-transformers embedding model.
+
+The PyTorch model is exported to ONNX once per node (optionally with dynamic
+int8 quantization of the weights) and then run with ONNX Runtime. The
+pipeline reproduces all-MiniLM-L6-v2: tokenize -> transformer -> mean
+pooling -> L2 normalize. Whether it is faster than PyTorch depends on the
+machine and has not been measured for this deployment: run
+`python benchmarks.py embeddings` before switching the backend (the default
+stays "torch").
+
+Every export is checked for cosine parity against the PyTorch embeddings
+before it is used; the result is stored next to the model together with the
+library versions and model file it was measured with, and is measured again
+when any of them changes. SharedEmbeddings (embeddings.py) selects this backend through
+EMBEDDING_BACKEND and falls back to PyTorch when export or parity fails.
+"""
+import json
+import os
+import threading
+import time
+from typing import List
+
+import numpy as np
+
+from app_config import ONNX_MODEL_DIR, ONNX_PARITY_MIN_COSINE
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+# Probe sentences for the parity check (shaped like serialized time entries)
+PARITY_TEXTS = [
+    "Employee 12 (Project 4 : Billable): User: Employee 12; Project: Project 4; Duration (decimal): 1.5",
+    "Jane Doe (Website Redesign): Description: Client call; Start Date: 2024-03-04; Billable: Yes",
+    "Unknown (Not Specified): Group: Engineering; Task: Code review; Duration (decimal): 0.25",
+    "How many hours did the design team log in March?",
+    "Which projects are billable?",
+]
+
+_export_lock = threading.Lock()
+
+
+def _model_dir(model_name: str) -> str:
+    return os.path.join(ONNX_MODEL_DIR, model_name.replace("/", "__"))
+
+def export_onnx_model(model_name: str, quantize: bool = False) -> str:
+    """
+    Export `model_name` to ONNX (and its int8 variant when `quantize`), once.
+    Returns the path of the .onnx file to load.
+    """
+    model_dir = _model_dir(model_name)
+    fp32_path = os.path.join(model_dir, "model.onnx")
+    int8_path = os.path.join(model_dir, "model-int8.onnx")
+    target = int8_path if quantize else fp32_path
+    if os.path.exists(target):
+        return target
+
+    with _export_lock:
+        if os.path.exists(target):
+            return target
+        os.makedirs(model_dir, exist_ok=True)
+        if not os.path.exists(fp32_path):
+            import torch
+            from transformers import AutoModel, AutoTokenizer
+
+            start = time.perf_counter()
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            model = AutoModel.from_pretrained(model_name)
+            model.eval()
+            sample = tokenizer(["export sample"], return_tensors="pt")
+            tmp_path = fp32_path + ".tmp"
+            with torch.no_grad():
+                torch.onnx.export(
+                    model,
+                    (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+                    tmp_path,
+                    input_names=["input_ids", "attention_mask", "token_type_ids"],
+                    output_names=["last_hidden_state"],
+                    dynamic_axes={
+                        "input_ids": {0: "batch", 1: "sequence"},
+                        "attention_mask": {0: "batch", 1: "sequence"},
+                        "token_type_ids": {0: "batch", 1: "sequence"},
+                        "last_hidden_state": {0: "batch", 1: "sequence"},
+                    },
+                    opset_version=14,
+                )
+            os.replace(tmp_path, fp32_path)
+            tokenizer.save_pretrained(model_dir)
+            print(f"🧩 Exported {model_name} to ONNX in {time.perf_counter() - start:.1f}s")
+        if quantize and not os.path.exists(int8_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+            quantize_dynamic(fp32_path, int8_path + ".tmp", weight_type=QuantType.QInt8)
+            os.replace(int8_path + ".tmp", int8_path)
+            print(f"🧩 Quantized ONNX model to int8 ({os.path.getsize(int8_path) / 2**20:.1f} MiB)")
+    return target
+
+
+class OnnxEmbeddingModel:
+    """
+    Drop-in for HuggingFaceEmbeddings (embed_documents / embed_query) backed by
+    ONNX Runtime. Texts are encoded in length-sorted batches to minimize padding.
+    """
+
+    def __init__(self, model_name: str, quantize: bool = False, batch_size: int = 64, max_length: int = 256):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.quantize = quantize
+        self.batch_size = batch_size
+        self.max_length = max_length
+        model_path = export_onnx_model(model_name, quantize)
+        self.tokenizer = AutoTokenizer.from_pretrained(_model_dir(model_name))
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = os.cpu_count() or 1
+        self.session = ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        self._input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        order = np.argsort([len(t) for t in texts])
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            idx = order[start:start + self.batch_size]
+            tokens = self.tokenizer(
+                [texts[i] for i in idx], padding=True, truncation=True,
+                max_length=self.max_length, return_tensors="np"
+            )
+            feed = {k: v.astype(np.int64) for k, v in tokens.items() if k in self._input_names}
+            hidden = self.session.run(None, feed)[0]
+            # Mean pooling over real tokens, then L2 normalization (as the sentence-transformers pipeline)
+            mask = tokens["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            batches.append((idx, pooled))
+        out = np.empty((len(texts), batches[0][1].shape[1]), dtype=np.float32)
+        for idx, pooled in batches:
+            out[idx] = pooled
+        return out
+
+    def embed_documents(self, texts) -> List[List[float]]:
+        texts = [t.replace("\n", " ") for t in texts]
+        return self._encode(texts).tolist() if texts else []
+
+    def embed_query(self, text) -> List[float]:
+        return self._encode([text.replace("\n", " ")])[0].tolist()
+
+
+def cosine_parity(reference, candidate) -> dict:
+    """Row-wise cosine similarity between two sets of embeddings of the same texts."""
+    a = np.asarray(reference, dtype=np.float32)
+    b = np.asarray(candidate, dtype=np.float32)
+    cos = (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+    return {"min": float(cos.min()), "mean": float(cos.mean())}
+
+def _parity_key(model_path: str) -> dict:
+    """What a parity result depends on: the inference libraries and the exported model file."""
+    import onnxruntime
+    import sentence_transformers
+    import transformers
+
+    stat = os.stat(model_path)
+    return {
+        "onnxruntime": onnxruntime.__version__,
+        "transformers": transformers.__version__,
+        "sentence_transformers": sentence_transformers.__version__,
+        "model_file": {"size": stat.st_size, "mtime": stat.st_mtime},
+    }
+
+def load_onnx_backend(model_name: str, backend: str):
+    """
+    OnnxEmbeddingModel for "onnx" / "onnx-int8", verified against the PyTorch
+    model once per library versions and export. Raises RuntimeError if parity
+    is below ONNX_PARITY_MIN_COSINE.
+    """
+    quantize = backend == "onnx-int8"
+    model = OnnxEmbeddingModel(model_name, quantize=quantize)
+
+    parity_file = os.path.join(_model_dir(model_name), f"parity-{backend}.json")
+    key = _parity_key(export_onnx_model(model_name, quantize))
+    parity = None
+    if os.path.exists(parity_file):
+        with open(parity_file) as f:
+            parity = json.load(f)
+        if parity.get("key") != key:
+            print(f"ONNX parity ({backend}) was measured with other library or model versions; checking again")
+            parity = None
+    if parity is None:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        reference = HuggingFaceEmbeddings(model_name=model_name).embed_documents(PARITY_TEXTS)
+        parity = cosine_parity(reference, model.embed_documents(PARITY_TEXTS))
+        parity["key"] = key
+        with open(parity_file + ".tmp", "w") as f:
+            json.dump(parity, f)
+        os.replace(parity_file + ".tmp", parity_file)
+        print(f"ONNX parity ({backend}): min cosine {parity['min']:.4f}, mean {parity['mean']:.4f}")
+
+    if parity["min"] < ONNX_PARITY_MIN_COSINE:
+        raise RuntimeError(
+            f"{backend} embeddings diverge from PyTorch (min cosine {parity['min']:.4f} < {ONNX_PARITY_MIN_COSINE})"
+        )
+    return model
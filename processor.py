@@ -1,139 +1,642 @@
-import pandas as pd
-from typing import List, Tuple
-
-def clean_and_serialize(uploaded_file) -> Tuple[List[str], List[dict], pd.DataFrame]:
-    """
-    OPTIMIZED Processor: Creates clean, information-dense chunks for accurate RAG.
-    Handles Clockify data format specifically to prevent data corruption.
-    """
-    # 1. Load with robust encoding fallbacks
-    try:
-        uploaded_file.seek(0) # Ensure we start from the beginning
-        if uploaded_file.name.endswith(".csv"):
-            # Try with different parameters for better CSV handling
-            df = pd.read_csv(uploaded_file, low_memory=False)
-        else:
-            df = pd.read_excel(uploaded_file)
-    except UnicodeDecodeError:
-        uploaded_file.seek(0) # Reset for the fallback attempt
-        df = pd.read_csv(uploaded_file, encoding='latin1', low_memory=False)
-    except Exception as e:
-        # Handle other potential loading errors
-        uploaded_file.seek(0)
-        df = pd.read_csv(uploaded_file, encoding='utf-8', low_memory=False)
-
-    # 2. Advanced Cleaning
-    df = df.dropna(how="all").dropna(axis=1, how="all")
-    
-    # Store original data info for debugging
-    original_shape = df.shape
-    original_columns = df.columns.tolist()
-    
-    # Standardize column names
-    df.columns = [str(c).strip().lower().replace(" ", "_") for c in df.columns]
-    
-    # Debug information (can be removed in production)
-    print(f"Original data shape: {original_shape}")
-    print(f"Columns: {original_columns}")
-    print(f"Standardized columns: {df.columns.tolist()}")
-    
-    # Check for potential data corruption issues
-    numeric_cols = df.select_dtypes(include=['number']).columns
-    print(f"Numeric columns: {list(numeric_cols)}")
-    for col in numeric_cols:
-        zero_count = (df[col] == 0).sum()
-        nan_count = df[col].isna().sum()
-        print(f"Column '{col}': {zero_count} zeros, {nan_count} NaNs")
-    
-    # Additional debugging for Clockify data
-    date_cols = [col for col in df.columns if any(keyword in col.lower() for keyword in ['date', 'time'])]
-    print(f"Date/Time columns identified: {date_cols}")
-    for col in date_cols:
-        sample_values = df[col].dropna().head(3).tolist()
-        print(f"Sample values from '{col}': {sample_values}")
-
-    # Identify key columns
-    col_map = {
-        "person": next((c for c in df.columns if any(x in c for x in ['name', 'employee', 'consultant', 'person'])), None),
-        "project": next((c for c in df.columns if any(x in c for x in ['project', 'task', 'client'])), None),
-        "date": next((c for c in df.columns if any(x in c for x in ['date', 'time', 'period'])), None)
-    }
-
-    # Normalize data - More precise column handling
-    for col in df.columns:
-        # Handle date columns specifically (avoid affecting numeric time columns like Hours)
-        if any(keyword in col.lower() for keyword in ['date', 'start_date', 'end_date', 'created', 'modified']):
-            # Only convert actual date columns, not time duration columns
-            if not any(time_keyword in col.lower() for time_keyword in ['hours', 'minutes', 'duration', 'time_spent', 'decimal']):
-                # Try multiple date formats to handle Clockify data properly
-                try:
-                    # Try common date formats
-                    date_formats = ['%m/%d/%Y', '%d/%m/%Y', '%Y-%m-%d', '%m-%d-%Y']
-                    parsed_date = None
-                    for fmt in date_formats:
-                        try:
-                            parsed_date = pd.to_datetime(df[col], format=fmt, errors='raise')
-                            break
-                        except (ValueError, TypeError):
-                            continue
-                    
-                    # If no specific format works, let pandas infer
-                    if parsed_date is None:
-                        parsed_date = pd.to_datetime(df[col], errors="coerce")
-                        
-                    df[col] = parsed_date.dt.strftime('%B %d, %Y')
-                except Exception:
-                    # If all parsing fails, keep original value
-                    pass
-        elif pd.api.types.is_numeric_dtype(df[col]):
-            # Only fill numeric columns that are actually NaN, preserve 0 values
-            df[col] = df[col].fillna(0) if df[col].isna().any() else df[col]
-        else:
-            df[col] = df[col].fillna("Not Specified")
-
-    # 3. IMPROVED: Create Natural, Information-Dense Chunks
-    sentences = []
-    metadatas = []
-    
-    for idx, row in df.iterrows():
-        # Build natural sentence parts
-        parts = []
-        person_val = "Unknown"
-        project_val = "General"
-        date_val = "Ongoing"
-        
-        for col, val in row.items():
-            # Skip empty or redundant values
-            if val in ["Not Specified", 0, "0", ""]:
-                continue
-                
-            # Extract metadata
-            if col_map["person"] and col == col_map["person"]:
-                person_val = str(val)
-                continue  # Don't repeat in sentence
-            if col_map["project"] and col == col_map["project"]:
-                project_val = str(val)
-                continue
-            if col_map["date"] and col == col_map["date"]:
-                date_val = str(val)
-                continue
-            
-            # Create natural phrases
-            clean_col = col.replace("_", " ").title()
-            parts.append(f"{clean_col}: {val}")
-        
-        # Construct NATURAL sentence
-        if parts:
-            sentence = f"{person_val} ({project_val}): {'; '.join(parts)}"
-        else:
-            sentence = f"{person_val} worked on {project_val}"
-        
-        sentences.append(sentence)
-        metadatas.append({
-            "person": person_val,
-            "project": project_val,
-            "date": date_val,
-            "row_index": idx
-        })
-
-    return sentences, metadatas, df
\ No newline at end of file
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+from typing import Iterator, List, Optional, Tuple
+
+from app_config import (
+    STREAM_CHUNK_ROWS, DATE_SAMPLE_SIZE, SERIALIZE_WORKERS, PARALLEL_SERIALIZE_MIN_ROWS
+)
+
+# Values that are never written into a chunk sentence
+SKIP_VALUES = ["Not Specified", 0, "0", ""]
+
+# Explicit formats tried (in order) before falling back to pandas inference
+DATE_FORMATS = ['%m/%d/%Y', '%d/%m/%Y', '%Y-%m-%d', '%m-%d-%Y']
+
+# Elementwise str() over object arrays (avoids fixed-width numpy unicode buffers)
+_to_text = np.frompyfunc(str, 1, 1)
+
+# Lazily created process pool shared by all ingests in this process
+_serialize_pool = None
+_serialize_pool_workers = 0
+_serialize_pool_lock = threading.Lock()
+
+
+def detect_key_columns(columns) -> dict:
+    """
+    Identify the person / project / date columns used for chunk metadata.
+    """
+    return {
+        "person": next((c for c in columns if any(x in c for x in ['name', 'employee', 'consultant', 'person'])), None),
+        "project": next((c for c in columns if any(x in c for x in ['project', 'task', 'client'])), None),
+        "date": next((c for c in columns if any(x in c for x in ['date', 'time', 'period'])), None)
+    }
+
+def standardize_columns(columns) -> List[str]:
+    """
+    Lower-case, strip and snake_case raw column headers.
+    """
+    return [str(c).strip().lower().replace(" ", "_") for c in columns]
+
+def get_schema_fingerprint(columns) -> str:
+    """
+    Stable id for a column layout (standardized names, in order).
+    """
+    return hashlib.md5("\x1f".join(columns).encode("utf-8")).hexdigest()
+
+def get_schema_profile(schema_profiles: Optional[dict], columns) -> dict:
+    """
+    Fetch (or create) the cached profile for this column layout from a
+    {fingerprint: profile} store. Without a store, a throwaway profile is used.
+    """
+    fingerprint = get_schema_fingerprint(columns)
+    if schema_profiles is None:
+        schema_profiles = {}
+    return schema_profiles.setdefault(fingerprint, {"fingerprint": fingerprint, "date_formats": {}})
+
+def is_date_column(col: str) -> bool:
+    # Handle date columns specifically (avoid affecting numeric time columns like Hours)
+    if any(keyword in col.lower() for keyword in ['date', 'start_date', 'end_date', 'created', 'modified']):
+        # Only convert actual date columns, not time duration columns
+        return not any(time_keyword in col.lower() for time_keyword in ['hours', 'minutes', 'duration', 'time_spent', 'decimal'])
+    return False
+
+def detect_date_format(series: pd.Series, sample_size: int = DATE_SAMPLE_SIZE) -> Optional[str]:
+    """
+    Pick the first of DATE_FORMATS that parses an evenly spaced sample of the
+    column. Returns None when none fit and pandas inference should be used.
+    """
+    values = series.dropna()
+    if values.empty:
+        return None
+    step = max(1, len(values) // sample_size)
+    sample = values.iloc[::step].head(sample_size)
+    for fmt in DATE_FORMATS:
+        try:
+            pd.to_datetime(sample, format=fmt, errors='raise')
+            return fmt
+        except (ValueError, TypeError):
+            continue
+    return None
+
+def parse_date_column(values: pd.Series, fmt: Optional[str]) -> Tuple[pd.Series, Optional[str]]:
+    """
+    Parse a date column with `fmt` (None: pandas inference) in a single pass.
+    A sampled or cached format may not fit every row: when values that are
+    present fail to parse, the first of DATE_FORMATS that parses the whole
+    column is used instead, and otherwise the failed values are parsed one by
+    one. Returns (datetimes, the format that fit every value or the original).
+    """
+    if fmt:
+        parsed = pd.to_datetime(values, format=fmt, errors="coerce")
+    else:
+        parsed = pd.to_datetime(values, errors="coerce")
+    missed = parsed.isna() & values.notna()
+    if not missed.any():
+        return parsed, fmt
+
+    for candidate in DATE_FORMATS:
+        if candidate == fmt:
+            continue
+        try:
+            return pd.to_datetime(values, format=candidate, errors="raise"), candidate
+        except (ValueError, TypeError):
+            continue
+    print(f"Warning: {int(missed.sum())} values of '{values.name}' do not match {fmt or 'the inferred format'}; "
+          f"parsing them individually")
+    parsed = parsed.copy()
+    parsed[missed] = pd.to_datetime(values[missed].astype(str), format="mixed", errors="coerce")
+    return parsed, fmt
+
+def normalize_dataframe(df: pd.DataFrame, schema_profile: Optional[dict] = None) -> pd.DataFrame:
+    """
+    Normalize values in place: readable dates, 0 for missing numbers and
+    "Not Specified" for missing text. Columns must already be standardized.
+
+    Date formats come from `schema_profile["date_formats"]` when the column is
+    already profiled; otherwise they are detected from a sample and recorded there.
+    A format that turns out not to fit the column is replaced (see parse_date_column).
+    """
+    date_formats = schema_profile.setdefault("date_formats", {}) if schema_profile is not None else {}
+    for col in df.columns:
+        if is_date_column(col):
+            try:
+                if col in date_formats:
+                    fmt = date_formats[col]
+                else:
+                    fmt = detect_date_format(df[col])
+                    # Don't pin "infer" for a column that had nothing to sample yet
+                    if fmt is not None or df[col].notna().any():
+                        date_formats[col] = fmt
+
+                # Single pass over the column unless the format misses values
+                parsed_date, fitted = parse_date_column(df[col], fmt)
+                if fitted != fmt:
+                    date_formats[col] = fitted
+
+                df[col] = parsed_date.dt.strftime('%B %d, %Y')
+            except Exception:
+                # If all parsing fails, keep original value
+                pass
+        elif pd.api.types.is_numeric_dtype(df[col]):
+            # Only fill numeric columns that are actually NaN, preserve 0 values
+            df[col] = df[col].fillna(0) if df[col].isna().any() else df[col]
+        else:
+            df[col] = df[col].fillna("Not Specified")
+
+    return df
+
+def clean_and_serialize(uploaded_file, schema_profiles: Optional[dict] = None) -> Tuple[List[str], List[dict], pd.DataFrame]:
+    """
+    OPTIMIZED Processor: Creates clean, information-dense chunks for accurate RAG.
+    Handles Clockify data format specifically to prevent data corruption.
+
+    `schema_profiles` is an optional {fingerprint: profile} store (see
+    app_config.get_schema_profiles); detected date formats are cached in it so
+    later uploads with the same layout skip detection. The layout fingerprint is
+    returned in `df.attrs["schema_fingerprint"]`.
+    """
+    # 1. Load with robust encoding fallbacks
+    try:
+        uploaded_file.seek(0) # Ensure we start from the beginning
+        if uploaded_file.name.endswith(".csv"):
+            # Try with different parameters for better CSV handling
+            df = pd.read_csv(uploaded_file, low_memory=False)
+        else:
+            df = pd.read_excel(uploaded_file)
+    except UnicodeDecodeError:
+        uploaded_file.seek(0) # Reset for the fallback attempt
+        df = pd.read_csv(uploaded_file, encoding='latin1', low_memory=False)
+    except Exception as e:
+        # Handle other potential loading errors
+        uploaded_file.seek(0)
+        df = pd.read_csv(uploaded_file, encoding='utf-8', low_memory=False)
+
+    # Profile is keyed on the full header so it matches streamed chunks of the same layout
+    schema_profile = get_schema_profile(schema_profiles, standardize_columns(df.columns))
+
+    # 2. Advanced Cleaning
+    df = df.dropna(how="all").dropna(axis=1, how="all")
+    
+    # Store original data info for debugging
+    original_shape = df.shape
+    original_columns = df.columns.tolist()
+    
+    # Standardize column names
+    df.columns = standardize_columns(df.columns)
+    
+    # Debug information (can be removed in production)
+    print(f"Original data shape: {original_shape}")
+    print(f"Columns: {original_columns}")
+    print(f"Standardized columns: {df.columns.tolist()}")
+    
+    # Check for potential data corruption issues
+    numeric_cols = df.select_dtypes(include=['number']).columns
+    print(f"Numeric columns: {list(numeric_cols)}")
+    for col in numeric_cols:
+        zero_count = (df[col] == 0).sum()
+        nan_count = df[col].isna().sum()
+        print(f"Column '{col}': {zero_count} zeros, {nan_count} NaNs")
+    
+    # Additional debugging for Clockify data
+    date_cols = [col for col in df.columns if any(keyword in col.lower() for keyword in ['date', 'time'])]
+    print(f"Date/Time columns identified: {date_cols}")
+    for col in date_cols:
+        sample_values = df[col].dropna().head(3).tolist()
+        print(f"Sample values from '{col}': {sample_values}")
+
+    # Identify key columns
+    col_map = detect_key_columns(df.columns)
+
+    # Normalize data - More precise column handling
+    df = normalize_dataframe(df, schema_profile)
+    df.attrs["schema_fingerprint"] = schema_profile["fingerprint"]
+
+    # 3. IMPROVED: Create Natural, Information-Dense Chunks (columnar engine, sharded across processes)
+    sentences, metadatas = serialize_rows_parallel(df, col_map)
+
+    return sentences, metadatas, df
+
+def iter_serialized_batches(uploaded_file, chunk_rows: int = STREAM_CHUNK_ROWS, schema_profiles: Optional[dict] = None,
+                            dtypes: Optional[dict] = None) -> Iterator[Tuple[List[str], List[dict], pd.DataFrame]]:
+    """
+    STREAMING Processor: yields (sentences, metadatas, chunk_df) batches of at
+    most `chunk_rows` rows so large files never have to fit in memory at once.
+    CSV is read with pd.read_csv(chunksize=...), Excel with openpyxl read-only mode.
+
+    Unlike clean_and_serialize(), all-empty columns are kept per chunk: their
+    values normalize to 0 / "Not Specified" and are skipped in sentences anyway,
+    so every chunk keeps the same column layout. Date formats are detected on
+    the first chunk (or taken from `schema_profiles`) and reused for the rest.
+
+    Column dtypes come from a first pass over the whole file (scan_column_dtypes)
+    and every chunk is read as them, so values render exactly as in a single
+    read: an int column with a missing value further down is float everywhere.
+    Pass `dtypes` when the file was already scanned.
+    """
+    col_map = None
+    schema_profile = None
+    if dtypes is None:
+        dtypes = scan_column_dtypes(uploaded_file, chunk_rows)
+    for raw in _iter_raw_chunks(uploaded_file, chunk_rows, dtypes):
+        chunk = raw.dropna(how="all")
+        if chunk.empty:
+            continue
+        chunk.columns = standardize_columns(chunk.columns)
+        if col_map is None:
+            col_map = detect_key_columns(chunk.columns)
+            schema_profile = get_schema_profile(schema_profiles, list(chunk.columns))
+        chunk = normalize_dataframe(chunk, schema_profile)
+        chunk.attrs["schema_fingerprint"] = schema_profile["fingerprint"]
+        sentences, metadatas = serialize_rows(chunk, col_map)
+        yield sentences, metadatas, chunk
+
+def peek_schema_fingerprint(uploaded_file) -> Optional[str]:
+    """Layout fingerprint of an upload from its header alone (see get_schema_profile)."""
+    chunks = _iter_raw_chunks(uploaded_file, 1)
+    try:
+        first = next(chunks, None)
+    finally:
+        chunks.close()
+    return get_schema_fingerprint(standardize_columns(first.columns)) if first is not None else None
+
+def _merge_dtype(a, b):
+    """Dtype a single read gives a column whose chunks were read as `a` and `b`."""
+    if a == b:
+        return a
+    if all(isinstance(d, np.dtype) and d.kind in "iuf" for d in (a, b)):
+        return np.result_type(a, b)
+    return np.dtype(object)
+
+def scan_column_dtypes(uploaded_file, chunk_rows: int = STREAM_CHUNK_ROWS) -> dict:
+    """
+    Raw column -> dtype over the whole file, merged from per-chunk inference the
+    way one read would infer it (ints next to floats or missing values become
+    float, anything mixed with text object). Parses the file once without
+    serializing or embedding it.
+    """
+    dtypes = {}
+    for chunk in _iter_raw_chunks(uploaded_file, chunk_rows):
+        for col, dtype in chunk.dtypes.items():
+            dtypes[col] = _merge_dtype(dtypes[col], dtype) if col in dtypes else dtype
+    return dtypes
+
+def _iter_raw_chunks(uploaded_file, chunk_rows: int, dtypes: Optional[dict] = None) -> Iterator[pd.DataFrame]:
+    """
+    Raw row chunks with a continuous RangeIndex across the whole file. With
+    `dtypes` (see scan_column_dtypes) every chunk is cast to them; text columns
+    of a CSV are read as the raw strings, as a single read keeps them.
+    """
+    uploaded_file.seek(0)
+    if not uploaded_file.name.endswith(".csv"):
+        for chunk in _iter_excel_chunks(uploaded_file, chunk_rows):
+            yield _cast_chunk(chunk, dtypes)
+        return
+
+    text_columns = {c: str for c, d in (dtypes or {}).items() if d == object}
+    rows_yielded = 0
+    try:
+        for chunk in pd.read_csv(uploaded_file, chunksize=chunk_rows, low_memory=False, dtype=text_columns):
+            rows_yielded += len(chunk)
+            yield _cast_chunk(chunk, dtypes)
+    except UnicodeDecodeError:
+        # Restart with latin1 and skip the rows that were already decoded
+        uploaded_file.seek(0)
+        for chunk in pd.read_csv(uploaded_file, chunksize=chunk_rows, encoding='latin1', low_memory=False,
+                                 dtype=text_columns):
+            chunk = chunk[chunk.index >= rows_yielded]
+            if not chunk.empty:
+                yield _cast_chunk(chunk, dtypes)
+
+def _cast_chunk(chunk: pd.DataFrame, dtypes: Optional[dict]) -> pd.DataFrame:
+    if not dtypes:
+        return chunk
+    for col, dtype in dtypes.items():
+        if col in chunk.columns and chunk[col].dtype != dtype:
+            chunk[col] = chunk[col].astype(dtype)
+    return chunk
+
+def _iter_excel_chunks(uploaded_file, chunk_rows: int) -> Iterator[pd.DataFrame]:
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(uploaded_file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        columns = [f"Unnamed: {i}" if c is None else c for i, c in enumerate(header)]
+
+        start = 0
+        batch = []
+        for values in rows:
+            batch.append(values)
+            if len(batch) >= chunk_rows:
+                yield pd.DataFrame(batch, columns=columns, index=pd.RangeIndex(start, start + len(batch)))
+                start += len(batch)
+                batch = []
+        if batch:
+            yield pd.DataFrame(batch, columns=columns, index=pd.RangeIndex(start, start + len(batch)))
+    finally:
+        workbook.close()
+
+def get_row_key_columns(columns, col_map: dict) -> List[str]:
+    """
+    Columns that identify a time entry (who, what, when, description).
+    Values outside these (e.g. duration) may change without changing the key.
+    """
+    identity = {col_map.get("person"), col_map.get("project"), col_map.get("date")}
+    for col in columns:
+        if is_date_column(col) or any(k in col for k in ['user', 'email', 'start', 'end', 'description', 'task']):
+            if not any(k in col for k in ['hours', 'minutes', 'duration', 'decimal']):
+                identity.add(col)
+    key_columns = [c for c in columns if c in identity]
+    return key_columns or list(columns)
+
+def attach_row_keys(sentences: List[str], metadatas: List[dict], df: pd.DataFrame,
+                    seen: Optional[dict] = None) -> List[str]:
+    """
+    Stable ids for append/upsert ingestion. Each row gets
+    row_key = md5(identity column values) + "#<occurrence>" and
+    content_hash = md5(sentence), both also written into its metadata.
+    Pass the same `seen` dict for every chunk of a streamed file so repeated
+    identities keep counting across chunks. Returns the row keys.
+    """
+    col_map = detect_key_columns(df.columns)
+    key_columns = get_row_key_columns(df.columns, col_map)
+    identity = _to_text(df[key_columns[0]].to_numpy(dtype=object))
+    for col in key_columns[1:]:
+        identity = identity + "\x1f" + _to_text(df[col].to_numpy(dtype=object))
+
+    if seen is None:
+        seen = {}
+    row_keys = []
+    for value in identity:
+        base = hashlib.md5(value.encode("utf-8")).hexdigest()
+        occurrence = seen.get(base, 0)
+        seen[base] = occurrence + 1
+        row_keys.append(f"{base}#{occurrence}")
+
+    for key, sentence, metadata in zip(row_keys, sentences, metadatas):
+        metadata["row_key"] = key
+        metadata["content_hash"] = hashlib.md5(sentence.encode("utf-8")).hexdigest()
+    return row_keys
+
+def record_coverage(existing, record_ids) -> float:
+    """Share of the `existing` record ids (a dataset already stored) that reappear in `record_ids`."""
+    if not existing:
+        return 0.0
+    return len(set(record_ids).intersection(existing)) / len(existing)
+
+def diff_records(existing: dict, record_ids: List[str], metadatas: List[dict]) -> Tuple[List[int], List[int], List[str]]:
+    """
+    Compare an upload with a stored dataset ({record_id: content_hash}).
+    Returns (positions of new or changed records, positions of unchanged
+    records, ids of stored records missing from the upload).
+    """
+    changed, unchanged = split_records(existing, record_ids, metadatas)
+    removed = list(set(existing).difference(record_ids))
+    return changed, unchanged, removed
+
+def split_records(existing: dict, record_ids: List[str], metadatas: List[dict]) -> Tuple[List[int], List[int]]:
+    """
+    (positions of new or changed records, positions of unchanged records) of
+    one batch against a stored dataset; diff_records without the removed ids,
+    for streamed uploads compared batch by batch.
+    """
+    changed, unchanged = [], []
+    for i, (record_id, metadata) in enumerate(zip(record_ids, metadatas)):
+        if record_id not in existing or existing[record_id] != metadata["content_hash"]:
+            changed.append(i)
+        else:
+            unchanged.append(i)
+    return changed, unchanged
+
+def dedupe_sentences(sentences: List[str], metadatas: List[dict],
+                     groups: Optional[dict] = None) -> Tuple[List[str], List[dict], List[str], List[str]]:
+    """
+    Collapse identical chunk sentences into one record each, so every distinct
+    sentence is embedded and stored once. Record ids are md5(sentence); merged
+    metadata keeps the first row's fields plus "row_count" and "row_indices"
+    (comma-separated, since vector store metadata must be scalar).
+
+    Pass the same `groups` dict for every batch of a streamed file. Returns
+    (new sentences, their metadatas, their ids, ids of records from earlier
+    batches whose metadata grew and must be re-synced via merged_metadata()).
+    """
+    if groups is None:
+        groups = {}
+    new_ids = []
+    updated = []
+    for sentence, metadata in zip(sentences, metadatas):
+        record_id = metadata.get("content_hash") or hashlib.md5(sentence.encode("utf-8")).hexdigest()
+        group = groups.get(record_id)
+        if group is None:
+            first = {k: v for k, v in metadata.items() if k != "row_key"}
+            first["content_hash"] = record_id
+            groups[record_id] = {"sentence": sentence, "metadata": first, "rows": [metadata.get("row_index")],
+                                 "stored": False}
+            new_ids.append(record_id)
+        else:
+            group["rows"].append(metadata.get("row_index"))
+            if group["stored"]:
+                updated.append(record_id)
+
+    new_sentences = [groups[i]["sentence"] for i in new_ids]
+    new_metadatas = [merged_metadata(groups[i]) for i in new_ids]
+    for record_id in new_ids:
+        group = groups[record_id]
+        group["stored"] = True
+        group["sentence"] = None  # stored; keep only the row bookkeeping
+    return new_sentences, new_metadatas, new_ids, list(dict.fromkeys(updated))
+
+def merged_metadata(group: dict) -> dict:
+    """Metadata of a deduplicated record: first row's fields + row_count + row_indices."""
+    metadata = dict(group["metadata"])
+    metadata["row_count"] = len(group["rows"])
+    metadata["row_indices"] = ",".join(str(r) for r in group["rows"])
+    return metadata
+
+def _row_values_dtype(df: pd.DataFrame):
+    """
+    The dtype iterrows() would give each row Series: numeric frames stay
+    numeric (ints upcast to float next to floats), anything else is object.
+    """
+    dtypes = list(df.dtypes)
+    if dtypes and all(isinstance(d, np.dtype) and d.kind in "iuf" for d in dtypes):
+        return np.result_type(*dtypes)
+    if dtypes and all(isinstance(d, np.dtype) and d.kind == "b" for d in dtypes):
+        return np.dtype(bool)
+    return np.dtype(object)
+
+def serialize_rows(df: pd.DataFrame, col_map: dict) -> Tuple[List[str], List[dict]]:
+    """
+    Columnar serializer: builds the "{person} ({project}): Col: val; ..." chunk
+    sentences and their metadata one column at a time instead of per row.
+    Output is identical to serialize_rows_legacy().
+    """
+    return _build_metadatas(*_serialize_columns(df, col_map))
+
+def _build_metadatas(sentences, persons, projects, dates, row_indices) -> Tuple[List[str], List[dict]]:
+    metadatas = [
+        {"person": p, "project": pr, "date": dt, "row_index": idx}
+        for p, pr, dt, idx in zip(persons, projects, dates, row_indices)
+    ]
+    return sentences, metadatas
+
+def _serialize_columns(df: pd.DataFrame, col_map: dict):
+    """
+    Sentences plus metadata as parallel lists (cheap to pickle back from workers).
+    """
+    n = len(df)
+    row_dtype = _row_values_dtype(df)
+
+    # First matching role wins, same precedence as the per-row loop
+    roles = {}
+    for role in ("person", "project", "date"):
+        col = col_map.get(role)
+        if col and col not in roles:
+            roles[col] = role
+    role_values = {
+        "person": np.full(n, "Unknown", dtype=object),
+        "project": np.full(n, "General", dtype=object),
+        "date": np.full(n, "Ongoing", dtype=object),
+    }
+    body = np.full(n, "", dtype=object)
+
+    for position, col in enumerate(df.columns):
+        values = df.iloc[:, position].to_numpy(dtype=row_dtype)
+        if row_dtype == object:
+            skip = pd.Series(values, dtype=object).isin(SKIP_VALUES).to_numpy()
+        else:
+            skip = values == 0
+        keep = ~skip
+        if not keep.any():
+            continue
+
+        text = _to_text(values[keep])
+        role = roles.get(col)
+        if role:
+            role_values[role][keep] = text
+            continue
+
+        clean_col = col.replace("_", " ").title()
+        piece = f"{clean_col}: " + text
+        current = body[keep]
+        body[keep] = np.where(current == "", piece, current + "; " + piece)
+
+    person, project = role_values["person"], role_values["project"]
+    has_parts = body != ""
+    sentences = np.where(
+        has_parts,
+        person + " (" + project + "): " + body,
+        person + " worked on " + project,
+    ).tolist()
+
+    return sentences, person.tolist(), project.tolist(), role_values["date"].tolist(), df.index.tolist()
+
+def _get_serialize_pool(workers: int):
+    global _serialize_pool, _serialize_pool_workers
+    with _serialize_pool_lock:
+        if _serialize_pool is None or _serialize_pool_workers != workers:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            if _serialize_pool is not None:
+                _serialize_pool.shutdown(wait=False)
+            # spawn: forking the multi-threaded Streamlit server is not safe
+            _serialize_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            _serialize_pool_workers = workers
+        return _serialize_pool
+
+def _reset_serialize_pool():
+    global _serialize_pool
+    with _serialize_pool_lock:
+        if _serialize_pool is not None:
+            _serialize_pool.shutdown(wait=False)
+        _serialize_pool = None
+
+def serialize_rows_parallel(df: pd.DataFrame, col_map: dict, workers: int = SERIALIZE_WORKERS,
+                            min_rows: int = PARALLEL_SERIALIZE_MIN_ROWS) -> Tuple[List[str], List[dict]]:
+    """
+    Split the normalized frame into contiguous row shards, serialize them in a
+    process pool and reassemble in the original row order (row_index metadata
+    comes from the frame index, so it survives sharding). Small frames and
+    workers <= 1 run serialize_rows() in-process.
+    """
+    if workers <= 1 or len(df) < min_rows:
+        return serialize_rows(df, col_map)
+
+    # A couple of shards per worker evens out stragglers
+    shard_count = min(workers * 2, max(1, len(df) // (min_rows // 4 or 1)))
+    bounds = np.linspace(0, len(df), shard_count + 1, dtype=int)
+    shards = [df.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+    try:
+        pool = _get_serialize_pool(workers)
+        results = list(pool.map(_serialize_columns, shards, [col_map] * len(shards)))
+    except Exception as e:
+        # Broken pool (killed worker, spawn failure): fall back to a single process
+        print(f"Parallel serialization failed ({e}); falling back to single process")
+        _reset_serialize_pool()
+        return serialize_rows(df, col_map)
+
+    # pool.map preserves submission order, so concatenation restores row order
+    merged = ([], [], [], [], [])
+    for shard_columns in results:
+        for target, values in zip(merged, shard_columns):
+            target.extend(values)
+    return _build_metadatas(*merged)
+
+def serialize_rows_legacy(df: pd.DataFrame, col_map: dict) -> Tuple[List[str], List[dict]]:
+    """
+    Original iterrows() serializer. Kept as the reference implementation for
+    parity checks and benchmarks.py.
+    """
+    sentences = []
+    metadatas = []
+    
+    for idx, row in df.iterrows():
+        # Build natural sentence parts
+        parts = []
+        person_val = "Unknown"
+        project_val = "General"
+        date_val = "Ongoing"
+        
+        for col, val in row.items():
+            # Skip empty or redundant values
+            if val in SKIP_VALUES:
+                continue
+                
+            # Extract metadata
+            if col_map["person"] and col == col_map["person"]:
+                person_val = str(val)
+                continue  # Don't repeat in sentence
+            if col_map["project"] and col == col_map["project"]:
+                project_val = str(val)
+                continue
+            if col_map["date"] and col == col_map["date"]:
+                date_val = str(val)
+                continue
+            
+            # Create natural phrases
+            clean_col = col.replace("_", " ").title()
+            parts.append(f"{clean_col}: {val}")
+        
+        # Construct NATURAL sentence
+        if parts:
+            sentence = f"{person_val} ({project_val}): {'; '.join(parts)}"
+        else:
+            sentence = f"{person_val} worked on {project_val}"
+        
+        sentences.append(sentence)
+        metadatas.append({
+            "person": person_val,
+            "project": project_val,
+            "date": date_val,
+            "row_index": idx
+        })
+
+    return sentences, metadatas
@@ -0,0 +1,263 @@
+"""
+Quantized vector storage for dataset collections.
+
+An alternative to a Chroma collection for large datasets: vectors are
+L2-normalized and kept as float16, or as int8 with one float32 scale per
+vector (4x smaller than float32). Search scans the quantized matrix in
+blocks, then rescores the best candidates exactly against a float32 copy
+that stays on disk (memory-mapped, only the candidate rows are read).
+
+Layout of a store directory:
+    meta.json       {"dim", "count", "quantization", "rescore"}
+    codes.bin       N x dim int8 / float16, row-major
+    scales.bin      N float32 (int8 only)
+    vectors.f32     N x dim float32 (only when rescoring is enabled)
+    records.parquet ids, documents and JSON metadata; one row group per batch
+"""
+import json
+import os
+import threading
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+
+from app_config import VECTOR_RESCORE, VECTOR_RESCORE_FACTOR
+
+QUANTIZATIONS = ("float16", "int8")
+_SCAN_BLOCK_ROWS = 8192
+
+
+def quantize(vectors: np.ndarray, quantization: str):
+    """(codes, scales) for normalized float32 vectors; scales is None for float16."""
+    if quantization == "float16":
+        return vectors.astype(np.float16), None
+    if quantization == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.rint(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Unknown quantization '{quantization}' (expected one of {QUANTIZATIONS})")
+
+def normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class QuantizedIndex:
+    """
+    Append-only quantized vector file set (see module docstring). Writers call
+    add() per batch and close() once; readers open the directory and search().
+    """
+
+    def __init__(self, path: str, quantization: str = "int8", rescore: bool = VECTOR_RESCORE):
+        self.path = path
+        meta_file = os.path.join(path, "meta.json")
+        if os.path.exists(meta_file):
+            with open(meta_file) as f:
+                meta = json.load(f)
+            quantization, rescore = meta["quantization"], meta["rescore"]
+            self.dim, self.count = meta["dim"], meta["count"]
+        else:
+            self.dim, self.count = None, 0
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization '{quantization}' (expected one of {QUANTIZATIONS})")
+        self.quantization = quantization
+        self.rescore = rescore
+        self._lock = threading.Lock()
+        self._records_writer = None
+        self._metadata_updates = {}
+        self._codes = None
+        self._scales = None
+        self._vectors = None
+        self._row_group_starts = None
+
+    # ---- writing ----
+
+    def add(self, ids: List[str], vectors, documents: List[str], metadatas: List[dict]):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        vectors = normalize(vectors)
+        codes, scales = quantize(vectors, self.quantization)
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            self.dim = vectors.shape[1]
+            with open(os.path.join(self.path, "codes.bin"), "ab") as f:
+                f.write(codes.tobytes())
+            if scales is not None:
+                with open(os.path.join(self.path, "scales.bin"), "ab") as f:
+                    f.write(scales.tobytes())
+            if self.rescore:
+                with open(os.path.join(self.path, "vectors.f32"), "ab") as f:
+                    f.write(vectors.tobytes())
+
+            table = pa.table({
+                "id": pa.array(ids, pa.string()),
+                "document": pa.array(documents, pa.string()),
+                "metadata": pa.array([json.dumps(m or {}) for m in metadatas], pa.string()),
+            })
+            if self._records_writer is None:
+                self._records_writer = pq.ParquetWriter(os.path.join(self.path, "records.parquet"), table.schema)
+            self._records_writer.write_table(table)
+            self.count += len(ids)
+            self._codes = None  # reload on next search
+
+    def update_metadatas(self, ids: List[str], metadatas: List[dict]):
+        """Replace the metadata of already added records (applied when the writer closes)."""
+        with self._lock:
+            self._metadata_updates.update(zip(ids, metadatas))
+
+    def _apply_metadata_updates(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        records_path = os.path.join(self.path, "records.parquet")
+        source = pq.ParquetFile(records_path)
+        tmp_path = records_path + ".tmp"
+        writer = pq.ParquetWriter(tmp_path, source.schema_arrow)
+        # Rewrite group by group so row groups (and get_records offsets) stay the same
+        for group in range(source.num_row_groups):
+            table = source.read_row_group(group)
+            ids = table.column("id").to_pylist()
+            if any(i in self._metadata_updates for i in ids):
+                metadata = table.column("metadata").to_pylist()
+                metadata = [
+                    json.dumps(self._metadata_updates[i]) if i in self._metadata_updates else m
+                    for i, m in zip(ids, metadata)
+                ]
+                table = table.set_column(2, "metadata", pa.array(metadata, pa.string()))
+            writer.write_table(table)
+        writer.close()
+        os.replace(tmp_path, records_path)
+        self._metadata_updates = {}
+
+    def close(self):
+        """Finish writing (the store is readable once meta.json exists)."""
+        with self._lock:
+            if self._records_writer is not None:
+                self._records_writer.close()
+                self._records_writer = None
+            if self._metadata_updates:
+                self._apply_metadata_updates()
+            with open(os.path.join(self.path, "meta.json"), "w") as f:
+                json.dump({"dim": self.dim, "count": self.count,
+                           "quantization": self.quantization, "rescore": self.rescore}, f)
+
+    # ---- reading ----
+
+    def _load(self):
+        if self._codes is not None:
+            return
+        dtype = np.int8 if self.quantization == "int8" else np.float16
+        self._codes = np.fromfile(os.path.join(self.path, "codes.bin"), dtype=dtype).reshape(-1, self.dim)
+        if self.quantization == "int8":
+            self._scales = np.fromfile(os.path.join(self.path, "scales.bin"), dtype=np.float32)
+        vectors_file = os.path.join(self.path, "vectors.f32")
+        if self.rescore and os.path.exists(vectors_file):
+            self._vectors = np.memmap(vectors_file, dtype=np.float32, mode="r").reshape(-1, self.dim)
+
+    def nbytes(self) -> int:
+        """RAM held for search (codes + scales); the float32 copy is memory-mapped."""
+        self._load()
+        return self._codes.nbytes + (self._scales.nbytes if self._scales is not None else 0)
+
+    def search(self, query, k: int = 4, rescore_factor: int = VECTOR_RESCORE_FACTOR):
+        """Top-k (row indices, cosine scores) for a query vector, best first."""
+        with self._lock:
+            self._load()
+        if self.count == 0:
+            return np.array([], dtype=np.int64), np.array([], dtype=np.float32)
+        q = normalize(np.asarray(query, dtype=np.float32)[None, :])[0]
+
+        scores = np.empty(len(self._codes), dtype=np.float32)
+        for start in range(0, len(self._codes), _SCAN_BLOCK_ROWS):
+            block = self._codes[start:start + _SCAN_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + len(block)] = block @ q
+        if self._scales is not None:
+            scores *= self._scales
+
+        n_candidates = min(len(scores), k * rescore_factor if self._vectors is not None else k)
+        candidates = np.argpartition(-scores, n_candidates - 1)[:n_candidates]
+        if self._vectors is not None:
+            rows = np.sort(candidates)  # sequential reads from the memory map
+            scores_exact = np.asarray(self._vectors[rows]) @ q
+            candidates, candidate_scores = rows, scores_exact
+        else:
+            candidate_scores = scores[candidates]
+        order = np.argsort(-candidate_scores)[:k]
+        return candidates[order], candidate_scores[order]
+
+    def get_records(self, rows) -> List[dict]:
+        """{"id", "document", "metadata"} for the given row indices, reading only their row groups."""
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(os.path.join(self.path, "records.parquet"))
+        if self._row_group_starts is None:
+            sizes = [parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)]
+            self._row_group_starts = np.cumsum([0] + sizes)
+        starts = self._row_group_starts
+        records = {}
+        groups = np.searchsorted(starts, rows, side="right") - 1
+        for group in np.unique(groups):
+            table = parquet_file.read_row_group(int(group)).to_pydict()
+            for row in np.asarray(rows)[groups == group]:
+                offset = int(row - starts[group])
+                records[int(row)] = {
+                    "id": table["id"][offset],
+                    "document": table["document"][offset],
+                    "metadata": json.loads(table["metadata"][offset]),
+                }
+        return [records[int(row)] for row in rows]
+
+
+class QuantizedVectorStore(VectorStore):
+    """LangChain vector store over a QuantizedIndex (used like the Chroma store in ingest and RAG)."""
+
+    def __init__(self, path: str, embedding_function, quantization: str = "int8"):
+        self.index = QuantizedIndex(path, quantization)
+        self._embedding = embedding_function
+
+    @property
+    def embeddings(self):
+        return self._embedding
+
+    def add_texts(self, texts, metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs):
+        texts = list(texts)
+        if ids is None:
+            import uuid
+            ids = [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        self.index.add(ids, self._embedding.embed_documents(texts), texts, metadatas)
+        return ids
+
+    def update_metadatas(self, ids, metadatas):
+        self.index.update_metadatas(ids, metadatas)
+
+    def close(self):
+        self.index.close()
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs):
+        rows, scores = self.index.search(self._embedding.embed_query(query), k)
+        records = self.index.get_records(rows)
+        return [
+            (Document(page_content=r["document"], metadata=r["metadata"]), float(score))
+            for r, score in zip(records, scores)
+        ]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    def _select_relevance_score_fn(self):
+        # Cosine similarity is already in [-1, 1]; higher is better
+        return lambda score: score
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, path=None, quantization="int8", **kwargs):
+        store = cls(path, embedding, quantization)
+        store.add_texts(texts, metadatas, ids)
+        store.close()
+        return store
@@ -0,0 +1,479 @@
+"""
+Structured aggregate queries over a prepared dataset view.
+
+Group-by, top-N and date-range questions ("top 5 people by hours on billable
+work last month") are answered exactly from the cached DataFrame instead of
+asking the LLM to add up retrieved rows. The router (intent_rules.py or the
+LLM classifier) produces a plan:
+
+    {"action": "aggregate",
+     "filters": {"billable": "Yes"},                         # as lookup intents
+     "date_range": {"start": "2024-03-01", "end": "2024-03-31"},  # inclusive, optional
+                   # or {"month": 3} for a month named without a year
+     "group_by": "user",                                     # optional
+     "aggregate": {"func": "sum", "column": "hours"},        # sum | mean | count | nunique | list
+     "sort": "desc", "limit": 5}                             # optional
+
+and execute_plan() runs it with vectorized masks and groupby on the view,
+reusing the report helpers below for the shapes they already cover.
+"""
+import calendar
+import datetime as dt
+import re
+
+import pandas as pd
+
+from dataset_views import extract_billable_status, clean_project_name
+
+AGGREGATE_FUNCS = ("sum", "mean", "count", "nunique", "list")
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+
+_MONTH_PATTERN = "|".join(sorted(MONTHS, key=len, reverse=True))
+_DATE_PATTERNS = [
+    ("days", re.compile(r"\b(?:in the |over the )?(?:last|past) (\d+) days\b")),
+    ("today", re.compile(r"\btoday\b")),
+    ("yesterday", re.compile(r"\byesterday\b")),
+    ("relative", re.compile(r"\b(this|last|previous|past) (week|month|quarter|year)\b")),
+    ("month", re.compile(r"\b(?:in|during|for|of|since) (" + _MONTH_PATTERN + r")\.?(?:,? (\d{4}))?\b")),
+    ("year", re.compile(r"\b(?:in|during|for|of) (\d{4})\b")),
+]
+
+
+def parse_date_range(question: str, today: dt.date = None):
+    """
+    (date_range, matched text) for the first date expression in a question,
+    e.g. "last month" -> ({"start": "2024-05-01", "end": "2024-05-31", "label": "last month"}, "last month").
+    A month without a year ("in march") is left as {"month": 3, "label": ...}:
+    execute_plan resolves it against the dataset's dates, not today's.
+    Returns (None, None) when there is none.
+    """
+    q = question.lower()
+    today = today or dt.date.today()
+    for kind, pattern in _DATE_PATTERNS:
+        m = pattern.search(q)
+        if not m:
+            continue
+        if kind == "days":
+            start, end = today - dt.timedelta(days=int(m.group(1)) - 1), today
+        elif kind == "today":
+            start = end = today
+        elif kind == "yesterday":
+            start = end = today - dt.timedelta(days=1)
+        elif kind == "relative":
+            which, unit = m.groups()
+            back = 0 if which == "this" else 1
+            if unit == "week":
+                start = today - dt.timedelta(days=today.weekday() + 7 * back)
+                end = start + dt.timedelta(days=6)
+            elif unit == "month":
+                year, month = divmod(today.year * 12 + today.month - 1 - back, 12)
+                start = dt.date(year, month + 1, 1)
+                end = dt.date(year, month + 1, calendar.monthrange(year, month + 1)[1])
+            elif unit == "quarter":
+                index = (today.year * 12 + today.month - 1) // 3 - back
+                year, quarter = divmod(index, 4)
+                start = dt.date(year, quarter * 3 + 1, 1)
+                end = dt.date(year, quarter * 3 + 3, calendar.monthrange(year, quarter * 3 + 3)[1])
+            else:
+                start, end = dt.date(today.year - back, 1, 1), dt.date(today.year - back, 12, 31)
+        elif kind == "month":
+            month = MONTHS[m.group(1)]
+            if not m.group(2):
+                label = m.group(0).strip()
+                return {"month": month, "label": label}, label
+            year = int(m.group(2))
+            start, end = dt.date(year, month, 1), dt.date(year, month, calendar.monthrange(year, month)[1])
+        else:
+            year = int(m.group(1))
+            if not 1990 <= year <= today.year + 1:
+                continue
+            start, end = dt.date(year, 1, 1), dt.date(year, 12, 31)
+        label = m.group(0).strip()
+        return {"start": start.isoformat(), "end": end.isoformat(), "label": label}, label
+    return None, None
+
+
+# ---- Report helpers ----
+
+def get_billable_projects(df, billable=True):
+    """Get complete list of billable/non-billable projects"""
+    
+    # Extract billable status
+    status_series, format_type = extract_billable_status(df)
+    
+    if status_series is None:
+        return None  # Fallback to RAG
+    
+    # Filter by status
+    # Note: We normalize to 'Yes'/'No' in extract_billable_status
+    target = 'Yes' if billable else 'No'
+    
+    # Handle specific case for boolean columns if they exist
+    if status_series.dtype == bool:
+        filtered_df = df[status_series == billable]
+    else:
+        # String match
+        filtered_df = df[status_series.astype(str).str.lower() == target.lower()]
+    
+    if len(filtered_df) == 0:
+        return None # Let RAG explain why
+    
+    # Get project names
+    if 'project' not in df.columns:
+        return None
+        
+    if format_type == 'embedded':
+        projects = filtered_df['project'].apply(clean_project_name).unique()
+    else:
+        projects = filtered_df['project'].unique()
+    
+    # Format Response
+    status_text = "Billable" if billable else "Non-Billable"
+    count = len(projects)
+    
+    result = f"### {status_text} Projects ({count})\n\n"
+    # Sort for better readability
+    sorted_projects = sorted([p for p in projects if pd.notna(p)])
+    
+    for p in sorted_projects:
+        result += f"- {p}\n"
+        
+    return result
+
+def get_all_employees(df):
+    """Get complete list of employees"""
+    user_col = None
+    for c in ['user', 'employee', 'name', 'person']:
+        if c in df.columns:
+            user_col = c
+            break
+            
+    if not user_col:
+        return None
+        
+    employees = df[user_col].unique()
+    count = len(employees)
+    
+    result = f"### Employees List ({count})\n\n"
+    sorted_employees = sorted([e for e in employees if pd.notna(e)])
+    
+    for e in sorted_employees:
+        result += f"- {e}\n"
+        
+    return result
+
+def get_employee_count(df, question):
+    """Count employees, optionally by project"""
+    q_lower = question.lower()
+    
+    user_col = None
+    for c in ['user', 'employee', 'name', 'person']:
+        if c in df.columns:
+            user_col = c
+            break
+            
+    if not user_col:
+        return None
+    
+    # If asking about specific project
+    if 'project' in df.columns and any(p.lower() in q_lower for p in df['project'].dropna().unique().astype(str)):
+        # Provide breakdown by project
+        project_counts = df.groupby('project', observed=True)[user_col].nunique().sort_values(ascending=False)
+        result = "### Employee Count by Project\n\n"
+        for p, count in project_counts.items():
+            clean_p = clean_project_name(p)
+            result += f"- **{clean_p}**: {count} employees\n"
+        return result
+        
+    # Just total count
+    count = df[user_col].nunique()
+    return f"There are **{count}** unique employees in this dataset."
+
+def get_hours_ranking(df, top_n=10):
+    """Get ranking of employees by hours"""
+    
+    # Find duration/hours column
+    duration_col = None
+    for c in ['duration_(decimal)', 'duration_decimal', 'time_(decimal)', 'hours', 'time_decimal']:
+        if c in df.columns:
+            duration_col = c
+            break
+            
+    if not duration_col:
+        return None
+        
+    user_col = None
+    for c in ['user', 'employee', 'name', 'person']:
+        if c in df.columns:
+            user_col = c
+            break
+            
+    if not user_col:
+        return None
+        
+    # Group and sum
+    ranking = df.groupby(user_col, observed=True)[duration_col].sum().sort_values(ascending=False).head(top_n)
+    
+    result = f"### Top {len(ranking)} Employees by Hours\n\n"
+    for i, (user, hours) in enumerate(ranking.items(), 1):
+        result += f"{i}. **{user}**: {hours:.1f} hours\n"
+        
+    return result
+
+def get_group_breakdown(df):
+    """Breakdown by Group/Department"""
+    if 'group' not in df.columns and 'department' not in df.columns:
+        return None
+        
+    group_col = 'group' if 'group' in df.columns else 'department'
+    
+    # Try to sum hours first
+    duration_col = None
+    for c in ['duration_(decimal)', 'duration_decimal', 'time_(decimal)', 'hours']:
+        if c in df.columns:
+            duration_col = c
+            break
+            
+    if duration_col:
+        breakdown = df.groupby(group_col, observed=True)[duration_col].sum().sort_values(ascending=False)
+        result = "### Hours by Group\n\n"
+        for g, val in breakdown.items():
+            result += f"- **{g}**: {val:.1f} hours\n"
+    else:
+        # Count users
+        user_col = 'user' if 'user' in df.columns else df.columns[0]
+        breakdown = df.groupby(group_col, observed=True)[user_col].nunique().sort_values(ascending=False)
+        result = "### Employee Count by Group\n\n"
+        for g, val in breakdown.items():
+            result += f"- **{g}**: {val} employees\n"
+            
+    return result
+
+
+def _describe(plan: dict, matched: int, total: int) -> str:
+    parts = [f"{k}={v}" for k, v in (plan.get("filters") or {}).items()]
+    date_range = plan.get("date_range")
+    if date_range and date_range.get("start"):
+        parts.append(f"{date_range.get('start')} to {date_range.get('end')}")
+    elif date_range and date_range.get("month"):
+        parts.append(calendar.month_name[int(date_range["month"])])
+    if not parts:
+        return ""
+    return f"*Filters applied: {', '.join(parts)} — matched {matched:,} of {total:,} rows*\n\n"
+
+def _value_label(func, column, is_duration) -> str:
+    if is_duration and func == "sum":
+        return "hours"
+    column = str(column or "entries").replace('_', ' ')
+    return {"sum": f"total {column}", "mean": f"average {column}", "count": "entries",
+            "nunique": f"number of {column}s", "list": f"number of {column}s"}[func]
+
+def _format_value(value, func) -> str:
+    if func in ("count", "nunique"):
+        return f"{int(value):,}"
+    return f"{value:,.2f}"
+
+def _month_occurrences(dates: pd.Series, month: int) -> list:
+    """Years whose `month` lies (at least partly) inside the span of `dates`."""
+    first, last = dates.min(), dates.max()
+    if pd.isna(first):
+        return []
+    return [year for year in range(first.year, last.year + 1)
+            if pd.Timestamp(year, month, 1) <= last
+            and pd.Timestamp(year, month, calendar.monthrange(year, month)[1]) >= first.normalize()]
+
+def execute_plan(view, plan: dict):
+    """
+    Run an aggregate plan (see module docstring) on a DatasetView. Returns a
+    markdown answer, or None when the plan does not fit the dataset (the
+    router then falls back to RAG).
+    """
+    try:
+        df = view.df
+        aggregate = plan.get("aggregate") or {}
+        func = aggregate.get("func", "sum")
+        if func not in AGGREGATE_FUNCS:
+            return None
+
+        mask = view.mask(plan.get("filters") or {})
+        date_range = plan.get("date_range")
+        if date_range:
+            date_col = view.column(date_range["column"]) if date_range.get("column") else view.date_column
+            if date_col is None:
+                return None
+            dates = view.dates(date_col)
+            if date_range.get("month") and not date_range.get("start"):
+                # A month without a year is the one inside the dataset's span
+                month = int(date_range["month"])
+                years = _month_occurrences(dates, month)
+                if len(years) > 1:
+                    name = calendar.month_name[month]
+                    return (f"This dataset covers {name} in more than one year "
+                            f"({', '.join(str(y) for y in years)}). Which year do you mean, "
+                            f"e.g. \"{name} {years[-1]}\"?")
+                if not years:
+                    return _describe(plan, 0, len(df)) + "No data found for this query."
+                year = years[0]
+                date_range = {**date_range, "start": dt.date(year, month, 1).isoformat(),
+                              "end": dt.date(year, month, calendar.monthrange(year, month)[1]).isoformat()}
+                plan = {**plan, "date_range": date_range}
+            start = pd.Timestamp(date_range.get("start") or dates.min())
+            end = pd.Timestamp(date_range.get("end") or dates.max())
+            mask &= ((dates >= start) & (dates <= end)).to_numpy()
+            print(f"Applying date range: {date_col} {start.date()} .. {end.date()} ({int(mask.sum())} rows)")
+
+        matched = int(mask.sum())
+        header = _describe(plan, matched, len(df))
+        if matched == 0:
+            return header + "No data found for this query."
+
+        agg_col = view.column(aggregate["column"]) if aggregate.get("column") else None
+        if agg_col is None and func in ("sum", "mean"):
+            agg_col = view.column("hours")
+        if agg_col is None and func in ("nunique", "list"):
+            return None
+        group_col = view.column(plan["group_by"]) if plan.get("group_by") else None
+        if plan.get("group_by") and group_col is None:
+            return None
+        limit = plan.get("limit")
+        ascending = plan.get("sort") == "asc"
+        person_col = view.column("user")
+        duration_col = view.column("hours")
+
+        # Shapes the existing report helpers already cover (they re-detect billable status from the subset)
+        columns = [c for c in dict.fromkeys([agg_col, group_col, person_col, 'project', view.billable_column])
+                   if c in df.columns]
+        subset = df.loc[mask, columns]
+        if func == "sum" and agg_col == duration_col and not ascending:
+            if group_col is not None and group_col == person_col:
+                report = get_hours_ranking(subset, top_n=limit or 10)
+                if report:
+                    return header + report
+            if group_col in ('group', 'department') and not limit:
+                report = get_group_breakdown(subset)
+                if report:
+                    return header + report
+        if func == "nunique" and agg_col == person_col and group_col is None:
+            report = get_employee_count(subset, "")
+            if report:
+                return header + report
+        if (func == "list" and agg_col == 'project' and group_col is None
+                and set(plan.get("filters") or {}) == {"billable"} and not date_range):
+            report = get_billable_projects(subset, billable=plan["filters"]["billable"] == "Yes")
+            if report:
+                return header + report
+
+        # Generic vectorized path
+        if agg_col == 'project' and view.billable_format == 'embedded':
+            values = view.project_clean[mask]
+        elif agg_col is not None:
+            values = df.loc[mask, agg_col]
+        else:
+            values = pd.Series(1, index=df.index[mask])
+        if func in ("sum", "mean"):
+            values = pd.to_numeric(values, errors="coerce")
+
+        label = _value_label(func, agg_col, agg_col is not None and agg_col == duration_col)
+        if group_col is None:
+            if func == "list":
+                items = sorted((v for v in values.unique() if pd.notna(v)), key=lambda x: str(x).lower())
+                title = str(agg_col).replace('_', ' ').title()
+                return header + f"### {title} ({len(items)})\n\n" + "".join(f"- {v}\n" for v in items)
+            result = {"sum": values.sum, "mean": values.mean, "count": values.count, "nunique": values.nunique}[func]()
+            return header + f"{label[0].upper() + label[1:]}: **{_format_value(result, func)}**"
+
+        if group_col == 'project' and view.billable_format == 'embedded':
+            keys = view.project_clean[mask]
+        else:
+            keys = df.loc[mask, group_col]
+        grouped = values.groupby(keys, observed=True)
+        if func == "list":
+            series = grouped.nunique()
+            func = "nunique"
+        else:
+            series = getattr(grouped, {"count": "size"}.get(func, func))()
+        return header + _format_groups(series, func, label, group_col, limit, ascending)
+
+    except Exception as e:
+        print(f"Aggregate query error: {e}")
+        import traceback
+        traceback.print_exc()
+        return None
+
+def _format_groups(series, func, label, group_col, limit, ascending) -> str:
+    series = series.sort_values(ascending=ascending)
+    if limit:
+        series = series.head(int(limit))
+
+    group_label = str(group_col).replace('_', ' ')
+    title = f"{label[0].upper() + label[1:]} by {group_label}"
+    if limit:
+        title = f"{'Bottom' if ascending else 'Top'} {len(series)}: {title}"
+    result = f"### {title}\n\n"
+    for i, (key, value) in enumerate(series.items(), 1):
+        result += f"{i}. **{key}**: {_format_value(value, func)}\n"
+    return result
+
+def execute_plan_on_cube(cube: dict, plan: dict):
+    """
+    Answer an unfiltered group-by plan (per person / project / billable status /
+    chart column) from the dataset's aggregate cube without reading any rows.
+    Returns None when the cube does not hold the answer, including dimensions
+    folded into "Other" (their groups past the cap are not stored).
+    """
+    from aggregate_cube import dimension_series
+    from dataset_views import find_column
+
+    if not cube or plan.get("filters") or plan.get("date_range") or not plan.get("group_by"):
+        return None
+    aggregate = plan.get("aggregate") or {}
+    func = aggregate.get("func", "sum")
+
+    dimensions = cube.get("dimensions", {})
+    group_by = str(plan["group_by"])
+    dimension = group_by if group_by in ("person", "project", "billable") else None
+    if dimension is None:
+        by_column = {}
+        for name, d in dimensions.items():
+            if name not in ("week", "month"):
+                by_column.setdefault(d["column"], name)
+        column = find_column(list(by_column), group_by)
+        dimension = by_column.get(column)
+    if dimension not in dimensions or dimensions[dimension].get("folded"):
+        return None
+    group_col = dimensions[dimension]["column"]
+
+    from intent_rules import find_duration_column
+    duration_col = find_duration_column(list(cube["numeric"]))
+    if func == "sum":
+        column = find_column(list(cube["numeric"]), aggregate["column"]) if aggregate.get("column") else duration_col
+        if column is None:
+            return None
+        series = dimension_series(cube, dimension, column)
+        label = _value_label(func, column, column == duration_col)
+    elif func == "count":
+        series = dimension_series(cube, dimension, "rows")
+        label = _value_label(func, None, False)
+    elif func in ("nunique", "list"):
+        column = find_column(list(cube["distinct"]), aggregate.get("column") or "")
+        if column is None:
+            return None
+        series = dimension_series(cube, dimension, "distinct:" + column)
+        if series.empty:
+            return None
+        func = "nunique"
+        label = _value_label(func, column, False)
+    else:
+        return None
+
+    print(f"🧊 Answered {dimension} aggregate from cube")
+    ascending = plan.get("sort") == "asc"
+    if dimension == "person" and func == "sum" and column == duration_col and not ascending:
+        # Same report as get_hours_ranking
+        ranking = series.sort_values(ascending=False).head(int(plan.get("limit") or 10))
+        result = f"### Top {len(ranking)} Employees by Hours\n\n"
+        for i, (user, hours) in enumerate(ranking.items(), 1):
+            result += f"{i}. **{user}**: {hours:.1f} hours\n"
+        return result
+    return _format_groups(series, func, label, group_col, plan.get("limit"), ascending)
@@ -1,47 +1,152 @@
 
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from langchain_groq import ChatGroq
-from langchain_huggingface import HuggingFaceEmbeddings
 from langchain_community.vectorstores import Chroma
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnablePassthrough
 
-from app_config import LLM_MODEL, EMBEDDING_MODEL, PERSIST_DIRECTORY
+from app_config import (
+    LLM_MODEL, EMBEDDING_BACKEND, PERSIST_DIRECTORY, RAG_CHAIN_CACHE_SIZE, SPECULATIVE_RETRIEVAL_WORKERS
+)
+from embeddings import get_embedding_model
+from vector_store import get_client, close_client, close_all_clients, close_clients_under, is_within, LEGACY_COLLECTION
 
-def get_rag_chain(api_key, db_path=None, username=None):
+# Compiled chains keyed by (db_path, collection) (LRU), shared across Streamlit sessions
+_chain_cache = OrderedDict()
+_chain_cache_lock = threading.Lock()
+# Background retrieval started while the query router is still classifying
+_retrieval_pool = None
+_retrieval_pool_lock = threading.Lock()
+
+class _NoticeChain:
+    """Stand-in chain that retrieves nothing and answers every question with `message`."""
+
+    def __init__(self, message):
+        self.message = message
+
+    def retrieve(self, query):
+        return None
+
+    def invoke(self, input_dict):
+        return {"answer": self.message}
+
+def get_rag_chain(api_key, db_path=None, username=None, collection_name=LEGACY_COLLECTION,
+                  vector_quantization=None, embedding_space=None):
     """
     OPTIMIZED RAG Engine with improved prompt and retrieval settings.
+    Chains are cached per dataset so repeat questions skip client/LLM/LCEL setup.
+    `collection_name` selects the dataset inside a shared store (see vector_store);
+    `vector_quantization` marks a QuantizedVectorStore directory instead of Chroma.
+    `embedding_space` is the space the dataset was embedded in: questions are not
+    searched with vectors from another one (EMBEDDING_BACKEND changed since).
     """
-    # 1. Embeddings
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-
-    # 2. Vector DB
     from app_config import get_active_db_path
-    import chromadb
     active_path = db_path if db_path else get_active_db_path(username)
     
     # If no path available yet, return a dummy or wait
     if not active_path or not os.path.exists(active_path):
-        class DummyChain:
-            def invoke(self, input_dict):
-                return {"answer": "The Knowledge Base is not yet initialized. Please upload a file."}
-        return DummyChain()
-
-    # Use the same client approach as ingest.py for consistency and stability
-    client = chromadb.PersistentClient(
-        path=active_path,
-        settings=chromadb.config.Settings(
-            anonymized_telemetry=False,
-            is_persistent=True
+        return _NoticeChain("The Knowledge Base is not yet initialized. Please upload a file.")
+
+    if embedding_space is not None:
+        embeddings = get_embedding_model()
+        embeddings.load()
+        if embeddings.space != embedding_space:
+            print(f"Refusing retrieval: dataset embedded as {embedding_space}, backend produces {embeddings.space}")
+            return _NoticeChain(
+                f"This dataset was embedded with a different embedding backend ({embedding_space}) than the "
+                f"one now configured (EMBEDDING_BACKEND={EMBEDDING_BACKEND}), so its search results would be "
+                "meaningless. Switch the backend back, or delete the dataset and upload it again."
+            )
+
+    key = (active_path, collection_name)
+    with _chain_cache_lock:
+        cached = _chain_cache.get(key)
+        if cached is not None and cached[0] == api_key:
+            _chain_cache.move_to_end(key)
+            return cached[1]
+
+    chain = _build_rag_chain(api_key, active_path, collection_name, vector_quantization)
+
+    evicted = []
+    with _chain_cache_lock:
+        _chain_cache[key] = (api_key, chain)
+        _chain_cache.move_to_end(key)
+        while len(_chain_cache) > RAG_CHAIN_CACHE_SIZE:
+            evicted.append(_chain_cache.popitem(last=False)[0])
+    for path, name in evicted:
+        # Shared stores stay open for their other datasets (and running ingests)
+        if name == LEGACY_COLLECTION:
+            close_client(path)
+    return chain
+
+def prefetch_context(chain, query):
+    """
+    Start retrieving context for `query` in the background (speculatively, while
+    the router decides between lookup and RAG). Returns a Future of
+    (context, seconds); pass the context to chain.invoke() to skip retrieval,
+    or cancel the future when the lookup path answers.
+    """
+    global _retrieval_pool
+    with _retrieval_pool_lock:
+        if _retrieval_pool is None:
+            _retrieval_pool = ThreadPoolExecutor(max_workers=SPECULATIVE_RETRIEVAL_WORKERS,
+                                                 thread_name_prefix="retrieval")
+
+    def run():
+        start = time.perf_counter()
+        context = chain.retrieve(query)
+        return context, time.perf_counter() - start
+
+    return _retrieval_pool.submit(run)
+
+def evict_rag_chain(db_path, collection_name=LEGACY_COLLECTION):
+    """
+    Drop the cached chain for a dataset (call before deleting it). Legacy
+    per-upload stores also have their Chroma handles closed.
+    """
+    with _chain_cache_lock:
+        _chain_cache.pop((db_path, collection_name), None)
+    if collection_name == LEGACY_COLLECTION:
+        close_client(db_path)
+
+def clear_rag_cache(root=None):
+    """
+    Drop cached chains and close Chroma handles. With `root` (a user's vector
+    DB directory, factory reset) only stores inside it are affected; other
+    users, the node-wide store and running ingests keep their handles.
+    """
+    with _chain_cache_lock:
+        if root is None:
+            _chain_cache.clear()
+        else:
+            for key in [k for k in _chain_cache if is_within(k[0], root)]:
+                del _chain_cache[key]
+    if root is None:
+        close_all_clients()
+    else:
+        close_clients_under(root)
+
+def _build_rag_chain(api_key, active_path, collection_name=LEGACY_COLLECTION, vector_quantization=None):
+    # 1. Embeddings (process-wide warm instance)
+    embeddings = get_embedding_model()
+
+    # 2. Vector DB (client shared with ingest.py for consistency and stability)
+    if vector_quantization:
+        from quantized_store import QuantizedVectorStore
+        vectorstore = QuantizedVectorStore(active_path, embeddings, vector_quantization)
+    else:
+        client = get_client(active_path)
+        
+        vectorstore = Chroma(
+            client=client,
+            collection_name=collection_name,
+            embedding_function=embeddings,
         )
-    )
-    
-    vectorstore = Chroma(
-        client=client,
-        collection_name="employee_kb",
-        embedding_function=embeddings,
-    )
 
     # IMPROVED: Increase retrieval count for better coverage
     retriever = vectorstore.as_retriever(search_kwargs={"k": 20})
@@ -120,7 +225,10 @@ def get_rag_chain(api_key, db_path=None, username=None):
         # Number the context for better LLM comprehension
         formatted = []
         for i, doc in enumerate(docs, 1):
-            formatted.append(f"[{i}] {doc.page_content}")
+            # Deduplicated records stand for every identical source row
+            repeats = doc.metadata.get("row_count", 1) if doc.metadata else 1
+            suffix = f" (appears {repeats} times)" if repeats > 1 else ""
+            formatted.append(f"[{i}] {doc.page_content}{suffix}")
         return "\n".join(formatted)
 
     # Helper function to extract query from input dict
@@ -131,7 +239,7 @@ def get_rag_chain(api_key, db_path=None, username=None):
 
     rag_chain = (
         {
-            "context": lambda x: format_docs(retriever.invoke(get_query(x))), 
+            "context": lambda x: x["context"],
             "input": lambda x: get_query(x),
             "chat_history": lambda x: x.get("chat_history", "") if isinstance(x, dict) else ""
         }
@@ -140,11 +248,22 @@ def get_rag_chain(api_key, db_path=None, username=None):
         | StrOutputParser()
     )
 
-    # Return wrapper that accepts chat_history
+    # Return wrapper that accepts chat_history (and optionally prefetched context)
     class WrappedChain:
+        def retrieve(self, query):
+            """Formatted context for a query (the retrieval stage on its own)."""
+            return format_docs(retriever.invoke(query))
+
         def invoke(self, input_dict):
             query = input_dict.get("input", "")
             chat_history = input_dict.get("chat_history", [])
+            timings = {}
+
+            context = input_dict.get("context")
+            if context is None:
+                start = time.perf_counter()
+                context = self.retrieve(query)
+                timings["retrieval"] = time.perf_counter() - start
             
             # Format chat history as a string
             history_str = ""
@@ -157,7 +276,9 @@ def get_rag_chain(api_key, db_path=None, username=None):
                     history_lines.append(f"{role}: {msg['content']}")
                 history_str = "\n".join(history_lines)
             
-            result = rag_chain.invoke({"input": query, "chat_history": history_str})
-            return {"answer": result}
+            start = time.perf_counter()
+            result = rag_chain.invoke({"input": query, "chat_history": history_str, "context": context})
+            timings["generation"] = time.perf_counter() - start
+            return {"answer": result, "timings": timings}
             
     return WrappedChain()
@@ -0,0 +1,266 @@
+"""
+Dataset registry on embedded SQLite.
+
+Replaces the per-user dataset_hash.json files: every write is a single
+transaction, lookups by hash (including the source hashes of appended
+uploads) and filename are indexed, and reads are served from an in-process
+cache that is invalidated through a change counter bumped by every write, so
+other sessions and processes see updates immediately.
+
+Existing JSON registries are imported on first access and renamed to
+dataset_hash.json.migrated.
+
+Per-user schema profiles (cached date formats per column layout) live in the
+same database, one row per fingerprint, so concurrent ingests of different
+layouts never overwrite each other; schema_profiles.json files are imported
+the same way.
+"""
+import copy
+import json
+import os
+import sqlite3
+import threading
+
+from app_config import REGISTRY_DB_PATH, get_user_storage_paths
+
+_lock = threading.RLock()
+_conn = None
+_cache = {}            # username -> list of entries, valid for _cache_version
+_cache_version = None
+_checked_users = set()  # users whose JSON registry was already looked for
+_checked_profile_users = set()  # users whose schema_profiles.json was already looked for
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(REGISTRY_DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(REGISTRY_DB_PATH, check_same_thread=False, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS datasets ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, hash TEXT NOT NULL,"
+            " filename TEXT NOT NULL, entry TEXT NOT NULL, UNIQUE (username, hash));"
+            "CREATE INDEX IF NOT EXISTS idx_datasets_filename ON datasets(username, filename);"
+            "CREATE TABLE IF NOT EXISTS source_hashes ("
+            " username TEXT NOT NULL, source_hash TEXT NOT NULL, dataset_hash TEXT NOT NULL,"
+            " PRIMARY KEY (username, source_hash));"
+            "CREATE TABLE IF NOT EXISTS schema_profiles ("
+            " username TEXT NOT NULL, fingerprint TEXT NOT NULL, profile TEXT NOT NULL,"
+            " PRIMARY KEY (username, fingerprint));"
+            "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);"
+            "INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);"
+        )
+        _conn = conn
+    return _conn
+
+
+class _transaction:
+    """BEGIN IMMEDIATE ... COMMIT under the process lock; bumps the change counter (unless bump=False)."""
+
+    def __init__(self, bump: bool = True):
+        self.bump = bump
+
+    def __enter__(self):
+        _lock.acquire()
+        self.conn = _db()
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            if exc_type is None:
+                if self.bump:
+                    self.conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+                self.conn.execute("COMMIT")
+            else:
+                self.conn.execute("ROLLBACK")
+        finally:
+            _lock.release()
+        return False
+
+
+def _version(conn) -> int:
+    return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+def _write_entry(conn, username, entry):
+    conn.execute(
+        "INSERT INTO datasets (username, hash, filename, entry) VALUES (?, ?, ?, ?)"
+        " ON CONFLICT (username, hash) DO UPDATE SET filename = excluded.filename, entry = excluded.entry",
+        (username, entry["hash"], entry.get("filename", ""), json.dumps(entry))
+    )
+    conn.execute("DELETE FROM source_hashes WHERE username = ? AND dataset_hash = ?", (username, entry["hash"]))
+    conn.executemany(
+        "INSERT OR REPLACE INTO source_hashes (username, source_hash, dataset_hash) VALUES (?, ?, ?)",
+        [(username, source_hash, entry["hash"]) for source_hash in entry.get("source_hashes", [])]
+    )
+
+
+def _read_json_registry(username):
+    """The pre-SQLite registry file of a user (either JSON format), or None."""
+    user_paths = get_user_storage_paths(username)
+    hash_file = user_paths["hash_file"]
+    if not os.path.exists(hash_file):
+        return None
+    try:
+        with open(hash_file, "r") as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"Warning: unreadable registry {hash_file}: {e}")
+        return None
+    if "datasets" in data:
+        return data["datasets"]
+    # Backward compatibility for old single-file format
+    if "active_db_path" in data:
+        return [{
+            "filename": data.get("filenames", ["Legacy Dataset"])[0],
+            "db_path": data.get("active_db_path"),
+            "csv_path": os.path.join(user_paths["metadata"], "active_data.csv"),
+            "hash": data.get("hashes", ["unknown"])[0]
+        }]
+    return []
+
+def _import_json_registry(username):
+    """Move a user's JSON registry into SQLite once per process (no-op when there is none)."""
+    if username in _checked_users:
+        return
+    with _lock:
+        if username in _checked_users:
+            return
+        datasets = _read_json_registry(username)
+        if datasets is not None:
+            with _transaction() as conn:
+                for entry in datasets:
+                    if entry.get("hash"):
+                        _write_entry(conn, username, entry)
+            hash_file = get_user_storage_paths(username)["hash_file"]
+            os.replace(hash_file, hash_file + ".migrated")
+            print(f"Migrated {len(datasets)} registry entries for {username} to SQLite")
+        _checked_users.add(username)
+
+
+def get_datasets(username):
+    """All datasets of a user in upload order (copies; safe to modify)."""
+    global _cache_version
+    _import_json_registry(username)
+    with _lock:
+        conn = _db()
+        version = _version(conn)
+        if version != _cache_version:
+            _cache.clear()
+            _cache_version = version
+        if username not in _cache:
+            rows = conn.execute("SELECT entry FROM datasets WHERE username = ? ORDER BY id", (username,)).fetchall()
+            _cache[username] = [json.loads(row[0]) for row in rows]
+        return copy.deepcopy(_cache[username])
+
+def find_dataset(username, dataset_hash):
+    """The dataset built from an upload with this hash (its own or an appended upload's), or None."""
+    _import_json_registry(username)
+    with _lock:
+        row = _db().execute(
+            "SELECT entry FROM datasets WHERE username = ? AND hash = ?"
+            " UNION ALL"
+            " SELECT d.entry FROM source_hashes s JOIN datasets d"
+            "  ON d.username = s.username AND d.hash = s.dataset_hash"
+            " WHERE s.username = ? AND s.source_hash = ?"
+            " LIMIT 1",
+            (username, dataset_hash, username, dataset_hash)
+        ).fetchone()
+    return json.loads(row[0]) if row else None
+
+def find_datasets_by_filename(username, filename):
+    _import_json_registry(username)
+    with _lock:
+        rows = _db().execute(
+            "SELECT entry FROM datasets WHERE username = ? AND filename = ? ORDER BY id", (username, filename)
+        ).fetchall()
+    return [json.loads(row[0]) for row in rows]
+
+def upsert_dataset(username, entry):
+    """Insert a dataset, or replace the one with the same hash in place."""
+    _import_json_registry(username)
+    with _transaction() as conn:
+        _write_entry(conn, username, entry)
+    return entry
+
+def delete_dataset(username, dataset_hash):
+    _import_json_registry(username)
+    with _transaction() as conn:
+        conn.execute("DELETE FROM datasets WHERE username = ? AND hash = ?", (username, dataset_hash))
+        conn.execute("DELETE FROM source_hashes WHERE username = ? AND dataset_hash = ?", (username, dataset_hash))
+
+def replace_datasets(username, datasets):
+    """Overwrite a user's whole registry in one transaction."""
+    _import_json_registry(username)
+    with _transaction() as conn:
+        conn.execute("DELETE FROM datasets WHERE username = ?", (username,))
+        conn.execute("DELETE FROM source_hashes WHERE username = ?", (username,))
+        for entry in datasets:
+            _write_entry(conn, username, entry)
+
+def list_usernames():
+    """Every user with at least one registered dataset."""
+    with _lock:
+        rows = _db().execute("SELECT DISTINCT username FROM datasets ORDER BY username").fetchall()
+    return [row[0] for row in rows]
+
+
+def _merge_profile(conn, username, profile):
+    """Upsert one profile; date formats already stored for other columns are kept."""
+    row = conn.execute(
+        "SELECT profile FROM schema_profiles WHERE username = ? AND fingerprint = ?",
+        (username, profile["fingerprint"])
+    ).fetchone()
+    if row:
+        stored = json.loads(row[0])
+        profile = {**stored, **profile,
+                   "date_formats": {**stored.get("date_formats", {}), **profile.get("date_formats", {})}}
+    conn.execute(
+        "INSERT OR REPLACE INTO schema_profiles (username, fingerprint, profile) VALUES (?, ?, ?)",
+        (username, profile["fingerprint"], json.dumps(profile))
+    )
+
+def _import_json_profiles(username):
+    """Move a user's schema_profiles.json into SQLite once per process (no-op when there is none)."""
+    if username in _checked_profile_users:
+        return
+    with _lock:
+        if username in _checked_profile_users:
+            return
+        schema_file = get_user_storage_paths(username)["schema_file"]
+        if os.path.exists(schema_file):
+            try:
+                with open(schema_file, "r") as f:
+                    profiles = json.load(f)
+            except Exception as e:
+                print(f"Warning: unreadable schema profiles {schema_file}: {e}")
+                profiles = {}
+            with _transaction(bump=False) as conn:
+                for fingerprint, profile in profiles.items():
+                    _merge_profile(conn, username, {**profile, "fingerprint": fingerprint})
+            os.replace(schema_file, schema_file + ".migrated")
+            print(f"Migrated {len(profiles)} schema profiles for {username} to SQLite")
+        _checked_profile_users.add(username)
+
+def get_schema_profiles(username):
+    """{fingerprint: profile} of a user (copies; safe to modify)."""
+    _import_json_profiles(username)
+    with _lock:
+        rows = _db().execute(
+            "SELECT fingerprint, profile FROM schema_profiles WHERE username = ?", (username,)
+        ).fetchall()
+    return {fingerprint: json.loads(profile) for fingerprint, profile in rows}
+
+def save_schema_profiles(username, profiles):
+    """Merge profiles into the stored ones in one transaction (other layouts are left as they are)."""
+    _import_json_profiles(username)
+    with _transaction(bump=False) as conn:
+        for fingerprint, profile in profiles.items():
+            _merge_profile(conn, username, {**profile, "fingerprint": fingerprint})
+
+def delete_schema_profiles(username):
+    _import_json_profiles(username)
+    with _transaction(bump=False) as conn:
+        conn.execute("DELETE FROM schema_profiles WHERE username = ?", (username,))
@@ -0,0 +1,52 @@
+import pandas as pd
+
+import aggregate_cube
+from aggregate_cube import OTHER, build_cube, dimension_series
+from dataset_store import write_snapshot
+from dataset_views import DatasetView
+from query_planner import execute_plan, execute_plan_on_cube
+
+
+def _snapshot(tmp_path):
+    df = pd.DataFrame({
+        "user": ["Ann", "Bob", "Cid", "Ann", "Bob", "Cid", "Dee", "Eve"],
+        "client": ["Acme", "Acme", "Acme", "Beta", "Beta", "Core", "Dyn", "Echo"],
+        "hours": [1.0, 2.0, 3.0, 4.0, 5.0, 6.0, 70.0, 8.0],
+    })
+    return write_snapshot(df, str(tmp_path / "data.parquet")), df
+
+
+def test_folded_dimension_is_not_used_for_exact_answers(tmp_path, monkeypatch):
+    monkeypatch.setattr(aggregate_cube, "CUBE_MAX_CATEGORY_GROUPS", 2)
+    path, df = _snapshot(tmp_path)
+    cube = build_cube(path)
+
+    category = cube["dimensions"]["category"]
+    assert category["column"] == "client"
+    assert category["folded"]
+    assert OTHER in category["groups"]
+
+    plan = {"action": "aggregate", "group_by": "client", "aggregate": {"func": "sum", "column": "hours"},
+            "sort": "desc", "limit": 1}
+    assert execute_plan_on_cube(cube, plan) is None
+    # The full frame still ranks the small client with the most hours first
+    assert "**Dyn**: 70.00" in execute_plan(DatasetView(df), plan)
+
+
+def test_chart_series_keeps_other_group(tmp_path, monkeypatch):
+    monkeypatch.setattr(aggregate_cube, "CUBE_MAX_CATEGORY_GROUPS", 2)
+    path, df = _snapshot(tmp_path)
+    series = dimension_series(build_cube(path), "category", "hours")
+
+    assert series.sum() == df["hours"].sum()
+    assert series[OTHER] == 6.0 + 70.0 + 8.0
+
+
+def test_unfolded_dimension_is_answered_from_cube(tmp_path):
+    path, _ = _snapshot(tmp_path)
+    cube = build_cube(path)
+    plan = {"action": "aggregate", "group_by": "client", "aggregate": {"func": "sum", "column": "hours"},
+            "sort": "desc", "limit": 1}
+
+    assert not cube["dimensions"]["category"].get("folded")
+    assert "**Dyn**: 70.00" in execute_plan_on_cube(cube, plan)
@@ -0,0 +1,122 @@
+import pandas as pd
+
+from dataset_store import SnapshotWriter, read_snapshot, write_snapshot
+
+
+def test_text_in_a_later_chunk_widens_numeric_column(tmp_path):
+    path = str(tmp_path / "data.parquet")
+    writer = SnapshotWriter(path)
+    writer.write(pd.DataFrame({"ticket": [101.0, 102.0], "hours": [1.5, 2.0]}))
+    writer.write(pd.DataFrame({"ticket": ["103", "OPS-7"], "hours": [3.0, 4.25]}))
+    writer.close()
+
+    df = read_snapshot(path)
+    assert df["ticket"].tolist() == ["101", "102", "103", "OPS-7"]
+    assert df["hours"].tolist() == [1.5, 2.0, 3.0, 4.25]
+    assert writer.rows == 4
+
+
+def test_numbers_stay_numeric_across_chunks(tmp_path):
+    path = str(tmp_path / "data.parquet")
+    writer = SnapshotWriter(path)
+    writer.write(pd.DataFrame({"hours": [1.0, 2.0]}))
+    writer.write(pd.DataFrame({"hours": [3, 4]}))
+    writer.close()
+
+    df = read_snapshot(path)
+    assert pd.api.types.is_float_dtype(df["hours"])
+    assert df["hours"].sum() == 10.0
+
+
+def test_missing_text_stays_null(tmp_path):
+    path = str(tmp_path / "data.parquet")
+    writer = SnapshotWriter(path)
+    writer.write(pd.DataFrame({"date": ["March 01, 2024", None]}))
+    writer.write(pd.DataFrame({"date": [float("nan"), "March 03, 2024"]}))
+    writer.close()
+
+    df = read_snapshot(path)
+    assert df["date"].isna().tolist() == [False, True, True, False]
+    assert "nan" not in df["date"].tolist()
+
+
+def test_write_snapshot_keeps_nulls_in_mixed_columns(tmp_path):
+    path = str(tmp_path / "data.parquet")
+    write_snapshot(pd.DataFrame({"code": [7, "x", None]}), path)
+
+    assert read_snapshot(path)["code"].tolist()[:2] == ["7", "x"]
+    assert pd.isna(read_snapshot(path)["code"].iloc[2])
+
+
+def test_export_writes_the_rows_of_the_on_screen_filter(tmp_path):
+    from dataset_store import export_filtered_csv, filter_mask, get_dataframe
+
+    path = write_snapshot(pd.DataFrame({"user": ["Ann", "Bob", "Ann"], "hours": [5.0, 2.5, 1.0]}),
+                          str(tmp_path / "data.parquet"))
+    df = get_dataframe(path)
+    mask = filter_mask(df, search=None, filters={"hours": "5"})
+
+    out = str(tmp_path / "export.csv")
+    assert export_filtered_csv(df, out, mask, ["hours", "user"]) == int(mask.sum())
+    exported = pd.read_csv(out)
+    assert exported.columns.tolist() == ["hours", "user"]
+    assert exported["user"].tolist() == df.loc[mask, "user"].tolist()
+
+
+def test_frame_over_budget_is_kept_instead_of_reread(tmp_path, monkeypatch):
+    import dataset_store
+
+    monkeypatch.setattr(dataset_store, "DATAFRAME_CACHE_MAX_MB", 0)
+    monkeypatch.setattr(dataset_store, "DATAFRAME_CACHE_MAX_OVERSIZED", 1)
+    dataset_store.clear_dataframe_cache()
+    first = write_snapshot(pd.DataFrame({"user": ["Ann", "Bob"], "hours": [1.0, 2.0]}), str(tmp_path / "a.parquet"))
+    second = write_snapshot(pd.DataFrame({"user": ["Cid"], "hours": [3.0]}), str(tmp_path / "b.parquet"))
+
+    df = dataset_store.get_dataframe(first)
+    assert dataset_store.get_dataframe(first) is df
+    dataset_store.get_dataframe(second)
+    assert dataset_store.get_dataframe(first) is not df  # only one over-budget frame is held
+    stats = dataset_store.get_dataframe_cache_stats()
+    assert stats["oversized_entries"] == 1 and stats["entries"] == 0
+
+    dataset_store.evict_dataframe(first)
+    assert dataset_store.get_dataframe_cache_stats()["oversized_bytes"] == 0
+    dataset_store.clear_dataframe_cache()
+
+
+def test_downcast_uses_detected_entity_columns():
+    from dataset_store import _downcast
+
+    df = _downcast(pd.DataFrame({"employee_name": ["Ann", "Bob", "Cid"], "client_project": ["A", "B", "C"],
+                                 "notes": ["x", "y", "z"]}))
+    assert isinstance(df["employee_name"].dtype, pd.CategoricalDtype)
+    assert isinstance(df["client_project"].dtype, pd.CategoricalDtype)
+    assert df["notes"].dtype == object
+
+
+def test_projected_frames_are_cached_and_reused(tmp_path, monkeypatch):
+    import dataset_store
+
+    dataset_store.clear_dataframe_cache()
+    path = write_snapshot(pd.DataFrame({"user": ["Ann", "Bob"], "project": ["A", "B"], "hours": [1.0, 2.5]}),
+                          str(tmp_path / "data.parquet"))
+    reads = []
+    read_snapshot = dataset_store.read_snapshot
+    monkeypatch.setattr(dataset_store, "read_snapshot", lambda p, columns=None: reads.append(columns) or read_snapshot(p, columns))
+
+    user = dataset_store.get_dataframe(path, columns=["user"])
+    assert user.columns.tolist() == ["user"]
+    assert dataset_store.get_dataframe(path, columns=["user"]) is user
+
+    wider = dataset_store.get_dataframe(path, columns=["user", "hours"])
+    assert wider.columns.tolist() == ["user", "hours"]
+    assert dataset_store.get_dataframe(path, columns=["hours"]) is wider  # a cached wider projection serves it
+    assert dataset_store.get_dataframe_cache_stats()["entries"] == 1  # the narrower one was superseded
+
+    full = dataset_store.get_dataframe(path)
+    assert dataset_store.get_dataframe(path, columns=["project"]) is full
+    assert reads == [("user",), ("user", "hours"), None]
+
+    dataset_store.evict_dataframe(path)
+    assert dataset_store.get_dataframe_cache_stats()["entries"] == 0
+    dataset_store.clear_dataframe_cache()
@@ -0,0 +1,31 @@
+import disk_cache
+from disk_cache import SqliteLRUCache
+
+
+def test_full_cache_evicts_a_batch_of_least_recently_used(tmp_path):
+    cache = SqliteLRUCache(str(tmp_path / "cache.db"), max_entries=10, evict_fraction=0.5)
+    cache.put_many({f"k{i}": b"v" for i in range(10)})
+    cache.get_many(["k0"])
+    cache.put_many({"k0": b"new"})  # refreshing a key does not grow the cache
+    assert len(cache) == 10
+
+    cache.put_many({"k10": b"v"})
+    assert len(cache) == 5
+    assert cache.get_stats()["evictions"] == 6
+    assert set(cache.get_many([f"k{i}" for i in range(11)])) == {"k0", "k7", "k8", "k9", "k10"}
+
+
+def test_expired_entries_are_missing_before_the_sweep(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(disk_cache.time, "time", lambda: now[0])
+    cache = SqliteLRUCache(str(tmp_path / "cache.db"), max_entries=10, ttl_seconds=5)
+    cache.put_many({"a": b"1"})
+
+    now[0] += 10
+    assert cache.get_many(["a"]) == {}
+    assert len(cache) == 1  # not swept yet
+
+    now[0] += SqliteLRUCache._SWEEP_SECONDS
+    cache.get_many(["a"])
+    assert len(cache) == 0
+    assert cache.get_stats()["expired"] == 1
@@ -0,0 +1,17 @@
+from app_config import EMBEDDING_MODEL
+from embeddings import SharedEmbeddings, dataset_embedding_space
+
+
+def test_int8_vectors_are_their_own_space():
+    torch = SharedEmbeddings(EMBEDDING_MODEL, backend="torch")
+    onnx = SharedEmbeddings(EMBEDDING_MODEL, backend="onnx")
+    int8 = SharedEmbeddings(EMBEDDING_MODEL, backend="onnx-int8")
+
+    assert torch.space == onnx.space == EMBEDDING_MODEL
+    assert int8.space != torch.space
+    assert int8.cache_key("text") != torch.cache_key("text") == onnx.cache_key("text")
+
+
+def test_datasets_without_a_recorded_space_were_embedded_with_torch():
+    assert dataset_embedding_space({"filename": "old.csv"}) == SharedEmbeddings(EMBEDDING_MODEL, backend="torch").space
+    assert dataset_embedding_space({"embedding_space": "m@onnx-int8"}) == "m@onnx-int8"
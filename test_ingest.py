@@ -0,0 +1,82 @@
+import contextlib
+import functools
+import io
+
+import pandas as pd
+import pytest
+
+import ingest
+from processor import attach_row_keys, clean_and_serialize, iter_serialized_batches
+
+
+class _FakeEmbeddings:
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+def _upload(rows):
+    lines = ["User,Project,Start Date,Duration (decimal)"] + [",".join(map(str, row)) for row in rows]
+    upload = io.BytesIO("\n".join(lines).encode("utf-8"))
+    upload.name = "export.csv"
+    return upload
+
+
+def _single_read(rows):
+    """(sentences, metadatas, row keys) of a non-streamed read."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        sentences, metadatas, df = clean_and_serialize(_upload(rows))
+    return sentences, metadatas, attach_row_keys(sentences, metadatas, df)
+
+
+MARCH = [["Ann", "Alpha", f"03/{d:02d}/2024", 2.0] for d in range(1, 21)]
+APRIL = [["Bob", "Beta", f"04/{d:02d}/2024", 3.0] for d in range(1, 11)]
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    import chromadb
+
+    # Several batches per upload
+    monkeypatch.setattr(ingest, "iter_serialized_batches", functools.partial(iter_serialized_batches, chunk_rows=7))
+    monkeypatch.setattr(ingest, "DEDUP_SENTENCES", False)
+    fake = _FakeEmbeddings()
+    monkeypatch.setattr(ingest, "get_embedding_model", lambda: fake)
+    monkeypatch.setattr(ingest, "build_dataset_cube", lambda path: None)
+    monkeypatch.setattr(ingest, "update_registry_entry", lambda entry, username: entry)
+    client = chromadb.PersistentClient(path=str(tmp_path / "store"))
+    monkeypatch.setattr(ingest, "get_client", lambda path: client)
+
+    collection = client.create_collection("data")
+    sentences, metadatas, keys = _single_read(MARCH)
+    collection.add(ids=keys, documents=sentences, metadatas=metadatas, embeddings=[[0.0, 1.0]] * len(keys))
+    pd.DataFrame(MARCH).to_parquet(tmp_path / "data.parquet")
+    entry = {"filename": "march.csv", "db_path": str(tmp_path / "store"), "collection": "data",
+             "snapshot_path": str(tmp_path / "data.parquet"), "hash": "h1"}
+    return entry, collection, fake
+
+
+def test_streamed_upload_finds_the_dataset_it_extends(dataset):
+    _, _, keys = _single_read(MARCH + APRIL)
+    assert ingest.scan_record_ids(_upload(MARCH + APRIL)) == set(keys)
+
+
+def test_streamed_append_embeds_only_new_and_changed_rows(dataset):
+    entry, collection, fake = dataset
+    grown = [list(r) for r in MARCH[1:]] + APRIL
+    grown[0][3] = 5.0  # a changed duration
+    existing = ingest.get_collection_content_hashes(collection)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        updated = ingest.stream_append_into_collection(entry, existing, _upload(grown), "h2", "april.csv", "ann")
+
+    sentences, _, keys = _single_read(grown)
+    stored = collection.get()
+    assert dict(zip(stored["ids"], stored["documents"])) == dict(zip(keys, sentences))
+    assert len(fake.texts) == 1 + len(APRIL)
+    assert updated["row_count"] == len(grown)
+    assert updated["source_hashes"] == ["h2"]
+    assert len(pd.read_parquet(entry["snapshot_path"])) == len(grown)
@@ -0,0 +1,161 @@
+import pandas as pd
+
+from processor import attach_row_keys, diff_records, record_coverage, serialize_rows
+
+
+def _records(rows):
+    df = pd.DataFrame(rows, columns=["user", "project", "date", "hours"])
+    sentences, metadatas = serialize_rows(df, {"person": "user", "project": "project", "date": "date"})
+    keys = attach_row_keys(sentences, metadatas, df)
+    return keys, metadatas
+
+
+MARCH = [["Ann", "Alpha", "March 01, 2024", 2.0], ["Bob", "Beta", "March 15, 2024", 3.0]]
+APRIL = [["Ann", "Alpha", "April 01, 2024", 1.0], ["Bob", "Beta", "April 15, 2024", 4.0]]
+
+
+def test_grown_export_covers_every_stored_row():
+    old_keys, old_meta = _records(MARCH)
+    existing = {k: m["content_hash"] for k, m in zip(old_keys, old_meta)}
+    keys, metadatas = _records(MARCH + APRIL)
+
+    assert record_coverage(existing, keys) == 1.0
+    changed, unchanged, removed = diff_records(existing, keys, metadatas)
+    assert changed == [2, 3]
+    assert unchanged == [0, 1]
+    assert removed == []
+
+
+def test_rolling_export_only_partly_covers_stored_rows():
+    old_keys, old_meta = _records(MARCH + APRIL[:1])
+    existing = {k: m["content_hash"] for k, m in zip(old_keys, old_meta)}
+    keys, _ = _records(MARCH[1:] + APRIL)
+
+    # Half of the stored rows are gone: not a newer version of the same dataset
+    assert record_coverage(existing, keys) < 0.98
+
+
+def test_changed_value_is_reembedded_and_missing_row_removed():
+    old_keys, old_meta = _records(MARCH)
+    existing = {k: m["content_hash"] for k, m in zip(old_keys, old_meta)}
+    keys, metadatas = _records([["Ann", "Alpha", "March 01, 2024", 5.0]])
+
+    changed, unchanged, removed = diff_records(existing, keys, metadatas)
+    assert changed == [0]
+    assert unchanged == []
+    assert removed == [old_keys[1]]
+
+
+def test_empty_dataset_has_no_coverage():
+    keys, _ = _records(MARCH)
+    assert record_coverage({}, keys) == 0.0
+
+
+def test_unsampled_rows_in_another_format_are_not_dropped():
+    from processor import normalize_dataframe
+
+    # Every sampled value is ISO; the last row is day-first
+    dates = ["2024-03-%02d" % d for d in range(1, 29)] * 20 + ["31/03/2024"]
+    df = pd.DataFrame({"date": dates})
+    profile = {"date_formats": {}}
+    normalize_dataframe(df, profile)
+
+    assert df["date"].notna().all()
+    assert df["date"].iloc[-1] == "March 31, 2024"
+
+
+def test_cached_format_is_replaced_when_it_does_not_fit():
+    from processor import normalize_dataframe
+
+    profile = {"date_formats": {"date": "%m/%d/%Y"}}
+    df = pd.DataFrame({"date": ["2024-03-01", "2024-03-31"]})
+    normalize_dataframe(df, profile)
+
+    assert df["date"].tolist() == ["March 01, 2024", "March 31, 2024"]
+    assert profile["date_formats"]["date"] == "%Y-%m-%d"
+
+
+def test_missing_dates_stay_missing():
+    from processor import normalize_dataframe
+
+    df = pd.DataFrame({"date": ["03/01/2024", None, "03/31/2024"]})
+    normalize_dataframe(df, {"date_formats": {}})
+
+    assert df["date"].iloc[0] == "March 01, 2024"
+    assert pd.isna(df["date"].iloc[1])
+
+
+def _normalized_export():
+    import io
+
+    from processor import clean_and_serialize
+
+    csv = (
+        "Project,Client,Description,User,Billable,Start Date,Duration (decimal),Amount\n"
+        "Website : Billable,Acme,Client call,Ann Lee,Yes,03/04/2024,1.5,120\n"
+        "Internal : Non-Billable,,,Bob Roe,No,03/05/2024,0,\n"
+        ",Globex,\"Review; notes\",,Yes,,8.25,99.5\n"
+        "Website : Billable,Acme,Bug fixing,Ann Lee,,03/31/2024,,0\n"
+    )
+    upload = io.BytesIO(csv.encode("utf-8"))
+    upload.name = "export.csv"
+    return clean_and_serialize(upload)
+
+
+def test_columnar_serializer_matches_legacy():
+    from processor import detect_key_columns, serialize_rows_legacy, serialize_rows_parallel
+
+    sentences, metadatas, df = _normalized_export()
+    col_map = detect_key_columns(df.columns)
+    legacy = serialize_rows_legacy(df, col_map)
+
+    assert serialize_rows(df, col_map) == legacy
+    assert (sentences, metadatas) == legacy
+    assert serialize_rows_parallel(df, col_map, workers=1) == legacy
+
+
+def test_parallel_serializer_matches_legacy_across_shards():
+    from processor import detect_key_columns, serialize_rows_legacy, serialize_rows_parallel
+
+    _, _, df = _normalized_export()
+    df = pd.concat([df] * 50, ignore_index=True)
+    col_map = detect_key_columns(df.columns)
+
+    assert serialize_rows_parallel(df, col_map, workers=2, min_rows=40) == serialize_rows_legacy(df, col_map)
+
+
+def _csv_upload(text):
+    import io
+
+    upload = io.BytesIO(text.encode("utf-8"))
+    upload.name = "export.csv"
+    return upload
+
+
+def _streamed_and_single_read(text, chunk_rows):
+    import contextlib
+    import io
+
+    from processor import clean_and_serialize, iter_serialized_batches
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        single, _, _ = clean_and_serialize(_csv_upload(text))
+    streamed = [s for batch, _, _ in iter_serialized_batches(_csv_upload(text), chunk_rows=chunk_rows) for s in batch]
+    return streamed, single
+
+
+def test_streamed_sentences_match_single_read_for_ints_with_na():
+    rows = [f"Ann,Alpha,03/{i % 28 + 1:02d}/2024,{'n/a' if i == 20 else i + 1}" for i in range(30)]
+    streamed, single = _streamed_and_single_read("User,Project,Start Date,Amount\n" + "\n".join(rows), 7)
+
+    assert streamed == single
+    assert streamed[0].endswith("Amount: 1.0")
+
+
+def test_streamed_sentences_match_single_read_for_text_after_numbers():
+    # Ticket ids keep their leading zeros once the column turns out to hold text
+    rows = [f"Ann,Alpha,{'OPS-7' if i == 25 else f'{100 + i:05d}'},1.5" for i in range(30)]
+    streamed, single = _streamed_and_single_read("User,Project,Ticket,Hours\n" + "\n".join(rows), 7)
+
+    assert streamed == single
+    assert "Ticket: 00100;" in streamed[0]
@@ -0,0 +1,50 @@
+import datetime as dt
+
+import pandas as pd
+
+from dataset_views import DatasetView
+from query_planner import execute_plan
+
+
+def test_billable_project_list_uses_the_dedicated_column():
+    df = pd.DataFrame({
+        "user": ["Ann", "Bob", "Cid"],
+        "project": ["Alpha", "Beta", "Core"],
+        "is_billable": ["Yes", "No", "Yes"],
+        "hours": [1.0, 2.0, 3.0],
+    })
+    plan = {"action": "aggregate", "aggregate": {"func": "list", "column": "project"}, "filters": {"billable": "Yes"}}
+    answer = execute_plan(DatasetView(df), plan)
+
+    # Answered by the billable report helper, not the generic fallback
+    assert "### Billable Projects (2)" in answer
+    assert "Alpha" in answer and "Core" in answer
+    assert "Beta" not in answer
+
+
+def _hours(dates):
+    return DatasetView(pd.DataFrame({
+        "user": ["Ann"] * len(dates),
+        "start_date": dates,
+        "hours": [float(i + 1) for i in range(len(dates))],
+    }))
+
+
+def test_month_without_year_is_resolved_against_the_dataset():
+    from query_planner import parse_date_range
+
+    date_range, _ = parse_date_range("total hours in march", today=dt.date(2026, 10, 16))
+    plan = {"action": "aggregate", "date_range": date_range, "aggregate": {"func": "sum", "column": "hours"}}
+    answer = execute_plan(_hours(["February 27, 2019", "March 05, 2019", "March 29, 2019", "April 02, 2019"]), plan)
+
+    assert "No data found" not in answer
+    assert "**5.00**" in answer  # 2 + 3
+
+
+def test_month_in_several_years_asks_for_the_year():
+    plan = {"action": "aggregate", "date_range": {"month": 3, "label": "in march"},
+            "aggregate": {"func": "sum", "column": "hours"}}
+    answer = execute_plan(_hours(["March 05, 2023", "March 05, 2024"]), plan)
+
+    assert "2023, 2024" in answer
+    assert "March 2024" in answer
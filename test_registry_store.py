@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+import registry_store
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.setattr(registry_store, "REGISTRY_DB_PATH", str(tmp_path / "registry.sqlite"))
+    monkeypatch.setattr(registry_store, "_conn", None)
+    monkeypatch.setattr(registry_store, "_checked_profile_users", set())
+    monkeypatch.setattr(registry_store, "get_user_storage_paths",
+                        lambda username: {"schema_file": str(tmp_path / f"{username}_schema_profiles.json")})
+    yield tmp_path
+    registry_store._conn.close()
+
+
+def test_concurrent_ingests_keep_each_others_profiles(store):
+    # Both ingests loaded the profiles before either saved
+    first = registry_store.get_schema_profiles("ann")
+    second = registry_store.get_schema_profiles("ann")
+    first["a"] = {"fingerprint": "a", "date_formats": {"date": "%Y-%m-%d"}}
+    second["b"] = {"fingerprint": "b", "date_formats": {"day": "%d/%m/%Y"}}
+    registry_store.save_schema_profiles("ann", first)
+    registry_store.save_schema_profiles("ann", second)
+
+    assert set(registry_store.get_schema_profiles("ann")) == {"a", "b"}
+    assert registry_store.get_schema_profiles("bob") == {}
+
+
+def test_saved_formats_merge_per_column(store):
+    registry_store.save_schema_profiles("ann", {"a": {"fingerprint": "a", "date_formats": {"start": "%Y-%m-%d"}}})
+    registry_store.save_schema_profiles("ann", {"a": {"fingerprint": "a", "date_formats": {"end": "%m/%d/%Y"}}})
+
+    assert registry_store.get_schema_profiles("ann")["a"]["date_formats"] == {"start": "%Y-%m-%d", "end": "%m/%d/%Y"}
+    registry_store.delete_schema_profiles("ann")
+    assert registry_store.get_schema_profiles("ann") == {}
+
+
+def test_json_profiles_are_imported_once(store):
+    schema_file = store / "ann_schema_profiles.json"
+    schema_file.write_text(json.dumps({"a": {"fingerprint": "a", "date_formats": {"date": None}}}))
+
+    assert registry_store.get_schema_profiles("ann") == {"a": {"fingerprint": "a", "date_formats": {"date": None}}}
+    assert not schema_file.exists()
+    assert (store / "ann_schema_profiles.json.migrated").exists()
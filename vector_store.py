@@ -0,0 +1,244 @@
+"""
+Shared Chroma client handles and the vector store layout.
+
+Opening a chromadb.PersistentClient is expensive (SQLite + HNSW segment
+loading), so clients are opened once per path and shared by ingest and
+retrieval across Streamlit sessions. close_client() releases a path's handles
+explicitly so its directory can be deleted safely.
+
+With STORAGE_MODE "user" or "node" every dataset is a collection (named after
+its hash) inside one persistent store, and Chroma only loads the segments of
+collections that are actually queried. Registry entries record the store in
+"db_path" and the collection in "collection"; entries without "collection"
+are legacy per-upload stores holding a single "employee_kb" collection.
+Run `python vector_store.py migrate --all` to move those into the shared store.
+
+`python vector_store.py clear-caches` empties the node-wide embedding and
+intent caches (an admin action; a user's factory reset leaves them alone).
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import threading
+
+import chromadb
+
+from app_config import STORAGE_MODE, SHARED_STORE_DIR, BASE_METADATA_DIR, get_user_storage_paths
+
+LEGACY_COLLECTION = "employee_kb"
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(path: str):
+    """Open (or reuse) the persistent Chroma client for `path`."""
+    with _clients_lock:
+        client = _clients.get(path)
+        if client is None:
+            client = chromadb.PersistentClient(
+                path=path,
+                settings=chromadb.config.Settings(
+                    anonymized_telemetry=False,
+                    is_persistent=True
+                )
+            )
+            _clients[path] = client
+        return client
+
+def close_client(path: str):
+    """Stop the client for `path` and drop chromadb's own per-path system cache."""
+    with _clients_lock:
+        client = _clients.pop(path, None)
+    _release(client, path)
+
+def close_all_clients():
+    with _clients_lock:
+        clients = list(_clients.items())
+        _clients.clear()
+    for path, client in clients:
+        _release(client, path)
+
+def is_within(path: str, root: str) -> bool:
+    """Whether `path` is `root` or lies inside it."""
+    return os.path.join(os.path.abspath(path), "").startswith(os.path.join(os.path.abspath(root), ""))
+
+def close_clients_under(root: str):
+    """Stop every client whose store lies in `root` (one user's directory); others stay open."""
+    with _clients_lock:
+        clients = [(p, _clients.pop(p)) for p in [p for p in _clients if is_within(p, root)]]
+    for path, client in clients:
+        _release(client, path)
+
+def _release(client, path):
+    # chromadb keeps one System per path in SharedSystemClient; stop it and
+    # forget it so file handles are closed and a later open starts fresh.
+    system = getattr(client, "_system", None) if client is not None else None
+    try:
+        from chromadb.api.client import SharedSystemClient
+        cached = getattr(SharedSystemClient, "_identifer_to_system", {})
+        system = cached.pop(path, None) or system
+    except Exception:
+        pass
+    if system is not None:
+        try:
+            system.stop()
+        except Exception as e:
+            print(f"Warning: could not stop Chroma system for {path}: {e}")
+
+def get_store_path(username) -> str:
+    """Persistent store new datasets of `username` are written to (shared modes only)."""
+    if STORAGE_MODE == "node":
+        return SHARED_STORE_DIR
+    return os.path.join(get_user_storage_paths(username)["vector_db"], "store")
+
+def collection_name_for(dataset_hash: str, username) -> str:
+    """Collection name of a dataset in the shared store (node stores are namespaced per user)."""
+    if STORAGE_MODE == "node":
+        user_safe = os.path.basename(get_user_storage_paths(username)["metadata"])
+        return "ds_" + hashlib.md5(f"{user_safe}\x1f{dataset_hash}".encode("utf-8")).hexdigest()
+    return f"ds_{dataset_hash}"
+
+def get_collection_name(entry: dict) -> str:
+    return entry.get("collection") or LEGACY_COLLECTION
+
+def drop_collection(path: str, name: str) -> bool:
+    """Delete one collection from a store; False if it did not exist."""
+    try:
+        get_client(path).delete_collection(name)
+        return True
+    except Exception:
+        return False
+
+def delete_dataset_vectors(entry: dict):
+    """
+    Remove a dataset's vectors: drop its collection from a shared store, or
+    delete its own directory (legacy per-upload store or quantized store).
+    """
+    db_path = entry["db_path"]
+    if entry.get("vector_quantization"):
+        # QuantizedVectorStore directory: plain files, no Chroma handles
+        shutil.rmtree(db_path, ignore_errors=True)
+        return
+    if entry.get("collection"):
+        if os.path.exists(db_path):
+            drop_collection(db_path, entry["collection"])
+        return
+    close_client(db_path)
+    if os.path.exists(db_path):
+        shutil.rmtree(db_path, ignore_errors=True)
+
+def _copy_collection(source, target, page_size=5000) -> int:
+    """Copy ids, documents, metadatas and stored vectors page by page (no re-embedding)."""
+    copied = 0
+    offset = 0
+    while True:
+        page = source.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        ids = page.get("ids") or []
+        if ids:
+            vectors = page["embeddings"]
+            target.add(
+                ids=ids,
+                embeddings=vectors.tolist() if hasattr(vectors, "tolist") else [list(v) for v in vectors],
+                documents=page["documents"],
+                metadatas=page["metadatas"],
+            )
+            copied += len(ids)
+        if len(ids) < page_size:
+            return copied
+        offset += page_size
+
+def migrate_to_shared_store(username, remove_old=True) -> int:
+    """
+    Move a user's legacy per-upload stores into the shared store, one collection
+    per dataset, and update their registry entries. Returns the number migrated.
+    """
+    from app_config import get_dataset_registry, update_registry_entry
+
+    if STORAGE_MODE == "isolated":
+        raise ValueError("STORAGE_MODE is 'isolated'; set it to 'user' or 'node' before migrating")
+
+    store_path = get_store_path(username)
+    os.makedirs(store_path, exist_ok=True)
+    migrated = 0
+    for entry in get_dataset_registry(username)["datasets"]:
+        old_path = entry.get("db_path")
+        if entry.get("collection") or entry.get("vector_quantization") or not old_path or not os.path.exists(old_path):
+            continue
+        name = collection_name_for(entry["hash"], username)
+        target_client = get_client(store_path)
+        try:
+            source = get_client(old_path).get_collection(LEGACY_COLLECTION)
+            # Start clean if an earlier migration attempt stopped halfway
+            drop_collection(store_path, name)
+            target = target_client.create_collection(name, metadata=source.metadata)
+            copied = _copy_collection(source, target)
+        except Exception as e:
+            print(f"❌ Could not migrate {entry['filename']}: {e}")
+            continue
+
+        updated = dict(entry)
+        updated["db_path"] = store_path
+        updated["collection"] = name
+        update_registry_entry(updated, username)
+        close_client(old_path)
+        if remove_old:
+            shutil.rmtree(old_path, ignore_errors=True)
+        migrated += 1
+        print(f"✅ Migrated {entry['filename']} ({copied:,} vectors) -> {name}")
+    return migrated
+
+def _registered_users():
+    from registry_store import list_usernames
+    users = set(list_usernames())
+    # Users whose JSON registry has not been imported into SQLite yet
+    if os.path.isdir(BASE_METADATA_DIR):
+        users.update(
+            name for name in os.listdir(BASE_METADATA_DIR)
+            if os.path.isfile(os.path.join(BASE_METADATA_DIR, name, "dataset_hash.json"))
+        )
+    return sorted(users)
+
+def clear_shared_caches(embeddings: bool = True, intents: bool = True):
+    """
+    Empty the caches every user shares: embedding vectors and classified intents.
+    Running app processes keep their in-memory counters but read the emptied files.
+    """
+    if embeddings:
+        from embeddings import clear_embedding_cache
+        clear_embedding_cache()
+        print("Cleared the embedding cache")
+    if intents:
+        from intent_cache import clear_intent_cache
+        clear_intent_cache()
+        print("Cleared the intent cache")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vector store maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("migrate", help="move per-upload stores into the shared store")
+    target = p.add_mutually_exclusive_group(required=True)
+    target.add_argument("--user", help="username whose datasets to migrate")
+    target.add_argument("--all", action="store_true", help="migrate every user with a registry")
+    p.add_argument("--keep-old", action="store_true", help="keep the old store directories")
+    p = sub.add_parser("clear-caches", help="empty the node-wide embedding and intent caches")
+    p.add_argument("--embeddings", action="store_true", help="only the embedding cache")
+    p.add_argument("--intents", action="store_true", help="only the intent cache")
+    args = parser.parse_args()
+
+    if args.command == "clear-caches":
+        clear_shared_caches(embeddings=args.embeddings or not args.intents,
+                            intents=args.intents or not args.embeddings)
+        return
+
+    users = _registered_users() if args.all else [args.user]
+    total = 0
+    for username in users:
+        total += migrate_to_shared_store(username, remove_old=not args.keep_old)
+    print(f"Migrated {total} dataset(s) for {len(users)} user(s)")
+
+
+if __name__ == "__main__":
+    main()